@@ -0,0 +1,82 @@
+import argparse
+import torch
+
+from projects.SkillMimicLab.skillmimic.utils import torch_utils
+from projects.SkillMimicLab.skillmimic.utils.step_capture import StepCapture
+from projects.SkillMimicLab.skillmimic.benchmarks.common import ChainState, load_reward_weights, timeit, use_isaac_lab_stand_in
+
+use_isaac_lab_stand_in()
+from env.tasks.humanoid_task import compute_humanoid_observations
+from env.tasks.humanoid_object_task import compute_obj_observations
+from env.tasks.skillmimic import build_hoi_observations, compute_humanoid_reward
+
+# Times the SkillMimicBallPlay post-physics chain with and without capturedStep, e.g.
+#   python -m projects.SkillMimicLab.skillmimic.benchmarks.captured_step --cfg_env skillmimic/data/cfg/skillmimic.yaml --device cuda:0
+# "eager" runs the chain op by op, "captured" replays it through StepCapture (a CUDA graph on GPU, a compiled
+# graph on CPU) after the warmup steps. Both run on copies of the same state, the last column compares them.
+
+parser = argparse.ArgumentParser()
+parser.add_argument("--cfg_env", type=str, required=True, help="Environment configuration file (.yaml), for the reward weights")
+parser.add_argument("--num_envs", type=int, nargs='+', default=[1024, 4096, 16384])
+parser.add_argument("--device", type=str, default='cpu')
+parser.add_argument("--num_bodies", type=int, default=53)
+parser.add_argument("--num_key_bodies", type=int, default=6)
+parser.add_argument("--num_contact_bodies", type=int, default=10)
+parser.add_argument("--steps", type=int, default=20)
+args = parser.parse_args()
+
+
+def chain_step(s):
+    # the post_physics_step of SkillMimicBallPlay on the ChainState s, up to the advance of the history
+    key_body_pos = s.body_pos[:, s.key_body_ids, :]
+    build_hoi_observations(s.body_pos[:, 0, :], s.body_rot[:, 0, :], s.body_vel[:, 0, :],
+                           s.body_ang_vel[:, 0, :], s.dof_pos, s.dof_vel, key_body_pos,
+                           True, True, 0, s.target_states, s.hoi_obs_hist.previous, s.progress_buf,
+                           s.hoi_offsets, s.hoi_obs_hist.current)
+    s.progress_buf += 1
+    s.heading_rot_inv[:] = torch_utils.calc_heading_frame(s.body_rot[:, 0])[1]
+    compute_humanoid_observations(*s.body_states(), s.heading_rot_inv, True, True, s.contact_forces, s.contact_body_ids,
+                                  s.obs_layout.view(s.obs_buf, "humanoid"))
+    compute_obj_observations(s.body_pos[:, 0], s.heading_rot_inv, s.target_states, s.obs_layout.view(s.obs_buf, "obj"))
+    s.rew_buf[:] = compute_humanoid_reward(*s.reward_inputs())
+    return
+
+
+class CapturedChain:
+    # one recording per position of the history ring, as HumanoidWholeBody._run_captured keeps them
+
+    def __init__(self, state):
+        self.state = state
+        self.captures = {}
+        return
+
+    def __call__(self):
+        head = self.state.hoi_obs_hist.head
+        if (head not in self.captures):
+            self.captures[head] = StepCapture(lambda: chain_step(self.state), self.state, args.device, f"post_physics/{head}")
+        self.captures[head]()
+        self.state.hoi_obs_hist.advance()
+        return
+
+
+def eager_step(state):
+    chain_step(state)
+    state.hoi_obs_hist.advance()
+    return
+
+
+torch.manual_seed(0)
+reward_weights = load_reward_weights(args.cfg_env)
+print(f'{"num_envs":>9} {"eager ms":>9} {"captured ms":>12} {"speedup":>8}  {"max abs diff":>13}')
+for num_envs in args.num_envs:
+    eager = ChainState(num_envs, args.device, reward_weights, args.num_bodies, args.num_key_bodies, args.num_contact_bodies)
+    captured = eager.copy()
+    chain = CapturedChain(captured)
+
+    # the warmup includes the recording / compilation for both positions of the history ring
+    eager_time = timeit(lambda: eager_step(eager), args.device, args.steps, warmup=10)
+    captured_time = timeit(chain, args.device, args.steps, warmup=10)
+    assert all(c.captured for c in chain.captures.values()), [c.fallback_reason for c in chain.captures.values()]
+    max_diff = max((a - b).abs().max().item() for a, b in [(eager.obs_buf, captured.obs_buf), (eager.rew_buf, captured.rew_buf),
+                                                          (eager.hoi_obs_hist.previous, captured.hoi_obs_hist.previous)])
+    print(f'{num_envs:>9} {eager_time*1e3:>9.3f} {captured_time*1e3:>12.3f} {eager_time/captured_time:>7.2f}x  {max_diff:>13.2e}')
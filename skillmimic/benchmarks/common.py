@@ -0,0 +1,153 @@
+import copy
+import importlib.abc
+import importlib.machinery
+import sys
+import time
+import types
+import yaml
+import torch
+
+from projects.SkillMimicLab.skillmimic.utils import torch_utils
+from projects.SkillMimicLab.skillmimic.utils.obs_layout import ObsLayout, OBJ_OBS_SIZE, humanoid_obs_size
+from projects.SkillMimicLab.skillmimic.utils.obs_history import ObsHistory
+from projects.SkillMimicLab.skillmimic.utils.metrics import BODY_CONTACT_IDS
+from projects.SkillMimicLab.skillmimic.utils.hoi_layout import build_hoi_layout
+from projects.SkillMimicLab.skillmimic.utils.motion_data_handler import REWARD_TERMS
+
+# Helpers of the benchmarks: device sync and timing, the env cfg, the buffers of the SkillMimicBallPlay
+# post-physics chain and the Isaac Lab stand-in the task modules import with.
+
+
+def sync(device):
+    if torch.device(device).type == 'cuda':
+        torch.cuda.synchronize(device)
+    return
+
+
+def timeit(fn, device, steps, warmup=3, setup=None):
+    # mean seconds per fn() over steps calls, after warmup calls. With setup, every call is fn(setup()) and is
+    # timed on its own, so setup(), e.g. a copy of the inputs fn modifies, is left out
+    for _ in range(warmup):
+        if (setup is None):
+            fn()
+        else:
+            fn(setup())
+    sync(device)
+    if (setup is None):
+        start = time.perf_counter()
+        for _ in range(steps):
+            fn()
+        sync(device)
+        return (time.perf_counter() - start) / steps
+
+    total = 0.
+    for _ in range(steps):
+        inputs = setup()
+        sync(device)
+        start = time.perf_counter()
+        fn(inputs)
+        sync(device)
+        total += time.perf_counter() - start
+    return total / steps
+
+
+def load_cfg_env(cfg_env):
+    with open(cfg_env, 'r') as f:
+        return yaml.load(f, Loader=yaml.SafeLoader)
+
+
+def load_reward_weights(cfg_env):
+    # env.rewardWeights of the yaml cfg, the weights of the regular clips in MotionDataHandler
+    weights = load_cfg_env(cfg_env)["env"]["rewardWeights"]
+    return {k: float(weights[k]) for k in REWARD_TERMS}
+
+
+class ChainState:
+    # the buffers the SkillMimicBallPlay post-physics chain (build_hoi_observations, the observation builders and
+    # compute_humanoid_reward) reads and writes, with random states: the simulated HOI frames are close to the
+    # reference and few bodies touch anything, as in a rollout of a trained policy
+
+    def __init__(self, num_envs, device, reward_weights=None, num_bodies=53, num_key_bodies=6, num_contact_bodies=10):
+        shape = (num_envs, num_bodies)
+        self.body_pos = torch.randn(shape + (3,), device=device)
+        self.body_rot = torch_utils.quat_from_angle_axis(torch.rand(shape, device=device) * 6.28,
+                                                         torch.nn.functional.normalize(torch.randn(shape + (3,), device=device), dim=-1))
+        self.body_vel = torch.randn(shape + (3,), device=device)
+        self.body_ang_vel = torch.randn(shape + (3,), device=device)
+        self.root_states = torch.cat([self.body_pos[:, 0], self.body_rot[:, 0], torch.randn((num_envs, 6), device=device)], dim=-1)
+        self.dof_pos = torch.randn((num_envs, (num_bodies - 1) * 3), device=device)
+        self.dof_vel = torch.randn((num_envs, (num_bodies - 1) * 3), device=device)
+        self.contact_forces = (torch.rand(shape + (3,), device=device) < 0.05).float()
+        self.contact_body_ids = torch.arange(num_contact_bodies, device=device) * (num_bodies // num_contact_bodies)
+        self.body_contact_ids = torch.tensor(BODY_CONTACT_IDS, device=device, dtype=torch.long)
+        self.key_body_ids = torch.arange(num_key_bodies, device=device) + 1
+        self.target_states = torch.cat([torch.randn((num_envs, 3), device=device), self.body_rot[:, 1],
+                                        torch.randn((num_envs, 6), device=device)], dim=-1)
+        self.tar_contact_forces = (torch.rand((num_envs, 3), device=device) < 0.5).float()
+        self.progress_buf = torch.zeros(num_envs, device=device, dtype=torch.long)
+
+        hoi_layout = build_hoi_layout((num_bodies - 1) * 3, num_key_bodies)
+        self.hoi_offsets = hoi_layout.offsets()
+        self.curr_ref_obs = torch.randn((num_envs, hoi_layout.size), device=device)
+        self.hoi_obs_hist = ObsHistory(num_envs, hoi_layout.size, device=device)
+        for k in range(self.hoi_obs_hist.length):
+            self.hoi_obs_hist.history(k)[:] = self.curr_ref_obs + torch.randn_like(self.curr_ref_obs) * 0.05
+        self.heading_rot_inv = torch.zeros((num_envs, 4), device=device)
+
+        self.obs_layout = ObsLayout()
+        self.obs_layout.add("humanoid", humanoid_obs_size(num_bodies, num_contact_bodies))
+        self.obs_layout.add("obj", OBJ_OBS_SIZE)
+        self.obs_buf = torch.zeros((num_envs, self.obs_layout.size), device=device)
+        self.rew_buf = torch.zeros(num_envs, device=device)
+        self.w = {k: torch.full((num_envs,), v, device=device) for k, v in (reward_weights or {}).items()}
+        return
+
+    def copy(self):
+        other = ChainState.__new__(ChainState)
+        other.__dict__.update({k: (v.clone() if isinstance(v, torch.Tensor) else copy.deepcopy(v)) for k, v in self.__dict__.items()})
+        return other
+
+    def body_states(self):
+        return self.body_pos, self.body_rot, self.body_vel, self.body_ang_vel
+
+    def reward_inputs(self):
+        # the arguments of compute_humanoid_reward
+        return (self.curr_ref_obs, self.hoi_obs_hist.current, self.hoi_obs_hist.previous, self.contact_forces,
+                self.body_contact_ids, self.tar_contact_forces, self.hoi_offsets, self.w)
+
+
+class IsaacLabStandIn(importlib.abc.MetaPathFinder, importlib.abc.Loader):
+    # the Isaac Lab modules, and the env cfg module built on them, as empty packages whose every name is an empty
+    # class. Isaac Lab only imports with a running Isaac Sim, while the task modules only take names from it at
+    # their top and subclass DirectRLEnv, whose __init__ BaseTask skips on the kinematic backend. So the kernels,
+    # and the tasks on the kinematic backend, run without Isaac Sim, see use_isaac_lab_stand_in
+    MODULES = ("omni", "projects.SkillMimicLab.skillmimic.data.cfg.skillmimic_cfg")
+
+    def find_spec(self, fullname, path, target=None):
+        stand_in = any(fullname == m or fullname.startswith(m + ".") for m in self.MODULES)
+        # the packages of the cfg module, when the tree has none
+        if (not stand_in and any(m.startswith(fullname + ".") for m in self.MODULES)):
+            stand_in = importlib.machinery.PathFinder.find_spec(fullname, path) is None
+        if (not stand_in):
+            return None
+        return importlib.machinery.ModuleSpec(fullname, self, is_package=True)
+
+    def create_module(self, spec):
+        module = types.ModuleType(spec.name)
+
+        def getattr_(name):
+            if (name.startswith("__")):
+                raise AttributeError(name)
+            return type(name, (), {})
+        module.__getattr__ = getattr_
+        return module
+
+    def exec_module(self, module):
+        return
+
+
+def use_isaac_lab_stand_in():
+    # call before the first import of env.tasks
+    if (not any(isinstance(finder, IsaacLabStandIn) for finder in sys.meta_path)):
+        sys.meta_path.insert(0, IsaacLabStandIn())
+    return
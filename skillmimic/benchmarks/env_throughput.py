@@ -0,0 +1,251 @@
+import copy
+import importlib
+import json
+import multiprocessing
+import os
+import resource
+import time
+import torch
+
+from projects.SkillMimicLab.skillmimic.utils.config import get_args
+from projects.SkillMimicLab.skillmimic.benchmarks.common import sync, use_isaac_lab_stand_in
+
+# End-to-end environment throughput: builds each task, steps it with random or policy actions and reports env
+# steps/s, per-phase latency, peak memory and reset rate for every --bench_len window of --bench_window steps, e.g.
+#   python -m projects.SkillMimicLab.skillmimic.benchmarks.env_throughput --task SkillMimicBallPlay \
+#       --cfg_env skillmimic/data/cfg/skillmimic.yaml --cfg_train skillmimic/data/cfg/train/rlg/skillmimic.yaml \
+#       --motion_file skillmimic/data/motions/BallPlay-M/layup --bench_num_envs 1024 4096 16384 --random_actions \
+#       --bench_file output/bench/ballplay.json
+# The tasks run on the kinematic stand-in (--physics_backend kinematic) unless told otherwise, so the numbers
+# measure the Python hot path and compare across machines. Those tasks are built from --cfg_env on --device
+# without Isaac Sim; the Isaac Lab backend starts the app (AppLauncher arguments) and builds them through
+# parse_task. With --num_proc N, N processes run the same sweep at
+# the same time and the report adds their throughputs up.
+# Without --random_actions the actions come from the actor MLP of --cfg_train, with the weights of --checkpoint
+# when one is given (rl_games layout, observation normalization left out), so inference is part of the step.
+# With --env_groups G, every num_envs is split into G task instances stepped by VecTaskGroups, which overlaps the
+# policy of one group with the steps of the others; the report has the throughput of the pipelined rollout and
+# the staleness of the observations instead of the per-phase times. --env_groups_deterministic runs the same
+# schedule without the overlap. Env groups need the kinematic backend, see VecTaskGroups.
+
+PHASES = ["policy", "pre_physics", "physics", "post_physics", "reset"]
+
+TASK_MODULES = {"SkillMimicBallPlay": "env.tasks.skillmimic", "HRLCircling": "env.tasks.hrl_circling",
+                "HRLHeadingEasy": "env.tasks.hrl_heading_easy", "HRLThrowing": "env.tasks.hrl_throwing",
+                "HRLScoringLayup": "env.tasks.hrl_scoring_layup"}
+
+simulation_app = None
+
+
+def launch_app(args):
+    # the Isaac Lab backend needs the app running before its modules import, once per process
+    global simulation_app
+    if (simulation_app is None):
+        from omni.isaac.lab.app import AppLauncher
+        simulation_app = AppLauncher(args).app
+    return
+
+
+def build_task(args):
+    from projects.SkillMimicLab.skillmimic.utils.config import load_cfg
+    cfg, cfg_train, _ = load_cfg(args)
+    if (args.physics_backend == "kinematic"):
+        # no app and no gym registry, the task class is built directly on the Isaac Lab stand-in
+        use_isaac_lab_stand_in()
+        task = getattr(importlib.import_module(TASK_MODULES[args.task]), args.task)(cfg)
+    else:
+        launch_app(args)
+        from projects.SkillMimicLab.skillmimic.utils.parse_task import parse_task
+        task, _ = parse_task(args, cfg, cfg_train)
+    return task, cfg_train
+
+
+def build_policy(args, task, cfg_train):
+    if args.random_actions:
+        return lambda obs: torch.rand((obs.shape[0], task.num_actions), device=task.device) * 2 - 1
+
+    network = cfg_train["params"]["network"]
+    activation = {"relu": torch.nn.ReLU, "elu": torch.nn.ELU, "tanh": torch.nn.Tanh}[network["mlp"].get("activation", "relu")]
+    layers = []
+    size = task.num_obs
+    for units in network["mlp"]["units"]:
+        layers += [torch.nn.Linear(size, units), activation()]
+        size = units
+    actor_mlp = torch.nn.Sequential(*layers)
+    mu = torch.nn.Linear(size, task.num_actions)
+    if (args.checkpoint != "Base"):
+        weights = torch.load(args.checkpoint, map_location='cpu')['model']
+        actor_mlp.load_state_dict({k[len('a2c_network.actor_mlp.'):]: v for k, v in weights.items() if k.startswith('a2c_network.actor_mlp.')})
+        mu.load_state_dict({k[len('a2c_network.mu.'):]: v for k, v in weights.items() if k.startswith('a2c_network.mu.')})
+    model = torch.nn.Sequential(actor_mlp, mu).to(task.device).eval()
+
+    def policy(obs):
+        with torch.no_grad():
+            return torch.clamp(model(obs), -1., 1.)
+    return policy
+
+
+def peak_memory_mb(device):
+    if torch.device(device).type == 'cuda':
+        return torch.cuda.max_memory_allocated(device) / 2**20
+    # maximum resident set size of the process, in KB on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 2**10
+
+
+def run_benchmark(args, task_name, num_envs):
+    args = copy.copy(args)
+    args.task = task_name
+    args.num_envs = num_envs
+    task, cfg_train = build_task(args)
+    policy = build_policy(args, task, cfg_train)
+    device = task.device
+
+    def phase(times, name, fn):
+        sync(device)
+        start = time.perf_counter()
+        out = fn()
+        sync(device)
+        times[name] += time.perf_counter() - start
+        return out
+
+    task.reset()
+    obs = task.obs_buf
+    windows = []
+    for window in range(args.bench_len + 1):
+        times = dict.fromkeys(PHASES, 0.)
+        num_resets = 0
+        for _ in range(args.bench_window):
+            # the phases of BaseTask.step, timed one by one
+            actions = phase(times, "policy", lambda: policy(obs))
+            phase(times, "pre_physics", lambda: task.pre_physics_step(actions))
+            phase(times, "physics", task._physics_step)
+            phase(times, "post_physics", task.post_physics_step)
+            env_ids = phase(times, "reset", lambda: task.reset_buf.nonzero(as_tuple=False).flatten())
+            num_resets += len(env_ids)
+            if len(env_ids) > 0:
+                phase(times, "reset", lambda: task.reset(env_ids))
+            obs = task.obs_buf
+        if (window == 0):
+            # warmup, includes the TorchScript and allocator warmup
+            continue
+
+        step_time = sum(times.values()) / args.bench_window
+        windows.append({"env_steps_per_s": num_envs / step_time,
+                        "step_ms": step_time * 1e3,
+                        "phase_ms": {k: v / args.bench_window * 1e3 for k, v in times.items()},
+                        "reset_rate": num_resets / (num_envs * args.bench_window),
+                        "peak_memory_mb": peak_memory_mb(device)})
+        print(f'[{os.getpid()}] {task_name} {num_envs} envs, window {window}/{args.bench_len}: '
+              f'{windows[-1]["env_steps_per_s"]:.0f} env steps/s, {windows[-1]["step_ms"]:.2f} ms/step')
+
+    summary = {k: sum(w[k] for w in windows) / len(windows) for k in ["env_steps_per_s", "step_ms", "reset_rate"]}
+    summary["phase_ms"] = {p: sum(w["phase_ms"][p] for w in windows) / len(windows) for p in PHASES}
+    summary["peak_memory_mb"] = max(w["peak_memory_mb"] for w in windows)
+    return {"task": task_name, "num_envs": num_envs, "device": str(device), "windows": windows, "summary": summary}
+
+
+def run_groups_benchmark(args, task_name, num_envs):
+    from env.tasks.vec_task_groups import VecTaskGroups
+    if (args.physics_backend != "kinematic"):
+        # checked before building the tasks, the second Isaac Lab task would fail deep inside DirectRLEnv
+        raise ValueError(f"--env_groups needs --physics_backend kinematic, got {args.physics_backend}: "
+                         "Isaac Lab runs a single SimulationContext per process")
+    args = copy.copy(args)
+    args.task = task_name
+    args.num_envs = num_envs // args.env_groups
+    tasks = []
+    for _ in range(args.env_groups):
+        task, cfg_train = build_task(args)
+        tasks.append(task)
+    policy = build_policy(args, tasks[0], cfg_train)
+    device = tasks[0].device
+    env = VecTaskGroups(tasks, device, cfg_train.get("clip_observations", float('inf')), cfg_train.get("clip_actions", 1.0),
+                        deterministic=args.env_groups_deterministic)
+
+    env.reset()
+    windows = []
+    for window in range(args.bench_len + 1):
+        env.reset_stats()
+        stats = env.rollout(policy, args.bench_window)
+        if (window == 0):
+            continue
+        windows.append(dict(stats, peak_memory_mb=peak_memory_mb(device)))
+        print(f'[{os.getpid()}] {task_name} {env.num_envs} envs in {args.env_groups} groups, window {window}/{args.bench_len}: '
+              f'{stats["env_steps_per_s"]:.0f} env steps/s, {stats["staleness_ms"]:.2f} ms staleness')
+    env.close()
+
+    summary = {k: sum(w[k] for w in windows) / len(windows) for k in ["env_steps_per_s", "step_ms", "wait_ms", "staleness_ms", "reset_rate"]}
+    summary["staleness_max_ms"] = max(w["staleness_max_ms"] for w in windows)
+    summary["peak_memory_mb"] = max(w["peak_memory_mb"] for w in windows)
+    return {"task": task_name, "num_envs": env.num_envs, "device": str(device), "env_groups": args.env_groups,
+            "deterministic": args.env_groups_deterministic, "windows": windows, "summary": summary}
+
+
+def run_sweep(args, proc_id=0, results=None):
+    runs = []
+    if (args.num_proc > 1):
+        # share the cores between the processes
+        torch.set_num_threads(max(1, os.cpu_count() // args.num_proc))
+    for task_name in (args.bench_tasks or [args.task]):
+        for num_envs in args.bench_num_envs:
+            run = run_groups_benchmark if args.env_groups > 1 else run_benchmark
+            runs.append(dict(run(args, task_name, num_envs), proc=proc_id))
+    if (results is not None):
+        results.put(runs)
+    return runs
+
+
+def merge_procs(proc_runs):
+    # one entry per task and num_envs: the summed throughput of the processes that ran it side by side
+    merged = []
+    for runs in zip(*proc_runs):
+        summaries = [r["summary"] for r in runs]
+        merged.append({"task": runs[0]["task"], "num_envs": runs[0]["num_envs"], "num_proc": len(runs),
+                       "env_steps_per_s": sum(s["env_steps_per_s"] for s in summaries),
+                       "step_ms": max(s["step_ms"] for s in summaries),
+                       "reset_rate": sum(s["reset_rate"] for s in summaries) / len(runs),
+                       "peak_memory_mb": sum(s["peak_memory_mb"] for s in summaries)})
+    return merged
+
+
+if __name__ == "__main__":
+    parser = get_args(benchmark=True)
+    parser.add_argument("--bench_num_envs", type=int, nargs='+', default=[1024, 4096, 16384])
+    parser.add_argument("--bench_tasks", type=str, nargs='+', default=None, help="Tasks to sweep, defaults to --task")
+    parser.add_argument("--bench_window", type=int, default=100, help="Env steps per timing report")
+    parser.add_argument("--env_groups", type=int, default=1, help="Env groups stepped in a pipeline, see VecTaskGroups")
+    parser.add_argument("--env_groups_deterministic", action="store_true", help="Step the env groups inline, in order")
+    parser.set_defaults(physics_backend="kinematic")
+    if (parser.parse_known_args()[0].physics_backend == "kinematic"):
+        parser.add_argument("--device", type=str, default='cpu', help="Device of the kinematic tasks")
+    else:
+        from omni.isaac.lab.app import AppLauncher
+        AppLauncher.add_app_launcher_args(parser)
+    args = parser.parse_args()
+
+    if (args.num_proc > 1):
+        context = multiprocessing.get_context('spawn')
+        results = context.Queue()
+        procs = [context.Process(target=run_sweep, args=(args, i, results)) for i in range(args.num_proc)]
+        for p in procs:
+            p.start()
+        proc_runs = [results.get() for _ in procs]
+        for p in procs:
+            p.join()
+        proc_runs.sort(key=lambda runs: runs[0]["proc"])
+    else:
+        proc_runs = [run_sweep(args)]
+
+    merged = merge_procs(proc_runs)
+    print(f'{"task":>20} {"num_envs":>9} {"env steps/s":>12} {"ms/step":>8} {"resets/step":>12} {"peak MB":>9}')
+    for m in merged:
+        print(f'{m["task"]:>20} {m["num_envs"]:>9} {m["env_steps_per_s"]:>12.0f} {m["step_ms"]:>8.2f} '
+              f'{m["reset_rate"]:>12.4f} {m["peak_memory_mb"]:>9.0f}')
+
+    if args.bench_file:
+        bench_dir = os.path.dirname(args.bench_file)
+        if bench_dir:
+            os.makedirs(bench_dir, exist_ok=True)
+        with open(args.bench_file, 'w') as f:
+            json.dump({"args": vars(args), "results": merged, "runs": [r for runs in proc_runs for r in runs]}, f, indent=2)
+        print(f'Wrote {args.bench_file}')
@@ -0,0 +1,51 @@
+import argparse
+import torch
+
+from projects.SkillMimicLab.skillmimic.utils import torch_utils
+from projects.SkillMimicLab.skillmimic.benchmarks.common import ChainState, timeit
+
+# Compares the body to heading frame transform of compute_humanoid_observations before and after the
+# broadcast kernels, e.g.
+#   python -m projects.SkillMimicLab.skillmimic.benchmarks.heading_frame --device cuda:0
+# "repeat" copies the heading quaternion once per body and flattens every input to [num_envs*num_bodies, ...],
+# "broadcast" rotates [num_envs, num_bodies, 3] by [num_envs, 1, 4] directly.
+
+parser = argparse.ArgumentParser()
+parser.add_argument("--num_envs", type=int, nargs='+', default=[1024, 4096, 16384])
+parser.add_argument("--num_bodies", type=int, default=53)
+parser.add_argument("--device", type=str, default='cpu')
+parser.add_argument("--steps", type=int, default=20)
+args = parser.parse_args()
+
+
+def transform_repeat(heading_rot, body_pos, body_rot, body_vel, body_ang_vel):
+    # the previous implementation
+    num_envs, num_bodies = body_pos.shape[0], body_pos.shape[1]
+    flat_heading_rot = heading_rot.unsqueeze(-2).repeat((1, num_bodies, 1)).reshape(num_envs * num_bodies, 4)
+    local_body_pos = torch_utils.quat_rotate(flat_heading_rot, (body_pos - body_pos[:, 0:1]).reshape(-1, 3))
+    local_body_rot = torch_utils.quat_mul_broadcast(flat_heading_rot, body_rot.reshape(-1, 4))
+    local_body_vel = torch_utils.quat_rotate(flat_heading_rot, body_vel.reshape(-1, 3))
+    local_body_ang_vel = torch_utils.quat_rotate(flat_heading_rot, body_ang_vel.reshape(-1, 3))
+    return [x.reshape(num_envs, -1) for x in (local_body_pos, local_body_rot, local_body_vel, local_body_ang_vel)]
+
+
+def transform_broadcast(heading_rot, body_pos, body_rot, body_vel, body_ang_vel):
+    num_envs = body_pos.shape[0]
+    local_body_pos, local_body_vel, local_body_ang_vel = torch_utils.to_local_heading_frame(heading_rot, body_pos[:, 0], body_pos, body_vel, body_ang_vel)
+    local_body_rot = torch_utils.quat_mul_broadcast(heading_rot.unsqueeze(-2), body_rot)
+    return [x.reshape(num_envs, -1) for x in (local_body_pos, local_body_rot, local_body_vel, local_body_ang_vel)]
+
+
+torch.manual_seed(0)
+print(f'{"num_envs":>9} {"repeat ms":>10} {"broadcast ms":>13} {"speedup":>8} {"heading MiB":>12}  identical')
+for num_envs in args.num_envs:
+    state = ChainState(num_envs, args.device, num_bodies=args.num_bodies)
+    inputs = (torch_utils.calc_heading_quat_inv(state.body_rot[:, 0]),) + state.body_states()
+
+    repeat_time = timeit(lambda: transform_repeat(*inputs), args.device, args.steps)
+    broadcast_time = timeit(lambda: transform_broadcast(*inputs), args.device, args.steps)
+    identical = all(torch.equal(a, b) for a, b in zip(transform_repeat(*inputs), transform_broadcast(*inputs)))
+    # size of the repeated heading quaternions, the broadcast path reads num_bodies times less
+    heading_bytes = num_envs * args.num_bodies * 4 * inputs[0].element_size()
+    print(f'{num_envs:>9} {repeat_time*1e3:>10.3f} {broadcast_time*1e3:>13.3f} {repeat_time/broadcast_time:>7.2f}x '
+          f'{heading_bytes/2**20:>12.2f}  {identical}')
@@ -0,0 +1,75 @@
+import argparse
+import copy
+import time
+import types
+import torch
+
+from projects.SkillMimicLab.skillmimic.benchmarks.common import load_cfg_env, sync, use_isaac_lab_stand_in
+
+# Times the SkillMimicBallPlay step on the KinematicBackend (physicsBackend: kinematic), per phase, e.g.
+#   python -m projects.SkillMimicLab.skillmimic.benchmarks.kinematic_step --cfg_env skillmimic/data/cfg/skillmimic.yaml \
+#       --motion_file skillmimic/data/motions/BallPlay-M/layup --num_envs 16384 131072
+# The task is built from the yaml cfg and stepped like in training, with the simulator replaced by the stand-in,
+# and its StepProfiler reports the phases. Isaac Lab only imports with a running Isaac Sim, which the kinematic
+# task never calls into, so its modules are stood in for by empty ones, see common.IsaacLabStandIn.
+
+parser = argparse.ArgumentParser()
+parser.add_argument("--cfg_env", type=str, required=True, help="Environment configuration file (.yaml)")
+parser.add_argument("--motion_file", type=str, default=None, help="Defaults to env.motion_file of --cfg_env")
+parser.add_argument("--num_envs", type=int, nargs='+', default=[16384, 131072])
+parser.add_argument("--device", type=str, default='cpu')
+parser.add_argument("--steps", type=int, default=10)
+args = parser.parse_args()
+
+
+def build_cfg(num_envs):
+    # the fields of SkillmimiceEnvCfg the tasks read, with the env section of --cfg_env
+    env = copy.deepcopy(cfg_env["env"])
+    env["numEnvs"] = num_envs
+    env["physicsBackend"] = "kinematic"
+    env["profileStep"] = True
+    env["profileInterval"] = 10**9 # the benchmark prints its own report
+    env["projtype"] = "None"
+    env["playdataset"] = False
+    env["saveImages"] = False
+    if (args.motion_file is not None):
+        env["motion_file"] = args.motion_file
+    return types.SimpleNamespace(env=env, sim=types.SimpleNamespace(device=args.device),
+                                 args=types.SimpleNamespace(test=False, headless=True))
+
+
+use_isaac_lab_stand_in()
+from env.tasks.skillmimic import SkillMimicBallPlay
+
+cfg_env = load_cfg_env(args.cfg_env)
+
+PHASES = ["pre_physics", "physics", "refresh", "hoi_obs", "observations", "reward", "metrics", "reset_check", "reset"]
+
+torch.manual_seed(0)
+print(f'{"num_envs":>9} ' + ' '.join(f'{p + " ms":>15}' for p in PHASES) + f' {"step ms":>9} {"env steps/s":>12}')
+for num_envs in args.num_envs:
+    task = SkillMimicBallPlay(build_cfg(num_envs))
+    task.reset()
+
+    def step():
+        actions = torch.rand((num_envs, task.num_actions), device=task.device) * 2 - 1
+        task.step(actions)
+        env_ids = task.reset_buf.nonzero(as_tuple=False).flatten()
+        if len(env_ids) > 0:
+            task.reset(env_ids)
+
+    step() # warmup
+    task._profiler.durations.clear()
+    sync(args.device)
+    start = time.perf_counter()
+    for _ in range(args.steps):
+        step()
+    sync(args.device)
+    step_time = (time.perf_counter() - start) / args.steps
+    task._profiler.step_done() # reads back the CUDA phases still pending
+    assert torch.isfinite(task.obs_buf).all() and torch.isfinite(task.rew_buf).all()
+
+    # phases the step skipped, e.g. reset without finished episodes, are 0
+    durations = task._profiler.durations
+    print(f'{num_envs:>9} ' + ' '.join(f'{sum(durations[p]) / args.steps:>15.2f}' for p in PHASES)
+          + f' {step_time * 1e3:>9.2f} {num_envs / step_time:>12.0f}')
@@ -0,0 +1,108 @@
+import argparse
+import torch
+from torch.utils._python_dispatch import TorchDispatchMode
+from torch.utils._pytree import tree_flatten
+
+from projects.SkillMimicLab.skillmimic.utils import torch_utils
+from projects.SkillMimicLab.skillmimic.utils.obs_layout import ObsLayout, OBJ_OBS_SIZE, humanoid_obs_size
+from projects.SkillMimicLab.skillmimic.benchmarks.common import ChainState, timeit, use_isaac_lab_stand_in
+
+use_isaac_lab_stand_in()
+from env.tasks.humanoid_task import compute_humanoid_observations
+from env.tasks.humanoid_object_task import compute_obj_observations
+
+# Counts the tensor allocations of one SkillMimicBallPlay observation update, e.g.
+#   python -m projects.SkillMimicLab.skillmimic.benchmarks.observations --device cuda:0
+# "concat" is the previous assembly: every component in its own tensor, torch.cat, then a copy into obs_buf.
+# "layout" is the current one: every component builder writes into its ObsLayout view of obs_buf.
+# "obs_buf sized" counts the allocations at least as large as obs_buf, the concatenated temporaries. The allocations
+# that remain in the layout mode are the intermediates inside the quaternion math of the builders, they are
+# reported, not gated. The layout mode is checked for no obs_buf sized allocations, and to match the concat mode.
+
+parser = argparse.ArgumentParser()
+parser.add_argument("--num_envs", type=int, nargs='+', default=[1024, 4096, 16384])
+parser.add_argument("--device", type=str, default='cpu')
+parser.add_argument("--num_bodies", type=int, default=53)
+parser.add_argument("--num_contact_bodies", type=int, default=10)
+parser.add_argument("--condition_size", type=int, default=64)
+parser.add_argument("--steps", type=int, default=20)
+args = parser.parse_args()
+
+
+class AllocationCounter(TorchDispatchMode):
+    # counts op outputs that do not share storage with an input, i.e. fresh allocations
+
+    def __init__(self):
+        super().__init__()
+        self.count = 0
+        self.bytes = 0
+        self.sizes = []
+        return
+
+    def __torch_dispatch__(self, func, types, args=(), kwargs=None):
+        out = func(*args, **(kwargs or {}))
+        inputs = {t.untyped_storage().data_ptr() for t in tree_flatten((args, kwargs))[0] if isinstance(t, torch.Tensor)}
+        for t in tree_flatten(out)[0]:
+            if isinstance(t, torch.Tensor) and t.untyped_storage().data_ptr() not in inputs and t.untyped_storage().nbytes() > 0:
+                self.count += 1
+                self.bytes += t.untyped_storage().nbytes()
+                self.sizes.append(t.untyped_storage().nbytes())
+        return out
+
+
+def make_inputs(num_envs, device):
+    state = ChainState(num_envs, device, num_bodies=args.num_bodies, num_contact_bodies=args.num_contact_bodies)
+    label = torch.nn.functional.one_hot(torch.randint(0, args.condition_size, (num_envs,), device=device), args.condition_size).float()
+    return state.body_states(), state.contact_forces, state.contact_body_ids, state.root_states, state.target_states, label
+
+
+def build_layout():
+    layout = ObsLayout()
+    layout.add("humanoid", humanoid_obs_size(args.num_bodies, args.num_contact_bodies))
+    layout.add("obj", OBJ_OBS_SIZE)
+    layout.add("condition", args.condition_size)
+    return layout
+
+
+def step_concat(obs_buf, layout, inputs):
+    body_states, contact_forces, contact_body_ids, root_states, tar_states, label = inputs
+    num_envs = obs_buf.shape[0]
+    heading_rot_inv = torch_utils.calc_heading_frame(root_states[:, 3:7])[1]
+    humanoid_obs = compute_humanoid_observations(*body_states, heading_rot_inv, True, True, contact_forces, contact_body_ids,
+                                                 obs_buf.new_empty((num_envs, layout.slices["humanoid"].stop - layout.slices["humanoid"].start)))
+    obj_obs = compute_obj_observations(root_states[:, 0:3], heading_rot_inv, tar_states, obs_buf.new_empty((num_envs, OBJ_OBS_SIZE)))
+    obs = torch.cat([humanoid_obs, obj_obs], dim=-1)
+    obs = torch.cat((obs, label), dim=-1)
+    obs_buf[:] = obs
+    return
+
+
+def step_layout(obs_buf, layout, inputs):
+    body_states, contact_forces, contact_body_ids, root_states, tar_states, label = inputs
+    heading_rot_inv = torch_utils.calc_heading_frame(root_states[:, 3:7])[1]
+    compute_humanoid_observations(*body_states, heading_rot_inv, True, True, contact_forces, contact_body_ids, layout.view(obs_buf, "humanoid"))
+    compute_obj_observations(root_states[:, 0:3], heading_rot_inv, tar_states, layout.view(obs_buf, "obj"))
+    layout.view(obs_buf, "condition")[:] = label
+    return
+
+
+torch.manual_seed(0)
+layout = build_layout()
+print(layout)
+print(f'{"num_envs":>9} {"mode":>7} {"ms/step":>9} {"allocs":>7} {"MiB":>8} {"obs_buf sized":>14}')
+for num_envs in args.num_envs:
+    inputs = make_inputs(num_envs, args.device)
+    obs_bufs = {}
+    for mode, step in [("concat", step_concat), ("layout", step_layout)]:
+        obs_buf = torch.zeros((num_envs, layout.size), device=args.device)
+        step_time = timeit(lambda: step(obs_buf, layout, inputs), args.device, args.steps)
+
+        counter = AllocationCounter()
+        with counter:
+            step(obs_buf, layout, inputs)
+        obs_sized = sum(1 for size in counter.sizes if size >= obs_buf.numel() * obs_buf.element_size())
+        obs_bufs[mode] = obs_buf
+        print(f'{num_envs:>9} {mode:>7} {step_time*1e3:>9.3f} {counter.count:>7} {counter.bytes/2**20:>8.2f} {obs_sized:>14}')
+        if (mode == "layout"):
+            assert obs_sized == 0, f"{obs_sized} obs_buf sized allocations in the layout mode"
+    assert torch.equal(obs_bufs["concat"], obs_bufs["layout"])
@@ -0,0 +1,55 @@
+import argparse
+import torch
+from torch.autograd import DeviceType
+from torch.profiler import profile, ProfilerActivity
+
+from projects.SkillMimicLab.skillmimic.benchmarks.common import ChainState, load_reward_weights, sync, timeit, use_isaac_lab_stand_in
+
+use_isaac_lab_stand_in()
+from env.tasks.skillmimic import compute_humanoid_reward, build_reward_fn
+
+# Times compute_humanoid_reward per rewardCompile mode, e.g.
+#   python -m projects.SkillMimicLab.skillmimic.benchmarks.reward --cfg_env skillmimic/data/cfg/skillmimic.yaml --devices cpu cuda:0
+# "launches" counts device kernels on GPU. On CPU it counts the outermost aten ops that ran,
+# a graph compiled by torch.compile counts as a single call.
+
+parser = argparse.ArgumentParser()
+parser.add_argument("--cfg_env", type=str, required=True, help="Environment configuration file (.yaml), for the reward weights")
+parser.add_argument("--num_envs", type=int, nargs='+', default=[256, 1024, 4096, 16384, 65536])
+parser.add_argument("--devices", type=str, nargs='+', default=['cpu'])
+parser.add_argument("--modes", type=str, nargs='+', default=["eager", "jit", "compile"])
+parser.add_argument("--num_key_bodies", type=int, default=6)
+parser.add_argument("--steps", type=int, default=20)
+args = parser.parse_args()
+
+def count_launches(reward_fn, inputs, device):
+    activities = [ProfilerActivity.CPU]
+    if torch.device(device).type == 'cuda':
+        activities.append(ProfilerActivity.CUDA)
+    with profile(activities=activities) as prof:
+        reward_fn(*inputs)
+        sync(device)
+    events = prof.events()
+    if torch.device(device).type == 'cuda':
+        return sum(1 for e in events if e.device_type == DeviceType.CUDA)
+
+    def is_op(e):
+        return e.name.startswith('aten::') or e.name.startswith('## Call CompiledFxGraph')
+    return sum(1 for e in events if is_op(e) and (e.cpu_parent is None or not is_op(e.cpu_parent)))
+
+
+torch.manual_seed(0)
+reward_weights = load_reward_weights(args.cfg_env)
+print(f'{"device":>8} {"num_envs":>9} {"mode":>8} {"ms/step":>9} {"launches":>9} {"max abs diff":>13}')
+for device in args.devices:
+    reward_fns = {mode: build_reward_fn(mode) for mode in args.modes}
+    for num_envs in args.num_envs:
+        inputs = ChainState(num_envs, device, reward_weights, num_key_bodies=args.num_key_bodies).reward_inputs()
+        reference = compute_humanoid_reward(*inputs)
+        for mode, reward_fn in reward_fns.items():
+            # the warmup includes scripting / compilation
+            step_time = timeit(lambda: reward_fn(*inputs), device, args.steps)
+            reward = reward_fn(*inputs)
+            launches = count_launches(reward_fn, inputs, device)
+            max_diff = (reward - reference).abs().max().item()
+            print(f'{device:>8} {num_envs:>9} {mode:>8} {step_time*1e3:>9.3f} {launches:>9} {max_diff:>13.2e}')
@@ -0,0 +1,54 @@
+import argparse
+import numpy as np
+import torch
+
+from projects.SkillMimicLab.skillmimic.utils.motion_sampler import AliasMotionSampler
+from projects.SkillMimicLab.skillmimic.benchmarks.common import timeit
+
+# Compares the previous sample_motions path (host multinomial over a fresh weight tensor, then a copy
+# to the sim device) with the device alias table, e.g.
+#   python -m projects.SkillMimicLab.skillmimic.benchmarks.sample_motions --device cuda:0
+
+parser = argparse.ArgumentParser()
+parser.add_argument("--num_samples", type=int, default=65536)
+parser.add_argument("--num_motions", type=int, nargs='+', default=[100, 1000, 10000])
+parser.add_argument("--num_classes", type=int, default=20)
+parser.add_argument("--device", type=str, default='cpu')
+parser.add_argument("--repeats", type=int, default=20)
+args = parser.parse_args()
+
+
+def class_balanced_weights(num_motions):
+    # the same weighting as MotionDataHandler._compute_motion_weights
+    motion_class = np.random.randint(0, args.num_classes, num_motions)
+    unique_classes, indices, counts = np.unique(motion_class, return_inverse=True, return_counts=True)
+    return (1 / counts)[indices]
+
+
+np.random.seed(0)
+torch.manual_seed(0)
+print(f'{args.num_samples} samples per call')
+print(f'{"motions":>8} {"multinomial ms":>15} {"alias ms":>9} {"updated alias ms":>17} {"speedup":>8}  max freq error')
+for num_motions in args.num_motions:
+    weights = class_balanced_weights(num_motions)
+    sampler = AliasMotionSampler(weights, args.device)
+
+    multinomial_time = timeit(lambda: torch.multinomial(torch.tensor(weights), num_samples=args.num_samples,
+                                                        replacement=True).to(args.device), args.device, args.repeats, warmup=1)
+    alias_time = timeit(lambda: sampler.sample(args.num_samples), args.device, args.repeats, warmup=1)
+
+    # halve the weight of a tenth of the motions, drawn with rejection against the original table
+    updated_sampler = AliasMotionSampler(weights, args.device)
+    motion_ids = torch.arange(0, num_motions, 10, device=args.device)
+    updated_sampler.update_weights(motion_ids, updated_sampler.weights[motion_ids] * 0.5)
+    updated_time = timeit(lambda: updated_sampler.sample(args.num_samples), args.device, args.repeats, warmup=1)
+
+    # empirical frequencies over many draws against the normalized weights
+    counts = torch.zeros(num_motions, device=args.device, dtype=torch.double)
+    for _ in range(50):
+        counts += torch.bincount(updated_sampler.sample(args.num_samples), minlength=num_motions)
+    target = updated_sampler.weights.double() / updated_sampler.weights.double().sum()
+    freq_error = (counts / counts.sum() - target).abs().max().item()
+
+    print(f'{num_motions:>8} {multinomial_time*1e3:>15.3f} {alias_time*1e3:>9.3f} {updated_time*1e3:>17.3f} '
+          f'{multinomial_time/alias_time:>7.1f}x  {freq_error:.2e}')
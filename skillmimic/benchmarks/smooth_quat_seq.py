@@ -0,0 +1,48 @@
+import argparse
+import torch
+
+from projects.SkillMimicLab.skillmimic.utils import torch_utils
+from projects.SkillMimicLab.skillmimic.benchmarks.common import timeit
+
+# Compares the per-frame smooth_quat_seq loop with the batched hemisphere signs, e.g.
+#   python -m projects.SkillMimicLab.skillmimic.benchmarks.smooth_quat_seq --device cuda:0
+
+parser = argparse.ArgumentParser()
+parser.add_argument("--lengths", type=int, nargs='+', default=[100, 1000, 10000, 100000])
+parser.add_argument("--device", type=str, default='cpu')
+parser.add_argument("--repeats", type=int, default=5)
+parser.add_argument("--loop_max_length", type=int, default=100000, help="Skip the loop above this length")
+args = parser.parse_args()
+
+
+def smooth_quat_seq_loop(quat_seq):
+    # the implementation MotionDataHandler.smooth_quat_seq replaced
+    for i in range(1, quat_seq.size(0)):
+        dot_product = torch.dot(quat_seq[i-1], quat_seq[i])
+        if dot_product < 0:
+            quat_seq[i] *= -1
+    return quat_seq
+
+
+def smooth_quat_seq_batched(quat_seq):
+    seq_starts = torch.zeros(quat_seq.shape[:-1], device=quat_seq.device, dtype=torch.bool)
+    quat_seq *= torch_utils.quat_seq_hemisphere_signs(quat_seq, seq_starts).unsqueeze(-1)
+    return quat_seq
+
+
+torch.manual_seed(0)
+print(f'{"frames":>8} {"loop ms":>10} {"batched ms":>11} {"speedup":>8}  identical')
+for length in args.lengths:
+    # a random walk in exp-map space, with the sign of every frame scrambled
+    quat_seq = torch_utils.exp_map_to_quat(torch.cumsum(torch.randn(length, 3) * 0.1, dim=0))
+    quat_seq *= torch.where(torch.rand(length, 1) < 0.5, -1., 1.)
+    quat_seq = quat_seq.to(args.device)
+
+    # both modify the sequence in place, every call gets a fresh copy
+    batched_time = timeit(smooth_quat_seq_batched, args.device, args.repeats, warmup=1, setup=quat_seq.clone)
+    if length <= args.loop_max_length:
+        loop_time = timeit(smooth_quat_seq_loop, args.device, 1, warmup=1, setup=quat_seq.clone)
+        identical = torch.equal(smooth_quat_seq_loop(quat_seq.clone()), smooth_quat_seq_batched(quat_seq.clone()))
+        print(f'{length:>8} {loop_time*1e3:>10.2f} {batched_time*1e3:>11.3f} {loop_time/batched_time:>7.0f}x  {identical}')
+    else:
+        print(f'{length:>8} {"-":>10} {batched_time*1e3:>11.3f} {"-":>8}  -')
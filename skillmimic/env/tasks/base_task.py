@@ -15,6 +15,7 @@ import random
 #from isaacgym.gymutil import get_property_setter_map, get_property_getter_map, get_default_setter_args, apply_random_samples, check_buckets, generate_random_samples
 from projects.SkillMimicLab.skillmimic.data.cfg.skillmimic_cfg import SkillmimiceEnvCfg
 from omni.isaac.lab.envs import DirectRLEnv
+from projects.SkillMimicLab.skillmimic.utils.step_profiler import StepProfiler, NULL_PROFILER
 import numpy as np
 import torch
 
@@ -24,30 +25,31 @@ class BaseTask(DirectRLEnv):
     cfg: SkillmimiceEnvCfg
 
     def __init__(self, cfg: SkillmimiceEnvCfg, render_mode: str | None = None, **kwargs):
-        super().__init__(cfg, render_mode, **kwargs)
+        # the kinematic backend stands in for the simulator, there is no Isaac Sim scene to build
+        self._kinematic = cfg.env.get("physicsBackend", "gym") == "kinematic"
+        if (not self._kinematic):
+            super().__init__(cfg, render_mode, **kwargs)
 
         #self.gym = gymapi.acquire_gym()
 
-        self.device_type = cfg.get("device_type", "cuda")
-        self.device_id = cfg.get("device_id", 0)
+        self.device = str(cfg.sim.device)
+        self.device_type = torch.device(self.device).type
+        self.device_id = torch.device(self.device).index or 0
 
-        self.device = "cpu"
-        if self.device_type == "cuda" or self.device_type == "GPU":
-            self.device = "cuda" + ":" + str(self.device_id)
-
-        self.headless = cfg["headless"]
+        # --headless comes from the Isaac Lab AppLauncher arguments
+        self.headless = getattr(cfg.args, "headless", True)
 
         # double check!
         self.graphics_device_id = self.device_id
-        if enable_camera_sensors == False and self.headless == True:
+        if cfg.env.get("enableCameraSensors", False) == False and self.headless == True:
             self.graphics_device_id = -1
 
-        self.num_envs = cfg["env"]["numEnvs"]
-        self.num_obs = cfg["env"]["numObservations"]
-        self.num_states = cfg["env"].get("numStates", 0)
-        self.num_actions = cfg["env"]["numActions"]
+        self.num_envs = cfg.env["numEnvs"]
+        self.num_obs = cfg.env["numObservations"]
+        self.num_states = cfg.env.get("numStates", 0)
+        self.num_actions = cfg.env["numActions"]
 
-        self.control_freq_inv = cfg["env"].get("controlFrequencyInv", 1)
+        self.control_freq_inv = cfg.env.get("controlFrequencyInv", 1)
 
         # optimization flags for pytorch JIT
         torch._C._jit_set_profiling_mode(False)
@@ -68,6 +70,12 @@ class BaseTask(DirectRLEnv):
             self.num_envs, device=self.device, dtype=torch.long)
         self.extras = {}
 
+        # per-phase step timing, reported to extras["step_profile"] and the log every profileInterval steps
+        self._profiler = NULL_PROFILER
+        if cfg.env.get("profileStep", False):
+            self._profiler = StepProfiler(self.device, trace_path=cfg.env.get("profileTrace", None))
+        self._profile_interval = cfg.env.get("profileInterval", 100)
+
         self.original_props = {}
         self.dr_randomizations = {}
         self.first_randomization = True
@@ -89,7 +97,7 @@ class BaseTask(DirectRLEnv):
         self.viewer = None
 
         # if running with a viewer, set up keyboard shortcuts and camera
-        if self.headless == False:
+        if self.headless == False and not self._kinematic:
             # subscribe to keyboard shortcuts
             self.viewer = self.gym.create_viewer(
                 self.sim, gymapi.CameraProperties())
@@ -133,25 +141,36 @@ class BaseTask(DirectRLEnv):
 
         return sim
     '''
+    # the builders write into views of obs_buf / the HOI history; with grad mode on, the legacy JIT executor set
+    # above wraps them in differentiable graphs and marks the outputs as requiring grad, the env never needs it
+    @torch.no_grad()
     def step(self, actions):
         if self.dr_randomizations.get('actions', None):
             actions = self.dr_randomizations['actions']['noise_lambda'](actions)
 
         # apply actions
-        self.pre_physics_step(actions)
+        with self._profiler.phase("pre_physics"):
+            self.pre_physics_step(actions)
 
         # step physics and render each frame
-        self._physics_step()
+        with self._profiler.phase("physics"):
+            self._physics_step()
 
-        # to fix!
-        if self.device == 'cpu':
-            self.gym.fetch_results(self.sim, True)
+            # to fix!
+            if self.device == 'cpu':
+                self._physics.fetch_results()
 
         # compute observations, rewards, resets, ...
-        self.post_physics_step()
+        with self._profiler.phase("post_physics"):
+            self.post_physics_step()
 
         if self.dr_randomizations.get('observations', None):
-            self.obs_buf = self.dr_randomizations['observations']['noise_lambda'](self.obs_buf)
+            self.obs_buf[:] = self.dr_randomizations['observations']['noise_lambda'](self.obs_buf)
+
+        self._profiler.step_done()
+        if (self._profiler is not NULL_PROFILER and self._profiler.num_steps % self._profile_interval == 0):
+            self.extras["step_profile"] = self._profiler.summary()
+            self._profiler.log_summary()
 
     def get_states(self):
         return self.states_buf
@@ -425,7 +444,7 @@ class BaseTask(DirectRLEnv):
     def _physics_step(self):
         for i in range(self.control_freq_inv):
             self.render()
-            self.gym.simulate(self.sim)
+            self._physics.simulate()
         return
 
     def post_physics_step(self):
@@ -26,6 +26,7 @@
 # OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
 # OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
 
+import numpy as np
 import torch
 from torch import Tensor
 from typing import Tuple
@@ -33,6 +34,7 @@ from enum import Enum
 
 from projects.SkillMimicLab.skillmimic.utils import torch_utils
 from projects.SkillMimicLab.skillmimic.utils.motion_data_handler import MotionDataHandler
+from projects.SkillMimicLab.skillmimic.data.cfg.skillmimic_cfg import SkillmimiceEnvCfg
 
 #from isaacgym import gymapi
 #from isaacgym import gymtorch
@@ -44,8 +46,9 @@ TAR_ACTOR_ID = 1
 TAR_FACING_ACTOR_ID = 2
 
 class HRLScoringLayup(HumanoidWholeBodyWithObject):
-    def __init__(self, cfg, sim_params, physics_engine, device_type, device_id, headless):
-        state_init = str(cfg["env"]["stateInit"])
+    #def __init__(self, cfg, sim_params, physics_engine, device_type, device_id, headless):
+    def __init__(self, cfg: SkillmimiceEnvCfg, render_mode: str | None = None, **kwargs):
+        state_init = str(cfg.env["stateInit"])
         if state_init.lower() == "random":
             self._state_init = -1
             print("Random Reference State Init (RRSI)")
@@ -63,19 +66,14 @@ class HRLScoringLayup(HumanoidWholeBodyWithObject):
 
         # self.cfg["env"]["numActions"] = 66
 
-        self.motion_file = cfg['env']['motion_file']
-        self.play_dataset = cfg['env']['playdataset']
-        self.robot_type = cfg["env"]["asset"]["assetFileName"]
-        self.reward_weights_default = cfg["env"]["rewardWeights"]
-        self.save_images = cfg['env']['saveImages']
-        self.init_vel = cfg['env']['initVel']
-
-        super().__init__(cfg=cfg,
-                         sim_params=sim_params,
-                         physics_engine=physics_engine,
-                         device_type=device_type,
-                         device_id=device_id,
-                         headless=headless)
+        self.motion_file = cfg.env['motion_file']
+        self.play_dataset = cfg.env['playdataset']
+        #self.robot_type = cfg.env["asset"]["assetFileName"]
+        self.reward_weights_default = cfg.env["rewardWeights"]
+        self.save_images = cfg.env['saveImages']
+        self.init_vel = cfg.env['initVel']
+
+        super().__init__(cfg, **kwargs)
         # self._goal_position  = torch.tensor([2,-6], device=self.device, dtype=torch.float).repeat(self.num_envs, 1)
         
         self._load_motion(self.motion_file)
@@ -85,7 +83,7 @@ class HRLScoringLayup(HumanoidWholeBodyWithObject):
         self.reached_target = torch.zeros(
             self.num_envs, device=self.device, dtype=torch.bool)
 
-        self._termination_heights = torch.tensor(self.cfg["env"]["terminationHeight"], device=self.device, dtype=torch.float)
+        self._termination_heights = torch.tensor(self.cfg.env["terminationHeight"], device=self.device, dtype=torch.float)
         
         return
 
@@ -99,10 +97,12 @@ class HRLScoringLayup(HumanoidWholeBodyWithObject):
     def _load_motion(self, motion_file):
         self.skill_name = motion_file.split('/')[-1] #metric
         self.max_episode_length = 800
-        if self.cfg["env"]["episodeLength"] > 0:
-            self.max_episode_length =  self.cfg["env"]["episodeLength"]
+        if self.cfg.env["episodeLength"] > 0:
+            self.max_episode_length =  self.cfg.env["episodeLength"]
 
-        self._motion_data = MotionDataHandler(motion_file, self.device, self._key_body_ids, self.cfg, self.num_envs, self.max_episode_length, self.reward_weights_default, self.init_vel)
+        # MotionDataHandler reads the layout of the yaml cfg, cfg["env"], and the run seed get_args stores in cfg.seed
+        motion_cfg = {"env": self.cfg.env, "seed": getattr(self.cfg, "seed", -1)}
+        self._motion_data = MotionDataHandler(motion_file, self.device, self._key_body_ids, motion_cfg, self.num_envs, self.max_episode_length, self.reward_weights_default, self.init_vel)
 
         return
 
@@ -138,7 +138,7 @@ class HRLScoringLayup(HumanoidWholeBodyWithObject):
         self.init_root_pos[env_ids], self.init_root_rot[env_ids],  self.init_root_pos_vel[env_ids], self.init_root_rot_vel[env_ids], \
         self.init_dof_pos[env_ids], self.init_dof_pos_vel[env_ids], \
         self.init_obj_pos[env_ids], self.init_obj_pos_vel[env_ids], self.init_obj_rot[env_ids], self.init_obj_rot_vel[env_ids] \
-            = self._motion_data.get_initial_state(env_ids, motion_ids, motion_times)
+            = self._motion_data.get_initial_state(env_ids, motion_ids, motion_times, return_hoi_data=False)
 
         return
     
@@ -152,12 +152,12 @@ class HRLScoringLayup(HumanoidWholeBodyWithObject):
         self.init_root_pos[env_ids], self.init_root_rot[env_ids],  self.init_root_pos_vel[env_ids], self.init_root_rot_vel[env_ids], \
         self.init_dof_pos[env_ids], self.init_dof_pos_vel[env_ids], \
         self.init_obj_pos[env_ids], self.init_obj_pos_vel[env_ids], self.init_obj_rot[env_ids], self.init_obj_rot_vel[env_ids] \
-            = self._motion_data.get_initial_state(env_ids, motion_ids, motion_times)
+            = self._motion_data.get_initial_state(env_ids, motion_ids, motion_times, return_hoi_data=False)
 
         return
 
     def _compute_reset(self):
-        root_pos = self._humanoid_root_states[..., 0:3]
+        root_pos = self._heading_root_pos
         self.reset_buf[:], self._terminate_buf[:] = compute_humanoid_reset(self.reset_buf, self.progress_buf,
                                                                            self._contact_forces,self._rigid_body_pos,self._target_states[..., 0:3],
                                                                             root_pos, self._goal_position,
@@ -166,11 +166,11 @@ class HRLScoringLayup(HumanoidWholeBodyWithObject):
         return
     
     def _compute_reward(self, actions):
-        root_pos = self._humanoid_root_states[..., 0:3]
+        root_pos = self._heading_root_pos
         root_vel = self._humanoid_root_states[..., 7:10]
         ball_pos = self._target_states[..., 0:3]
         ball_vel = self._target_states[..., 7:10]
-        self.rew_buf[:], self.reached_target = compute_scoring_reward(root_pos, root_vel, ball_pos, ball_vel, self._tar_contact_forces, self._goal_position, self.reached_target, self._rigid_body_pos, self._tar_contact_forces)
+        self.rew_buf[:], self.reached_target[:] = compute_scoring_reward(root_pos, root_vel, ball_pos, ball_vel, self._tar_contact_forces, self._goal_position, self.reached_target, self._rigid_body_pos, self._tar_contact_forces)
         # ball_pos_over_1p5_idx = ball_pos[:,2] > 1.5
         # ball_pos_over_1p5 = ball_pos[ball_pos_over_1p5_idx,2]
         # if any(self.reached_target):
@@ -192,8 +192,8 @@ class HRLScoringLayup(HumanoidWholeBodyWithObject):
         if(len(env_ids)>0):
             n = len(env_ids)
 
-            d = torch.rand(n).to("cuda")*6 + 2
-            theta = torch.rand(n).to("cuda")*torch.pi*2
+            d = torch.rand(n).to(self.device)*6 + 2
+            theta = torch.rand(n).to(self.device)*torch.pi*2
             x = torch.sin(theta)*d
             y = torch.cos(theta)*d
             self._goal_position[env_ids, 0] = self._humanoid_root_states[env_ids, 0]+x
@@ -204,37 +204,38 @@ class HRLScoringLayup(HumanoidWholeBodyWithObject):
         return
 
     def _compute_observations(self, env_ids=None):
-        obs = self._compute_humanoid_obs(env_ids)
+        obs = self._get_obs_out(env_ids)
+        self._compute_humanoid_obs(env_ids, out=self._obs_layout.view(obs, "humanoid"))
 
-        obj_obs = self._compute_obj_obs(env_ids)
+        self._compute_obj_obs(env_ids, out=self._obs_layout.view(obs, "obj"))
 
         if(self._enable_task_obs):
-            task_obs = self._compute_task_obs(env_ids)
-            obs = torch.cat([obs, obj_obs, task_obs], dim=-1)
-        else:
-            obs = torch.cat([obs, obj_obs], dim=-1)
+            self._compute_task_obs(env_ids, out=self._obs_layout.view(obs, "task"))
 
-        if (env_ids is None):
-            self.obs_buf[:] = obs
-        else:
+        if (env_ids is not None):
             self.obs_buf[env_ids] = obs
 
         return
     
                 
-    def _compute_task_obs(self, env_ids=None):
+    def _compute_task_obs(self, env_ids=None, out=None):
         if (env_ids is None):
-            root_pos = self._humanoid_root_states[..., 0:3]
+            root_pos = self._heading_root_pos
             goal_pos = self._goal_position
-            root_rot = self._humanoid_root_states[..., 3:7]
+            heading_rot_inv = self._heading_rot_inv
+            facing_dir = self._facing_dir
             reached_target = self.reached_target
         else:
-            root_pos = self._humanoid_root_states[env_ids, 0:3]
+            root_pos = self._heading_root_pos[env_ids]
             goal_pos = self._goal_position[env_ids]
-            root_rot = self._humanoid_root_states[env_ids, 3:7]
+            heading_rot_inv = self._heading_rot_inv[env_ids]
+            facing_dir = self._facing_dir[env_ids]
             reached_target = self.reached_target[env_ids]
 
-        obs = compute_heading_observations(root_pos, goal_pos, root_rot, reached_target)
+        if (out is None):
+            out = torch.empty((root_pos.shape[0], self.goal_size), device=self.device, dtype=root_pos.dtype)
+
+        obs = compute_heading_observations(root_pos, goal_pos, heading_rot_inv, facing_dir, reached_target, out)
 
         return obs
 
@@ -260,8 +261,8 @@ class HRLScoringLayup(HumanoidWholeBodyWithObject):
         if self.projtype == 'Mouse':
             for evt in self.gym.query_viewer_action_events(self.viewer):
                 if (evt.action == "space_shoot" or evt.action == "mouse_shoot") and evt.value > 0:
-                    x = torch.rand(self.num_envs).to("cuda")*6 + 2
-                    y = torch.rand(self.num_envs).to("cuda")*6 + 2
+                    x = torch.rand(self.num_envs).to(self.device)*6 + 2
+                    y = torch.rand(self.num_envs).to(self.device)*6 + 2
                     self._goal_position[:, 0] = self._humanoid_root_states[:, 0]+x
                     self._goal_position[:, 1] = self._humanoid_root_states[:, 1]+y                   
                     self.reached_target[:] = False
@@ -269,7 +270,7 @@ class HRLScoringLayup(HumanoidWholeBodyWithObject):
         return
 
     def get_num_amp_obs(self):
-        return 323 + len(self.cfg["env"]["keyBodies"])*3 + 6  #0
+        return 323 + len(self.cfg.env["keyBodies"])*3 + 6  #0
     
 #####################################################################
 ###=========================jit functions=========================###
@@ -277,32 +278,24 @@ class HRLScoringLayup(HumanoidWholeBodyWithObject):
 
 
 # @torch.jit.script
-def compute_heading_observations(root_pos, goal_pos, root_rot, reached_target):
-    heading_rot = torch_utils.calc_heading_quat_inv(root_rot) #world: torch_utils.calc_heading_quat(root_rot)
-    
-    facing_dir = torch.zeros_like(root_pos)
-    facing_dir[..., 0] = 1.0
-    local_facing_dir = torch_utils.quat_rotate(heading_rot, facing_dir)  
-
-    local_tar_pos = goal_pos - root_pos[..., 0:2]
-    local_tar_pos_3d = torch.cat([local_tar_pos, torch.zeros_like(local_tar_pos[..., 0:1])], dim=-1)  # Expands to 3D vectors
-    local_tar_pos = quat_rotate(heading_rot, local_tar_pos_3d)
+def compute_heading_observations(root_pos, goal_pos, heading_rot_inv, facing_dir, reached_target, out):
+    local_tar_pos_3d = torch.zeros_like(root_pos)  # Expands to 3D vectors
+    local_tar_pos_3d[..., 0:2] = goal_pos - root_pos[..., 0:2]
+    local_tar_pos = torch_utils.quat_rotate(heading_rot_inv, local_tar_pos_3d)
     local_tar_pos = local_tar_pos[..., 0:2]
     
     # Calculate relative angle in radians
-    angle = torch.atan2(local_tar_pos[:, 1], local_tar_pos[:, 0]) - torch.atan2(local_facing_dir[:, 1], local_facing_dir[:, 0])
+    # the x axis rotated by heading_rot_inv is facing_dir mirrored across the x axis, so its angle is the negated one
+    angle = torch.atan2(local_tar_pos[:, 1], local_tar_pos[:, 0]) + torch.atan2(facing_dir[:, 1], facing_dir[:, 0])
     angle = torch_utils.normalize_angle(angle)
     
     # Compute cosine and sine of the angle
-    cos_angle = torch.cos(angle)
-    sin_angle = torch.sin(angle)
-
-    goal_angle = torch.stack([cos_angle, sin_angle], dim=-1)
-
-    obs = torch.cat([local_tar_pos, goal_angle, reached_target.float().unsqueeze(dim=-1)], dim=-1) #world: goal_pos - root_pos[..., :2]
-    # obs = torch.cat([local_tar_pos, goal_angle], dim=-1) #world: goal_pos - root_pos[..., :2]
+    out[:, 0:2] = local_tar_pos #world: goal_pos - root_pos[..., :2]
+    out[:, 2] = torch.cos(angle)
+    out[:, 3] = torch.sin(angle)
+    out[:, 4] = reached_target
 
-    return obs
+    return out
 
 # # @torch.jit.script
 # def compute_scoring_reward(root_pos, root_vel, ball_pos, ball_vel, ball_contact, goal_pos, reached_target):
@@ -26,6 +26,7 @@
 # OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
 # OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
 
+import numpy as np
 import torch
 from torch import Tensor
 from typing import Tuple
@@ -33,6 +34,7 @@ from enum import Enum
 
 from projects.SkillMimicLab.skillmimic.utils import torch_utils
 from projects.SkillMimicLab.skillmimic.utils.motion_data_handler import MotionDataHandler
+from projects.SkillMimicLab.skillmimic.data.cfg.skillmimic_cfg import SkillmimiceEnvCfg
 
 #from isaacgym import gymapi
 #from isaacgym import gymtorch
@@ -44,8 +46,9 @@ TAR_ACTOR_ID = 1
 TAR_FACING_ACTOR_ID = 2
 
 class HRLThrowing(HumanoidWholeBodyWithObject):
-    def __init__(self, cfg, sim_params, physics_engine, device_type, device_id, headless):
-        state_init = str(cfg["env"]["stateInit"])
+    #def __init__(self, cfg, sim_params, physics_engine, device_type, device_id, headless):
+    def __init__(self, cfg: SkillmimiceEnvCfg, render_mode: str | None = None, **kwargs):
+        state_init = str(cfg.env["stateInit"])
         if state_init.lower() == "random":
             self._state_init = -1
             print("Random Reference State Init (RRSI)")
@@ -59,19 +62,14 @@ class HRLThrowing(HumanoidWholeBodyWithObject):
         # self.condition_size = 0
         self.goal_size = 0
 
-        self.motion_file = cfg['env']['motion_file']
-        self.play_dataset = cfg['env']['playdataset']
-        self.robot_type = cfg["env"]["asset"]["assetFileName"]
-        self.reward_weights_default = cfg["env"]["rewardWeights"]
-        self.save_images = cfg['env']['saveImages']
-        self.init_vel = cfg['env']['initVel']
-
-        super().__init__(cfg=cfg,
-                         sim_params=sim_params,
-                         physics_engine=physics_engine,
-                         device_type=device_type,
-                         device_id=device_id,
-                         headless=headless)
+        self.motion_file = cfg.env['motion_file']
+        self.play_dataset = cfg.env['playdataset']
+        #self.robot_type = cfg.env["asset"]["assetFileName"]
+        self.reward_weights_default = cfg.env["rewardWeights"]
+        self.save_images = cfg.env['saveImages']
+        self.init_vel = cfg.env['initVel']
+
+        super().__init__(cfg, **kwargs)
         
         self._load_motion(self.motion_file)
 
@@ -80,7 +78,7 @@ class HRLThrowing(HumanoidWholeBodyWithObject):
         self.reached_target = torch.zeros(
             self.num_envs, device=self.device, dtype=torch.bool)
 
-        self._termination_heights = torch.tensor(self.cfg["env"]["terminationHeight"], device=self.device, dtype=torch.float)
+        self._termination_heights = torch.tensor(self.cfg.env["terminationHeight"], device=self.device, dtype=torch.float)
 
         
         return
@@ -95,10 +93,12 @@ class HRLThrowing(HumanoidWholeBodyWithObject):
     def _load_motion(self, motion_file):
         self.skill_name = motion_file.split('/')[-1] #metric
         self.max_episode_length = 800
-        if self.cfg["env"]["episodeLength"] > 0:
-            self.max_episode_length =  self.cfg["env"]["episodeLength"]
+        if self.cfg.env["episodeLength"] > 0:
+            self.max_episode_length =  self.cfg.env["episodeLength"]
 
-        self._motion_data = MotionDataHandler(motion_file, self.device, self._key_body_ids, self.cfg, self.num_envs, self.max_episode_length, self.reward_weights_default, self.init_vel)
+        # MotionDataHandler reads the layout of the yaml cfg, cfg["env"], and the run seed get_args stores in cfg.seed
+        motion_cfg = {"env": self.cfg.env, "seed": getattr(self.cfg, "seed", -1)}
+        self._motion_data = MotionDataHandler(motion_file, self.device, self._key_body_ids, motion_cfg, self.num_envs, self.max_episode_length, self.reward_weights_default, self.init_vel)
 
         return
 
@@ -134,7 +134,7 @@ class HRLThrowing(HumanoidWholeBodyWithObject):
         self.init_root_pos[env_ids], self.init_root_rot[env_ids],  self.init_root_pos_vel[env_ids], self.init_root_rot_vel[env_ids], \
         self.init_dof_pos[env_ids], self.init_dof_pos_vel[env_ids], \
         self.init_obj_pos[env_ids], self.init_obj_pos_vel[env_ids], self.init_obj_rot[env_ids], self.init_obj_rot_vel[env_ids] \
-            = self._motion_data.get_initial_state(env_ids, motion_ids, motion_times)
+            = self._motion_data.get_initial_state(env_ids, motion_ids, motion_times, return_hoi_data=False)
 
         return
     
@@ -148,12 +148,12 @@ class HRLThrowing(HumanoidWholeBodyWithObject):
         self.init_root_pos[env_ids], self.init_root_rot[env_ids],  self.init_root_pos_vel[env_ids], self.init_root_rot_vel[env_ids], \
         self.init_dof_pos[env_ids], self.init_dof_pos_vel[env_ids], \
         self.init_obj_pos[env_ids], self.init_obj_pos_vel[env_ids], self.init_obj_rot[env_ids], self.init_obj_rot_vel[env_ids] \
-            = self._motion_data.get_initial_state(env_ids, motion_ids, motion_times)
+            = self._motion_data.get_initial_state(env_ids, motion_ids, motion_times, return_hoi_data=False)
 
         return
 
     def _compute_reset(self):
-        root_pos = self._humanoid_root_states[..., 0:3]
+        root_pos = self._heading_root_pos
         self.reset_buf[:], self._terminate_buf[:] = compute_humanoid_reset(self.reset_buf, self.progress_buf,
                                                                            self._contact_forces,self._rigid_body_pos,self._target_states[..., 0:3],
                                                                             root_pos, self._goal_position,
@@ -173,21 +173,18 @@ class HRLThrowing(HumanoidWholeBodyWithObject):
         return
 
     def _compute_observations(self, env_ids=None):
-        obs = self._compute_humanoid_obs(env_ids)
-
-        obj_obs = self._compute_obj_obs(env_ids)
+        obs = self._get_obs_out(env_ids)
+        self._compute_humanoid_obs(env_ids, out=self._obs_layout.view(obs, "humanoid"))
 
-        obs = torch.cat([obs, obj_obs], dim=-1)
+        self._compute_obj_obs(env_ids, out=self._obs_layout.view(obs, "obj"))
 
-        if (env_ids is None):
-            self.obs_buf[:] = obs
-        else:
+        if (env_ids is not None):
             self.obs_buf[env_ids] = obs
 
         return
 
     def get_num_amp_obs(self):
-        return 323 + len(self.cfg["env"]["keyBodies"])*3 + 6  #0
+        return 323 + len(self.cfg.env["keyBodies"])*3 + 6  #0
     
 #####################################################################
 ###=========================jit functions=========================###
@@ -11,10 +11,12 @@ import omni.isaac.lab.sim as sim_utils
 from omni.isaac.lab.assets import RigidObjectCfg
 
 from projects.SkillMimicLab.skillmimic.utils import torch_utils
+from projects.SkillMimicLab.skillmimic.utils.torch_utils import to_torch
+from projects.SkillMimicLab.skillmimic.utils.obs_layout import ObsLayout, OBJ_OBS_SIZE
 from projects.SkillMimicLab.skillmimic.data.cfg.skillmimic_cfg import SkillmimiceEnvCfg
 
 from env.tasks.humanoid_task import HumanoidWholeBody
-from projects.SkillMimicLab.skillmimic.utils.metrics import Metrics, compute_evaluation_metrics
+from projects.SkillMimicLab.skillmimic.utils.metrics import compute_evaluation_metrics
 
 
 PERTURB_PROJECTORS = [
@@ -48,13 +50,26 @@ class HumanoidWholeBodyWithObject(HumanoidWholeBody): #metric
         
     def get_obs_size(self):
         obs_size = super().get_obs_size()
-        self.obj_obs_size = 15
+        self.obj_obs_size = OBJ_OBS_SIZE
         obs_size += self.obj_obs_size
         return obs_size
 
+    def _build_obs_layout(self):
+        layout = ObsLayout()
+        layout.add("humanoid", self._num_obs)
+        layout.add("obj", self.obj_obs_size)
+        if self._enable_task_obs:
+            layout.add("task", self.get_task_obs_size())
+        return layout
+
     def get_task_obs_size(self):
         return 0
 
+    def _get_kinematic_actors_per_env(self):
+        # the ball, the KinematicBackend has no projectiles
+        assert self.projtype == "None", f"projtype {self.projtype} needs the gym physics backend"
+        return super()._get_kinematic_actors_per_env() + 1
+
     def _create_envs(self, num_envs, spacing, num_per_row):
 
         self._target_handles = []
@@ -200,8 +215,7 @@ class HumanoidWholeBodyWithObject(HumanoidWholeBody): #metric
         self._tar_actor_ids = to_torch(num_actors * np.arange(self.num_envs), device=self.device, dtype=torch.int32) + 1
         
         bodies_per_env = self._rigid_body_state.shape[0] // self.num_envs
-        contact_force_tensor = self.gym.acquire_net_contact_force_tensor(self.sim)
-        contact_force_tensor = gymtorch.wrap_tensor(contact_force_tensor)
+        contact_force_tensor = self._physics.contact_forces
         self._tar_contact_forces = contact_force_tensor.view(self.num_envs, bodies_per_env, 3)[..., self.num_bodies, :]
 
         self.init_obj_pos = torch.zeros([self.num_envs, 3], device=self.device, dtype=torch.float)
@@ -273,14 +287,16 @@ class HumanoidWholeBodyWithObject(HumanoidWholeBody): #metric
         super()._reset_env_tensors(env_ids)
 
         env_ids_int32 = self._tar_actor_ids[env_ids]
-        self.gym.set_actor_root_state_tensor_indexed(self.sim, gymtorch.unwrap_tensor(self._root_states),
-                                                    gymtorch.unwrap_tensor(env_ids_int32), len(env_ids_int32))
+        self._physics.set_root_states(env_ids_int32)
     
         return
     
     def pre_physics_step(self, actions):
         super().pre_physics_step(actions)
-        self.evts = list(self.gym.query_viewer_action_events(self.viewer))
+        if self.viewer:
+            self.evts = list(self.gym.query_viewer_action_events(self.viewer))
+        else:
+            self.evts = [] # headless, no viewer events
         return 
     
     def post_physics_step(self):
@@ -368,34 +384,32 @@ class HumanoidWholeBodyWithObject(HumanoidWholeBody): #metric
 
     
     def _compute_observations(self, env_ids=None): # called @ reset & post step
-        obs = None
-        humanoid_obs = self._compute_humanoid_obs(env_ids)
-        obs = humanoid_obs
-
-        obj_obs = self._compute_obj_obs(env_ids)
-        obs = torch.cat([obs, obj_obs], dim=-1)
+        obs = self._get_obs_out(env_ids)
+        self._compute_humanoid_obs(env_ids, out=self._obs_layout.view(obs, "humanoid"))
+        self._compute_obj_obs(env_ids, out=self._obs_layout.view(obs, "obj"))
 
         if self._enable_task_obs:
-            task_obs = self.compute_task_obs(env_ids)
-            obs = torch.cat([obs, task_obs], dim = -1)
-
-        if (env_ids is None): 
-            self.obs_buf[:] = obs
+            self._obs_layout.view(obs, "task")[:] = self.compute_task_obs(env_ids)
 
-        else:
+        if (env_ids is not None):
             self.obs_buf[env_ids] = obs
 
         return
 
-    def _compute_obj_obs(self, env_ids=None):
+    def _compute_obj_obs(self, env_ids=None, out=None):
         if (env_ids is None):
-            root_states = self._humanoid_root_states
+            root_pos = self._heading_root_pos
+            heading_rot_inv = self._heading_rot_inv
             tar_states = self._target_states
         else:
-            root_states = self._humanoid_root_states[env_ids]
+            root_pos = self._heading_root_pos[env_ids]
+            heading_rot_inv = self._heading_rot_inv[env_ids]
             tar_states = self._target_states[env_ids]
+
+        if (out is None):
+            out = torch.empty((root_pos.shape[0], self.obj_obs_size), device=self.device, dtype=root_pos.dtype)
         
-        obs = compute_obj_observations(root_states, tar_states)
+        obs = compute_obj_observations(root_pos, heading_rot_inv, tar_states, out)
         return obs
 
 
@@ -442,25 +456,21 @@ def quat_mul(a, b):
 ###############################################
 
 @torch.jit.script
-def compute_obj_observations(root_states, tar_states):
-    # type: (Tensor, Tensor) -> Tensor
-    root_pos = root_states[:, 0:3]
-    root_rot = root_states[:, 3:7]
-
+def compute_obj_observations(root_pos, heading_rot_inv, tar_states, out):
+    # type: (Tensor, Tensor, Tensor, Tensor) -> Tensor
+    # writes [local_tar_pos, local_tar_rot, local_tar_vel, local_tar_ang_vel] into out
     tar_pos = tar_states[:, 0:3]
     tar_rot = tar_states[:, 3:7]
     tar_vel = tar_states[:, 7:10]
     tar_ang_vel = tar_states[:, 10:13]
-
-    heading_rot = torch_utils.calc_heading_quat_inv(root_rot)
     
     local_tar_pos = tar_pos - root_pos
     local_tar_pos[..., -1] = tar_pos[..., -1]
-    local_tar_pos = quat_rotate(heading_rot, local_tar_pos)
-    local_tar_vel = quat_rotate(heading_rot, tar_vel)
-    local_tar_ang_vel = quat_rotate(heading_rot, tar_ang_vel)
+    local_tar_pos = quat_rotate(heading_rot_inv, local_tar_pos)
+    local_tar_vel = quat_rotate(heading_rot_inv, tar_vel)
+    local_tar_ang_vel = quat_rotate(heading_rot_inv, tar_ang_vel)
 
-    local_tar_rot = quat_mul(heading_rot, tar_rot)
+    local_tar_rot = quat_mul(heading_rot_inv, tar_rot)
     local_tar_rot_obs = torch_utils.quat_to_tan_norm(local_tar_rot)
 
     # for disturbance test
@@ -469,5 +479,8 @@ def compute_obj_observations(root_states, tar_states):
     # local_tar_vel += torch.rand_like(local_tar_vel).to(self.device)*0.5
     # local_tar_ang_vel += torch.rand_like(local_tar_ang_vel).to(self.device)*0.5
 
-    obs = torch.cat([local_tar_pos, local_tar_rot_obs, local_tar_vel, local_tar_ang_vel], dim=-1)
-    return obs
+    out[:, 0:3] = local_tar_pos
+    out[:, 3:9] = local_tar_rot_obs
+    out[:, 9:12] = local_tar_vel
+    out[:, 12:15] = local_tar_ang_vel
+    return out
@@ -10,9 +10,14 @@ import glob, os, random
 #from isaacgym.torch_utils import *
 
 from projects.SkillMimicLab.skillmimic.utils import torch_utils
+from projects.SkillMimicLab.skillmimic.utils.torch_utils import to_torch
+from projects.SkillMimicLab.skillmimic.utils.obs_layout import ObsLayout, humanoid_obs_size
+from projects.SkillMimicLab.skillmimic.utils.step_capture import StepCapture
+from projects.SkillMimicLab.skillmimic.utils.step_profiler import NULL_PROFILER
 from projects.SkillMimicLab.skillmimic.data.cfg.skillmimic_cfg import SkillmimiceEnvCfg
 
 from env.tasks.base_task import BaseTask
+from env.tasks.physics_backend import GymBackend, KinematicBackend
 from omni.isaac.lab.assets import Articulation
 
 PERTURB_OBJS = [
@@ -35,7 +40,7 @@ class HumanoidWholeBody(BaseTask):
 
         self.debug_viz = self.cfg.env["enableDebugVis"]
         self.plane_static_friction = self.cfg.env["plane"]["staticFriction"]
-        self.plane_dynamic_friction = self.ccfg.env["plane"]["dynamicFriction"]
+        self.plane_dynamic_friction = self.cfg.env["plane"]["dynamicFriction"]
         self.plane_restitution = self.cfg.env["plane"]["restitution"]
 
         self.max_episode_length = self.cfg.env["episodeLength"] #V1
@@ -47,6 +52,8 @@ class HumanoidWholeBody(BaseTask):
         self._setup_character_props(key_bodies)
 
         self.cfg.env["numObservations"] = self.get_obs_size()
+        self._obs_layout = self._build_obs_layout()
+        assert self._obs_layout.size == self.cfg.env["numObservations"], f"{self._obs_layout} does not match numObservations"
         self.cfg.env["numActions"] = self.get_action_size()
 
         #self.cfg["device_type"] = device_type
@@ -55,26 +62,23 @@ class HumanoidWholeBody(BaseTask):
          
         super().__init__(cfg, **kwargs)
         
-        self.dt = self.control_freq_inv * sim_params.dt
+        sim_dt = self.cfg.env.get("kinematicDt", 1. / 60.) if self._kinematic else self.cfg.sim.dt
+        self.dt = self.control_freq_inv * sim_dt
         
-        # get gym GPU state tensors
-        actor_root_state = self.gym.acquire_actor_root_state_tensor(self.sim)
-        dof_state_tensor = self.gym.acquire_dof_state_tensor(self.sim)
-        #rigid_body_state = self.gym.acquire_rigid_body_state_tensor(self.sim) #position([0:3]), rotation([3:7]), linear velocity([7:10]), and angular velocity([10:13]).
-        #rigid_body_state = torch.cat((self.actor.body_pos_w, self.actor.body_quat_w, self.actor.body_lin_vel_w, self.actor.body_ang_vel_w),dim=-1)
-        contact_force_tensor = self.gym.acquire_net_contact_force_tensor(self.sim)
+        # simulator state tensors, see physics_backend.py
+        self._physics = self._build_physics_backend()
+        actor_root_state = self._physics.root_states
+        dof_state_tensor = self._physics.dof_state
+        contact_force_tensor = self._physics.contact_forces
         
         # sensors_per_env = 2
         # self.vec_sensor_tensor = gymtorch.wrap_tensor(sensor_tensor).view(self.num_envs, sensors_per_env * 6)
         # self.dof_force_tensor = gymtorch.wrap_tensor(dof_force_tensor).view(self.num_envs, self.num_dof)
         
-        self.gym.refresh_dof_state_tensor(self.sim)
-        self.gym.refresh_actor_root_state_tensor(self.sim)
-        self.gym.refresh_rigid_body_state_tensor(self.sim)
-        self.gym.refresh_net_contact_force_tensor(self.sim)
+        self._physics.refresh()
 
         # create some wrapper tensors for different slices
-        self._root_states = gymtorch.wrap_tensor(actor_root_state)
+        self._root_states = actor_root_state
         num_actors = self.get_num_actors_per_env()
         self._humanoid_actor_ids = num_actors * torch.arange(self.num_envs, device=self.device, dtype=torch.int32)
         self._humanoid_root_states = self._root_states.view(self.num_envs, num_actors, actor_root_state.shape[-1])[..., 0, :]
@@ -85,26 +89,21 @@ class HumanoidWholeBody(BaseTask):
         self.init_root_pos_vel = self._initial_humanoid_root_states[:, 7:10]
         self.init_root_rot_vel = torch.zeros_like(self._initial_humanoid_root_states[:, 10:13], device=self.device, dtype=torch.float)
 
-        self._dof_state = gymtorch.wrap_tensor(dof_state_tensor)
+        self._dof_state = dof_state_tensor
         dofs_per_env = self._dof_state.shape[0] // self.num_envs
         self._dof_pos = self._dof_state.view(self.num_envs, dofs_per_env, 2)[..., :self.num_dof, 0]
         self._dof_vel = self._dof_state.view(self.num_envs, dofs_per_env, 2)[..., :self.num_dof, 1]
         self.init_dof_pos = torch.zeros_like(self._dof_pos, device=self.device, dtype=torch.float)
         self.init_dof_pos_vel = torch.zeros_like(self._dof_vel, device=self.device, dtype=torch.float)
            
-        #self._rigid_body_state = gymtorch.wrap_tensor(rigid_body_state)
+        self._rigid_body_state = self._physics.rigid_body_state
         bodies_per_env = self._rigid_body_state.shape[0] // self.num_envs
-        #rigid_body_state_reshaped = self._rigid_body_state.view(self.num_envs, bodies_per_env, 13)
-        #self._rigid_body_pos = rigid_body_state_reshaped[..., :self.num_bodies, 0:3]
-        #self._rigid_body_rot = rigid_body_state_reshaped[..., :self.num_bodies, 3:7]
-        #self._rigid_body_vel = rigid_body_state_reshaped[..., :self.num_bodies, 7:10]
-        #self._rigid_body_ang_vel = rigid_body_state_reshaped[..., :self.num_bodies, 10:13]
-        self._rigid_body_pos = self.actor.data.body_pos_w[..., :self.num_bodies, 0:3]
-        self._rigid_body_rot = self.actor.data.body_quat_w[..., :self.num_bodies, 3:7]
-        self._rigid_body_vel = self.actor.data.body_lin_vel_w[..., :self.num_bodies, 7:10]
-        self._rigid_body_ang_vel = self.actor.data.body_ang_vel_w[..., :self.num_bodies, 10:13]
-
-        contact_force_tensor = gymtorch.wrap_tensor(contact_force_tensor)
+        rigid_body_state_reshaped = self._rigid_body_state.view(self.num_envs, bodies_per_env, 13)
+        self._rigid_body_pos = rigid_body_state_reshaped[..., :self.num_bodies, 0:3]
+        self._rigid_body_rot = rigid_body_state_reshaped[..., :self.num_bodies, 3:7]
+        self._rigid_body_vel = rigid_body_state_reshaped[..., :self.num_bodies, 7:10]
+        self._rigid_body_ang_vel = rigid_body_state_reshaped[..., :self.num_bodies, 10:13]
+
         self._contact_forces = contact_force_tensor.view(self.num_envs, bodies_per_env, 3)[..., :self.num_bodies, :]
                 
         self._build_termination_heights()
@@ -117,9 +116,33 @@ class HumanoidWholeBody(BaseTask):
             self._init_camera()
 
         self._terminate_buf = torch.ones(self.num_envs, device=self.device, dtype=torch.long) # in  extras/info
+
+        # heading frame of the humanoid root, see _update_heading_frame
+        self._heading_root_pos = torch.zeros((self.num_envs, 3), device=self.device, dtype=torch.float)
+        self._heading_rot = torch.zeros((self.num_envs, 4), device=self.device, dtype=torch.float)
+        self._heading_rot_inv = torch.zeros((self.num_envs, 4), device=self.device, dtype=torch.float)
+        self._facing_dir = torch.zeros((self.num_envs, 3), device=self.device, dtype=torch.float)
+        self._update_heading_frame()
+
+        # captured step, see _run_captured
+        self._captured_step = self.cfg.env.get("capturedStep", False)
+        self._step_captures = {}
+        self.actions = torch.zeros((self.num_envs, self.num_actions), device=self.device, dtype=torch.float)
+        self._reset_mask = torch.zeros(self.num_envs, device=self.device, dtype=torch.bool)
+        # obs_buf sized scratch: the previous obs_buf of a captured reset, or the rows of a partial reset
+        self._reset_obs_buf = torch.zeros_like(self.obs_buf)
+        # the phases inside a captured segment are not timed one by one, the segment is
+        self._compute_profiler = NULL_PROFILER if self._captured_step else self._profiler
         return
 
     def _setup_character_props(self, key_bodies):
+        if (self.cfg.env.get("physicsBackend", "gym") == "kinematic"):
+            # the star skeleton of _setup_kinematic_scene, 3 DOFs per joint
+            num_bodies = self.cfg.env.get("kinematicNumBodies", 53)
+            self._dof_obs_size = (num_bodies - 1) * 3
+            self._num_actions = (num_bodies - 1) * 3
+            self._num_obs = humanoid_obs_size(num_bodies, len(self.cfg.env["contactBodies"]))
+            return
         '''
         asset_file = self.cfg["env"]["asset"]["assetFileName"]
         num_key_bodies = len(key_bodies)
@@ -153,6 +176,13 @@ class HumanoidWholeBody(BaseTask):
             obs_size += task_obs_size
         return obs_size
 
+    def _build_obs_layout(self):
+        layout = ObsLayout()
+        layout.add("humanoid", self._num_obs)
+        if self._enable_task_obs:
+            layout.add("task", self.get_task_obs_size())
+        return layout
+
     def get_action_size(self):
         return self._num_actions
 
@@ -164,6 +194,10 @@ class HumanoidWholeBody(BaseTask):
         return 0
 
     def _setup_scene(self):
+        if (self.cfg.env.get("physicsBackend", "gym") == "kinematic"):
+            self._setup_kinematic_scene()
+            return
+
         self.actor = Articulation(self.cfg.robot)
         self.scene.articulations["robot"] = self.actor
 
@@ -294,6 +328,47 @@ class HumanoidWholeBody(BaseTask):
 
         return
     '''
+    def _setup_kinematic_scene(self):
+        # the character properties _create_envs reads from the asset, for the KinematicBackend, which has none
+        self.sim = None
+        self.envs = []
+        self.torso_index = 0
+        self.num_bodies = self.cfg.env.get("kinematicNumBodies", 53)
+        self.num_humanoid_bodies = self.num_bodies
+        self.num_joints = self.num_bodies - 1
+        self.num_dof = 3 * self.num_joints
+        self.motor_efforts = torch.ones(self.num_dof, device=self.device, dtype=torch.float)
+        self.max_motor_effort = 1.
+        self.dof_limits_lower = torch.full((self.num_dof,), -np.pi, device=self.device, dtype=torch.float)
+        self.dof_limits_upper = torch.full((self.num_dof,), np.pi, device=self.device, dtype=torch.float)
+
+        # body names in the order of the asset when kinematicBodyNames lists them, else the root is body 0 and the
+        # bodies the cfg names follow in the order they first appear
+        body_names = self.cfg.env.get("kinematicBodyNames", None)
+        if (body_names is None):
+            body_names = ["root"]
+            for name in self.cfg.env["keyBodies"] + self.cfg.env["keyBodiesWrist"] + self.cfg.env["contactBodies"]:
+                if (name not in body_names):
+                    body_names.append(name)
+        assert len(body_names) <= self.num_bodies, f"kinematicNumBodies {self.num_bodies} is too small for {len(body_names)} bodies"
+        self._kinematic_body_names = body_names
+
+        if (self._pd_control):
+            self._build_pd_action_offset_scale()
+        return
+
+    def _get_kinematic_actors_per_env(self):
+        # the actors _create_envs builds in every env
+        return 1
+
+    def _build_physics_backend(self):
+        backend = self.cfg.env.get("physicsBackend", "gym")
+        if (backend == "kinematic"):
+            return KinematicBackend(self.num_envs, self._get_kinematic_actors_per_env(), self.num_dof, self.num_bodies,
+                                    self.device, self.cfg.env.get("kinematicDt", 1. / 60.))
+        assert backend == "gym", f"Unsupported physicsBackend: {backend}"
+        return GymBackend(self.gym, self.sim)
+
     def _build_pd_action_offset_scale(self):
         
         lim_low = self.dof_limits_lower.cpu().numpy()
@@ -316,10 +391,12 @@ class HumanoidWholeBody(BaseTask):
     
 
 
+    @torch.no_grad() # see BaseTask.step
     def reset(self, env_ids=None):
         if (env_ids is None):
             env_ids = to_torch(np.arange(self.num_envs), device=self.device, dtype=torch.long)
-        self._reset_envs(env_ids)
+        with self._profiler.phase("reset"):
+            self._reset_envs(env_ids)
         return
 
     def _reset_envs(self, env_ids):
@@ -327,28 +404,51 @@ class HumanoidWholeBody(BaseTask):
             self._reset_actors(env_ids)
             self._reset_env_tensors(env_ids)
             self._refresh_sim_tensors()
-            self._compute_observations(env_ids)
+            if (self._captured_step):
+                self._reset_mask[:] = False
+                self._reset_mask[env_ids] = True
+                self._run_captured("reset", self._reset_compute)
+            else:
+                self._update_heading_frame(env_ids)
+                self._compute_observations(env_ids)
+        return
+
+    def _reset_compute(self):
+        # _update_heading_frame(env_ids) and _compute_observations(env_ids) with static shapes,
+        # every env is recomputed and obs_buf keeps the new rows of the envs in _reset_mask only
+        self._reset_obs_buf[:] = self.obs_buf
+        self._update_heading_frame()
+        self._compute_observations()
+        torch.where(self._reset_mask.unsqueeze(-1), self.obs_buf, self._reset_obs_buf, out=self.obs_buf)
         return
 
     def _reset_env_tensors(self, env_ids): #Z10
         env_ids_int32 = self._humanoid_actor_ids[env_ids]
-        self.gym.set_actor_root_state_tensor_indexed(self.sim,
-                                                     gymtorch.unwrap_tensor(self._root_states),
-                                                     gymtorch.unwrap_tensor(env_ids_int32), len(env_ids_int32))
-        self.gym.set_dof_state_tensor_indexed(self.sim,
-                                              gymtorch.unwrap_tensor(self._dof_state),
-                                              gymtorch.unwrap_tensor(env_ids_int32), len(env_ids_int32))
+        self._physics.set_root_states(env_ids_int32)
+        self._physics.set_dof_states(env_ids_int32)
         self.progress_buf[env_ids] = 0
         self.reset_buf[env_ids] = 0
         self._terminate_buf[env_ids] = 0
         return
     
     def _refresh_sim_tensors(self):
-        self.gym.refresh_dof_state_tensor(self.sim)
-        self.gym.refresh_actor_root_state_tensor(self.sim)
-        self.gym.refresh_rigid_body_state_tensor(self.sim)
-        self.gym.refresh_net_contact_force_tensor(self.sim)
+        self._physics.refresh()
+        return
 
+    def _update_heading_frame(self, env_ids=None):
+        # root position and heading frame shared by the observation and reward builders, computed once
+        # after _refresh_sim_tensors. a partial reset only moves the reset envs, so only their rows are updated
+        if (env_ids is None):
+            root_states = self._humanoid_root_states
+            self._heading_root_pos[:] = root_states[:, 0:3]
+            self._heading_rot[:], self._heading_rot_inv[:], self._facing_dir[:] = torch_utils.calc_heading_frame(root_states[:, 3:7])
+        else:
+            root_states = self._humanoid_root_states[env_ids]
+            self._heading_root_pos[env_ids] = root_states[:, 0:3]
+            heading_rot, heading_rot_inv, facing_dir = torch_utils.calc_heading_frame(root_states[:, 3:7])
+            self._heading_rot[env_ids] = heading_rot
+            self._heading_rot_inv[env_ids] = heading_rot_inv
+            self._facing_dir[env_ids] = facing_dir
         return
     
     def _reset_actors(self, env_ids):
@@ -363,16 +463,14 @@ class HumanoidWholeBody(BaseTask):
 
 
     def pre_physics_step(self, actions):
-        self.actions = actions.to(self.device).clone()
+        self.actions[:] = actions
         if (self._pd_control): #ZC99
             pd_tar = self._action_to_pd_targets(self.actions)
-            self.pd_tar_tensor = gymtorch.unwrap_tensor(pd_tar)
-            #self.gym.set_dof_position_target_tensor(self.sim, pd_tar_tensor)
+            self._physics.set_dof_position_targets(pd_tar)
         else:
             身身竹
             self.forces = self.actions * self.motor_efforts.unsqueeze(0) * self.power_scale
-            #force_tensor = gymtorch.unwrap_tensor(forces)
-            #self.gym.set_dof_actuation_force_tensor(self.sim, force_tensor)
+            self._physics.set_dof_actuation_forces(self.forces)
         return
     
 
@@ -391,15 +489,10 @@ class HumanoidWholeBody(BaseTask):
         if self.projtype == "Mouse" or self.projtype == "Auto":
             self._update_proj()
 
-        self.progress_buf += 1
-        # print(int(self.progress_buf[0]), "   ", end=' ')
-
-        self._refresh_sim_tensors()
-
-        self._compute_observations() # for policy
-        self._compute_reward(self.actions)
-        # self._compute_metrics() #metric zqh
-        self._compute_reset()
+        with self._profiler.phase("refresh"):
+            self._refresh_sim_tensors()
+        with self._profiler.phase("compute"):
+            self._run_captured("post_physics", self._post_physics_compute)
 
         # print(f'step: {int(self.progress_buf[0])}, reward: {float(self.rew_buf[0]):.10f}')
         
@@ -410,6 +503,38 @@ class HumanoidWholeBody(BaseTask):
 
         return
     
+    def _post_physics_compute(self):
+        self.progress_buf += 1
+        # print(int(self.progress_buf[0]), "   ", end=' ')
+
+        self._update_heading_frame()
+
+        with self._compute_profiler.phase("observations"):
+            self._compute_observations() # for policy
+        with self._compute_profiler.phase("reward"):
+            self._compute_reward(self.actions)
+        with self._compute_profiler.phase("metrics"):
+            self._compute_metrics() #metric zqh
+        with self._compute_profiler.phase("reset_check"):
+            self._compute_reset()
+        return
+
+    def _run_captured(self, name, fn):
+        # with capturedStep the segment is recorded once and replayed, a CUDA graph on GPU and a compiled graph
+        # on CPU, see StepCapture. The sim refresh and viewer calls stay outside the segments.
+        if (not self._captured_step):
+            fn()
+            return
+        name = f"{name}/{self._capture_phase()}"
+        if (name not in self._step_captures):
+            self._step_captures[name] = StepCapture(fn, self, self.device, name)
+        self._step_captures[name]()
+        return
+
+    def _capture_phase(self):
+        # buffers that alternate between steps need one recording per phase
+        return 0
+
     def _update_proj(self):
         return
     
@@ -418,6 +543,9 @@ class HumanoidWholeBody(BaseTask):
 
         return
     
+    def _compute_metrics(self):
+        return
+
     def _compute_reset(self):
         self.reset_buf[:], self._terminate_buf[:] = compute_humanoid_reset(self.reset_buf, self.progress_buf,
                                                    self._rigid_body_pos, self.max_episode_length,
@@ -427,39 +555,46 @@ class HumanoidWholeBody(BaseTask):
 
 
     def _compute_observations(self, env_ids=None): # called @ reset & post step
-        obs = None
-        humanoid_obs = self._compute_humanoid_obs(env_ids)
-        obs = humanoid_obs
+        obs = self._get_obs_out(env_ids)
+        self._compute_humanoid_obs(env_ids, out=self._obs_layout.view(obs, "humanoid"))
 
         if self._enable_task_obs:
-            task_obs = self.compute_task_obs(env_ids)
-            obs = torch.cat([obs, task_obs], dim = -1)
+            self._obs_layout.view(obs, "task")[:] = self.compute_task_obs(env_ids)
 
-        if (env_ids is None): 
-            self.obs_buf[:] = obs
-
-        else:
+        if (env_ids is not None):
             self.obs_buf[env_ids] = obs
 
         return
 
-    def _compute_humanoid_obs(self, env_ids=None):
+    def _get_obs_out(self, env_ids=None):
+        # the components of a full update are written straight into obs_buf,
+        # a partial reset assembles its rows in the leading rows of _reset_obs_buf, scattered into obs_buf afterwards
+        if (env_ids is None):
+            return self.obs_buf
+        return self._reset_obs_buf[:len(env_ids)]
+
+    def _compute_humanoid_obs(self, env_ids=None, out=None):
         if (env_ids is None):
             body_pos = self._rigid_body_pos
             body_rot = self._rigid_body_rot
             body_vel = self._rigid_body_vel
             body_ang_vel = self._rigid_body_ang_vel
             contact_forces = self._contact_forces
+            heading_rot_inv = self._heading_rot_inv
         else:
             body_pos = self._rigid_body_pos[env_ids]
             body_rot = self._rigid_body_rot[env_ids]
             body_vel = self._rigid_body_vel[env_ids]
             body_ang_vel = self._rigid_body_ang_vel[env_ids]
             contact_forces = self._contact_forces[env_ids]
+            heading_rot_inv = self._heading_rot_inv[env_ids]
+
+        if (out is None):
+            out = torch.empty((body_pos.shape[0], self._num_obs), device=self.device, dtype=body_pos.dtype)
         
-        obs = compute_humanoid_observations(body_pos, body_rot, body_vel, body_ang_vel, 
+        obs = compute_humanoid_observations(body_pos, body_rot, body_vel, body_ang_vel, heading_rot_inv,
                                                 self._local_root_obs, self._root_height_obs,
-                                                contact_forces, self._contact_body_ids)
+                                                contact_forces, self._contact_body_ids, out)
 
         return obs
 
@@ -477,30 +612,31 @@ class HumanoidWholeBody(BaseTask):
         return
     
     def _build_key_body_ids_tensor(self, key_body_names):
-        env_ptr = self.envs[0]
-        actor_handle = self.humanoid_handles[0]
         body_ids = []
 
         for body_name in key_body_names:
-            body_id = self.gym.find_actor_rigid_body_handle(env_ptr, actor_handle, body_name)
-            assert(body_id != -1)
-            body_ids.append(body_id)
+            body_ids.append(self._find_body_id(body_name))
 
         body_ids = to_torch(body_ids, device=self.device, dtype=torch.long)
         return body_ids
 
     def _build_contact_body_ids_tensor(self, contact_body_names):
-        env_ptr = self.envs[0]
-        actor_handle = self.humanoid_handles[0]
         body_ids = []
 
         for body_name in contact_body_names:
-            body_id = self.gym.find_actor_rigid_body_handle(env_ptr, actor_handle, body_name)
-            assert(body_id != -1)
-            body_ids.append(body_id)
+            body_ids.append(self._find_body_id(body_name))
 
         body_ids = to_torch(body_ids, device=self.device, dtype=torch.long)
         return body_ids
+
+    def _find_body_id(self, body_name):
+        if (self._kinematic):
+            assert body_name in self._kinematic_body_names, f"{body_name} is not a body of the kinematic humanoid"
+            return self._kinematic_body_names.index(body_name)
+
+        body_id = self.gym.find_actor_rigid_body_handle(self.envs[0], self.humanoid_handles[0], body_name)
+        assert(body_id != -1)
+        return body_id
     
     def _init_camera(self):
         self.gym.refresh_actor_root_state_tensor(self.sim)
@@ -598,52 +734,41 @@ def compute_humanoid_reward(obs_buf):
     return reward
 
 @torch.jit.script
-def compute_humanoid_observations(body_pos, body_rot, body_vel, body_ang_vel, local_root_obs, root_height_obs, contact_forces, contact_body_ids):
-    # type: (Tensor, Tensor, Tensor, Tensor, bool, bool, Tensor, Tensor) -> Tensor
+def compute_humanoid_observations(body_pos, body_rot, body_vel, body_ang_vel, heading_rot_inv, local_root_obs, root_height_obs, contact_forces, contact_body_ids, out):
+    # type: (Tensor, Tensor, Tensor, Tensor, Tensor, bool, bool, Tensor, Tensor, Tensor) -> Tensor
+    # writes [root_h, local_body_pos, local_body_rot, local_body_vel, local_body_ang_vel, body_contact] into out
+    num_bodies = body_pos.shape[1]
+    pos_end = 1 + (num_bodies - 1) * 3
+    rot_end = pos_end + num_bodies * 6
+    vel_end = rot_end + num_bodies * 3
+    ang_vel_end = vel_end + num_bodies * 3
+
     root_pos = body_pos[:, 0, :]
     root_rot = body_rot[:, 0, :]
 
     root_h = root_pos[:, 2:3]
-    heading_rot = torch_utils.calc_heading_quat_inv(root_rot)
     
     if (not root_height_obs):
-        root_h_obs = torch.zeros_like(root_h)
+        out[:, 0:1] = 0.
     else:
-        root_h_obs = root_h
-    
-    heading_rot_expand = heading_rot.unsqueeze(-2)
-    heading_rot_expand = heading_rot_expand.repeat((1, body_pos.shape[1], 1))
-    flat_heading_rot = heading_rot_expand.reshape(heading_rot_expand.shape[0] * heading_rot_expand.shape[1], 
-                                               heading_rot_expand.shape[2])
+        out[:, 0:1] = root_h
     
-    root_pos_expand = root_pos.unsqueeze(-2)
-    local_body_pos = body_pos - root_pos_expand
-    flat_local_body_pos = local_body_pos.reshape(local_body_pos.shape[0] * local_body_pos.shape[1], local_body_pos.shape[2])
-    flat_local_body_pos = quat_rotate(flat_heading_rot, flat_local_body_pos)
-    local_body_pos = flat_local_body_pos.reshape(local_body_pos.shape[0], local_body_pos.shape[1] * local_body_pos.shape[2])
-    local_body_pos = local_body_pos[..., 3:] # remove root pos
-
-    flat_body_rot = body_rot.reshape(body_rot.shape[0] * body_rot.shape[1], body_rot.shape[2])
-    flat_local_body_rot = quat_mul(flat_heading_rot, flat_body_rot)
-    flat_local_body_rot_obs = torch_utils.quat_to_tan_norm(flat_local_body_rot)
-    local_body_rot_obs = flat_local_body_rot_obs.reshape(body_rot.shape[0], body_rot.shape[1] * flat_local_body_rot_obs.shape[1])
+    num_envs = body_pos.shape[0]
+    local_body_pos, local_body_vel, local_body_ang_vel = torch_utils.to_local_heading_frame(heading_rot_inv, root_pos, body_pos, body_vel, body_ang_vel)
+    out[:, 1:pos_end] = local_body_pos[:, 1:].reshape(num_envs, -1) # remove root pos
+
+    local_body_rot = torch_utils.quat_mul_broadcast(heading_rot_inv.unsqueeze(-2), body_rot)
+    flat_local_body_rot_obs = torch_utils.quat_to_tan_norm(local_body_rot.reshape(num_envs * num_bodies, 4))
+    out[:, pos_end:rot_end] = flat_local_body_rot_obs.reshape(num_envs, num_bodies * 6)
     
     if (local_root_obs):
-        root_rot_obs = torch_utils.quat_to_tan_norm(root_rot)
-        local_body_rot_obs[..., 0:6] = root_rot_obs
+        out[:, pos_end:pos_end + 6] = torch_utils.quat_to_tan_norm(root_rot)
 
-    flat_body_vel = body_vel.reshape(body_vel.shape[0] * body_vel.shape[1], body_vel.shape[2])
-    flat_local_body_vel = quat_rotate(flat_heading_rot, flat_body_vel)
-    local_body_vel = flat_local_body_vel.reshape(body_vel.shape[0], body_vel.shape[1] * body_vel.shape[2])
-    
-    flat_body_ang_vel = body_ang_vel.reshape(body_ang_vel.shape[0] * body_ang_vel.shape[1], body_ang_vel.shape[2])
-    flat_local_body_ang_vel = quat_rotate(flat_heading_rot, flat_body_ang_vel)
-    local_body_ang_vel = flat_local_body_ang_vel.reshape(body_ang_vel.shape[0], body_ang_vel.shape[1] * body_ang_vel.shape[2])
+    out[:, rot_end:vel_end] = local_body_vel.reshape(num_envs, -1)
+    out[:, vel_end:ang_vel_end] = local_body_ang_vel.reshape(num_envs, -1)
 
-    body_contact_buf = contact_forces[:, contact_body_ids, :].clone().view(contact_forces.shape[0],-1)
-    
-    obs = torch.cat((root_h_obs, local_body_pos, local_body_rot_obs, local_body_vel, local_body_ang_vel, body_contact_buf), dim=-1)
-    return obs
+    out[:, ang_vel_end:] = contact_forces[:, contact_body_ids, :].reshape(contact_forces.shape[0], -1)
+    return out
 
 @torch.jit.script
 def compute_humanoid_reset(reset_buf, progress_buf, rigid_body_pos,
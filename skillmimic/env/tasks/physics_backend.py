@@ -0,0 +1,232 @@
+import torch
+
+from projects.SkillMimicLab.skillmimic.utils import torch_utils
+
+
+class PhysicsBackend:
+    # The simulator tensor API the tasks step through. A backend owns flat state buffers laid out like the
+    # Isaac Gym tensors:
+    #   root_states       [num_envs * actors_per_env, 13]  position, rotation (xyzw), linear and angular velocity
+    #   dof_state         [num_envs * dofs_per_env, 2]     position, velocity
+    #   rigid_body_state  [num_envs * bodies_per_env, 13]  same columns as root_states
+    #   contact_forces    [num_envs * bodies_per_env, 3]   net contact force on every body
+    # The tasks keep views of them (_root_states, _dof_state, _rigid_body_pos, _contact_forces, ...), so a backend
+    # updates them in place and never rebinds them.
+
+    def refresh(self):
+        # reads the simulated state back into the buffers
+        raise NotImplementedError
+
+    def set_root_states(self, actor_ids=None):
+        # pushes the rows of actor_ids (int32, all actors if None) of root_states into the simulation
+        raise NotImplementedError
+
+    def set_dof_states(self, actor_ids=None):
+        raise NotImplementedError
+
+    def set_dof_position_targets(self, targets):
+        # [num_envs, num_dofs] PD targets of the next simulate()
+        raise NotImplementedError
+
+    def set_dof_actuation_forces(self, forces):
+        raise NotImplementedError
+
+    def simulate(self):
+        raise NotImplementedError
+
+    def fetch_results(self):
+        # waits for simulate() to finish, the CPU pipeline needs it before reading the buffers
+        return
+
+
+class GymBackend(PhysicsBackend):
+    # Isaac Gym, the buffers wrap the simulator's GPU state tensors
+
+    def __init__(self, gym, sim):
+        from isaacgym import gymtorch
+        self._gymtorch = gymtorch
+        self.gym = gym
+        self.sim = sim
+
+        self.root_states = gymtorch.wrap_tensor(self.gym.acquire_actor_root_state_tensor(self.sim))
+        self.dof_state = gymtorch.wrap_tensor(self.gym.acquire_dof_state_tensor(self.sim))
+        self.rigid_body_state = gymtorch.wrap_tensor(self.gym.acquire_rigid_body_state_tensor(self.sim))
+        self.contact_forces = gymtorch.wrap_tensor(self.gym.acquire_net_contact_force_tensor(self.sim))
+        return
+
+    def refresh(self):
+        self.gym.refresh_dof_state_tensor(self.sim)
+        self.gym.refresh_actor_root_state_tensor(self.sim)
+        self.gym.refresh_rigid_body_state_tensor(self.sim)
+        self.gym.refresh_net_contact_force_tensor(self.sim)
+        return
+
+    def set_root_states(self, actor_ids=None):
+        if (actor_ids is None):
+            self.gym.set_actor_root_state_tensor(self.sim, self._gymtorch.unwrap_tensor(self.root_states))
+        else:
+            self.gym.set_actor_root_state_tensor_indexed(self.sim, self._gymtorch.unwrap_tensor(self.root_states),
+                                                         self._gymtorch.unwrap_tensor(actor_ids), len(actor_ids))
+        return
+
+    def set_dof_states(self, actor_ids=None):
+        if (actor_ids is None):
+            self.gym.set_dof_state_tensor(self.sim, self._gymtorch.unwrap_tensor(self.dof_state))
+        else:
+            self.gym.set_dof_state_tensor_indexed(self.sim, self._gymtorch.unwrap_tensor(self.dof_state),
+                                                  self._gymtorch.unwrap_tensor(actor_ids), len(actor_ids))
+        return
+
+    def set_dof_position_targets(self, targets):
+        self.gym.set_dof_position_target_tensor(self.sim, self._gymtorch.unwrap_tensor(targets))
+        return
+
+    def set_dof_actuation_forces(self, forces):
+        self.gym.set_dof_actuation_force_tensor(self.sim, self._gymtorch.unwrap_tensor(forces))
+        return
+
+    def simulate(self):
+        self.gym.simulate(self.sim)
+        return
+
+    def fetch_results(self):
+        self.gym.fetch_results(self.sim, True)
+        return
+
+
+class KinematicBackend(PhysicsBackend):
+    # Pure torch stand-in for the simulator, so the task step can run and be profiled on a CPU. It is not physics:
+    #   - the DOFs follow the PD targets with a first order response (or integrate the actuation forces),
+    #   - the humanoid root moves with its velocities, without gravity, so episodes end on their length,
+    #   - body b of the humanoid sits at body_offsets[b] from the root, turned by the root and by the DOFs of
+    #     joint b - 1 read as an exponential map (a star skeleton),
+    #   - every other actor (the ball, projectiles) is one rigid body that falls, bounces off the ground and is
+    #     pushed by the humanoid bodies it overlaps,
+    #   - contact forces are penalty forces of the ground and of body / object overlaps.
+    # The initial state comes from the task's reset, e.g. the reference state of SkillMimicBallPlay, so a step
+    # perturbs the reference pose by the policy actions.
+
+    def __init__(self, num_envs, actors_per_env, num_dofs, num_bodies, device, dt, body_offsets=None,
+                 dof_response=20., body_radius=0.05, object_radius=0.12, contact_stiffness=1000., restitution=0.8):
+        self.num_envs = num_envs
+        self.actors_per_env = actors_per_env
+        self.num_dofs = num_dofs
+        self.num_bodies = num_bodies
+        self.device = device
+        self.dt = dt
+        self.dof_response = dof_response
+        self.body_radius = body_radius
+        self.object_radius = object_radius
+        self.contact_stiffness = contact_stiffness
+        self.restitution = restitution
+        self.gravity = torch.tensor([0., 0., -9.81], device=self.device)
+
+        num_objects = actors_per_env - 1
+        bodies_per_env = num_bodies + num_objects
+        self.root_states = torch.zeros((num_envs * actors_per_env, 13), device=self.device, dtype=torch.float)
+        self.root_states[:, 6] = 1
+        self.dof_state = torch.zeros((num_envs * num_dofs, 2), device=self.device, dtype=torch.float)
+        self.rigid_body_state = torch.zeros((num_envs * bodies_per_env, 13), device=self.device, dtype=torch.float)
+        self.contact_forces = torch.zeros((num_envs * bodies_per_env, 3), device=self.device, dtype=torch.float)
+
+        actor_states = self.root_states.view(num_envs, actors_per_env, 13)
+        self._humanoid_states = actor_states[:, 0]
+        self._object_states = actor_states[:, 1:]
+        self._dof_pos = self.dof_state.view(num_envs, num_dofs, 2)[..., 0]
+        self._dof_vel = self.dof_state.view(num_envs, num_dofs, 2)[..., 1]
+        body_states = self.rigid_body_state.view(num_envs, bodies_per_env, 13)
+        self._body_states = body_states[:, :num_bodies]
+        self._object_body_states = body_states[:, num_bodies:]
+        body_forces = self.contact_forces.view(num_envs, bodies_per_env, 3)
+        self._body_forces = body_forces[:, :num_bodies]
+        self._object_forces = body_forces[:, num_bodies:]
+
+        if (body_offsets is None):
+            # a fixed, roughly upright point cloud below and above the root
+            generator = torch.Generator().manual_seed(0)
+            body_offsets = torch.randn((num_bodies, 3), generator=generator) * 0.15
+            body_offsets[:, 2] += torch.linspace(0.5, -0.8, num_bodies)
+            body_offsets[0] = 0
+        self._body_offsets = torch.as_tensor(body_offsets, dtype=torch.float).to(self.device).unsqueeze(-2)
+        # the DOFs of joint b - 1 turn body b when they come in triplets, one per body but the root
+        self._joint_dofs = (num_dofs == 3 * (num_bodies - 1))
+
+        self._dof_targets = torch.zeros((num_envs, num_dofs), device=self.device, dtype=torch.float)
+        self._dof_forces = torch.zeros((num_envs, num_dofs), device=self.device, dtype=torch.float)
+        self._pd_control = True
+        return
+
+    def refresh(self):
+        root_pos = self._humanoid_states[:, 0:3]
+        root_rot = self._humanoid_states[:, 3:7]
+        root_vel = self._humanoid_states[:, 7:10]
+        root_ang_vel = self._humanoid_states[:, 10:13]
+
+        body_rot = root_rot.unsqueeze(-2).expand(-1, self.num_bodies, -1)
+        if (self._joint_dofs):
+            joint_rot = torch_utils.exp_map_to_quat(self._dof_pos.view(self.num_envs, self.num_bodies - 1, 3))
+            body_rot = torch.cat([body_rot[:, :1], torch_utils.quat_mul_broadcast(root_rot.unsqueeze(-2), joint_rot)], dim=1)
+        body_offsets = torch_utils.quat_rotate_broadcast(body_rot.unsqueeze(-2), self._body_offsets.expand(self.num_envs, -1, -1, -1)).squeeze(-2)
+
+        self._body_states[..., 0:3] = root_pos.unsqueeze(-2) + body_offsets
+        self._body_states[..., 3:7] = body_rot
+        self._body_states[..., 7:10] = root_vel.unsqueeze(-2) + torch.cross(root_ang_vel.unsqueeze(-2).expand_as(body_offsets), body_offsets, dim=-1)
+        self._body_states[..., 10:13] = root_ang_vel.unsqueeze(-2)
+        self._object_body_states[:] = self._object_states
+
+        # penalty forces: the ground pushes up what sinks below its radius, overlapping bodies and objects
+        # push each other apart along the line between their centers
+        body_pos = self._body_states[..., 0:3]
+        object_pos = self._object_states[..., 0:3]
+        self._body_forces.zero_()
+        self._body_forces[..., 2] = self.contact_stiffness * torch.clamp(self.body_radius - body_pos[..., 2], min=0)
+        self._object_forces.zero_()
+        self._object_forces[..., 2] = self.contact_stiffness * torch.clamp(self.object_radius - object_pos[..., 2], min=0)
+
+        offsets = object_pos.unsqueeze(-2) - body_pos.unsqueeze(-3) # [num_envs, num_objects, num_bodies, 3]
+        dist = torch.norm(offsets, dim=-1, keepdim=True)
+        overlap = torch.clamp(self.body_radius + self.object_radius - dist, min=0)
+        push = self.contact_stiffness * overlap * offsets / dist.clamp(min=1e-6)
+        self._object_forces += push.sum(dim=-2)
+        self._body_forces -= push.sum(dim=-3)
+        return
+
+    def set_root_states(self, actor_ids=None):
+        # the tasks write into root_states directly, refresh() derives the bodies from it
+        return
+
+    def set_dof_states(self, actor_ids=None):
+        return
+
+    def set_dof_position_targets(self, targets):
+        self._dof_targets[:] = targets
+        self._pd_control = True
+        return
+
+    def set_dof_actuation_forces(self, forces):
+        self._dof_forces[:] = forces
+        self._pd_control = False
+        return
+
+    def simulate(self):
+        dt = self.dt
+        if (self._pd_control):
+            self._dof_vel[:] = (self._dof_targets - self._dof_pos) * self.dof_response
+        else:
+            self._dof_vel += self._dof_forces * dt
+        self._dof_pos += self._dof_vel * dt
+
+        root_rot = self._humanoid_states[:, 3:7]
+        self._humanoid_states[:, 0:3] += self._humanoid_states[:, 7:10] * dt
+        root_rot[:] = torch_utils.quat_unit(torch_utils.quat_mul_broadcast(
+            torch_utils.exp_map_to_quat(self._humanoid_states[:, 10:13] * dt), root_rot))
+
+        # objects of unit mass under gravity and the contact forces of the last refresh(), bouncing off the ground
+        object_vel = self._object_states[..., 7:10]
+        object_pos = self._object_states[..., 0:3]
+        object_vel += (self.gravity + self._object_forces) * dt
+        object_pos += object_vel * dt
+        bounce = (object_pos[..., 2] < self.object_radius) & (object_vel[..., 2] < 0)
+        object_vel[..., 2] = torch.where(bounce, -self.restitution * object_vel[..., 2], object_vel[..., 2])
+        object_pos[..., 2] = torch.clamp(object_pos[..., 2], min=self.object_radius)
+        return
@@ -2,7 +2,7 @@ from enum import Enum
 import numpy as np
 import torch
 from torch import Tensor
-from typing import Tuple
+from typing import Tuple, Dict
 import glob, os, random
 #from isaacgym import gymtorch
 #from isaacgym import gymapi
@@ -12,6 +12,10 @@ from datetime import datetime
 
 from projects.SkillMimicLab.skillmimic.utils import torch_utils
 from projects.SkillMimicLab.skillmimic.utils.motion_data_handler import MotionDataHandler
+from projects.SkillMimicLab.skillmimic.utils.obs_history import ObsHistory
+from projects.SkillMimicLab.skillmimic.utils.metrics import BODY_CONTACT_IDS, compute_evaluation_metrics
+from projects.SkillMimicLab.skillmimic.utils.metrics_accumulator import MetricsAccumulator
+from projects.SkillMimicLab.skillmimic.utils.hoi_layout import build_hoi_layout, check_hoi_layout, hoi_field
 from projects.SkillMimicLab.skillmimic.data.cfg.skillmimic_cfg import SkillmimiceEnvCfg
 
 from env.tasks.humanoid_object_task import HumanoidWholeBodyWithObject
@@ -39,6 +43,7 @@ class SkillMimicBallPlay(HumanoidWholeBodyWithObject):
         self.isTest = cfg.args.test
 
         self.condition_size = 64
+        self._reward_fn = build_reward_fn(cfg.env.get("rewardCompile", "eager"))
 
         super().__init__(cfg, **kwargs
                          #cfg=cfg,
@@ -49,22 +54,40 @@ class SkillMimicBallPlay(HumanoidWholeBodyWithObject):
                          #headless=headless
                          )
         
-        self.ref_hoi_obs_size = 323 + len(self.cfg["env"]["keyBodies"])*3 + 6 #V1
+        # columns of the simulated and reference HOI vectors, the kernels take _hoi_offsets
+        self._hoi_layout = build_hoi_layout(self.num_dof, len(self.cfg.env["keyBodies"]))
+        self._hoi_offsets = self._hoi_layout.offsets()
+        self.ref_hoi_obs_size = self._hoi_layout.size #V1
         
         self._load_motion(self.motion_file) #ZC1
+        check_hoi_layout(self._hoi_layout, self._motion_data.hoi_layout, self._motion_data.motion_bank['hoi_data'])
+
+        # evaluation metrics summed on the device per env, motion and skill, see get_metrics_report
+        self._metrics = None
+        if self.cfg.env.get("trackMetrics", False):
+            self._metrics = MetricsAccumulator(self.num_envs, self._motion_data.motion_class, self.device,
+                                               success_accuracy=self.cfg.env.get("metricsSuccessAccuracy", 0.5),
+                                               motion_names=self._motion_data.motion_names)
+        # envs whose frames are scored, and the (motion_id, start_frame) of every env while an offline evaluation
+        # drives the resets, see set_eval_starts
+        self._metrics_active = torch.ones(self.num_envs, device=self.device, dtype=torch.bool)
+        self._eval_starts = None
 
         self._curr_ref_obs = torch.zeros((self.num_envs, self.ref_hoi_obs_size), device=self.device, dtype=torch.float)
         self._hist_ref_obs = torch.zeros((self.num_envs, self.ref_hoi_obs_size), device=self.device, dtype=torch.float)
-        self._curr_obs = torch.zeros((self.num_envs, self.ref_hoi_obs_size), device=self.device, dtype=torch.float)
-        self._hist_obs = torch.zeros((self.num_envs, self.ref_hoi_obs_size), device=self.device, dtype=torch.float)
+        # simulated HOI obs of the current and previous steps, for the imitation reward
+        self._hoi_obs_hist = ObsHistory(self.num_envs, self.ref_hoi_obs_size, self.cfg.env.get("hoiObsHistLength", 2),
+                                        device=self.device, dtype=torch.float)
         self._tar_pos = torch.zeros([self.num_envs, 3], device=self.device, dtype=torch.float)
+        self._body_contact_ids = torch.tensor(BODY_CONTACT_IDS, device=self.device, dtype=torch.long)
         
-        # get the label of the skill
-        skill_number = int(os.listdir(self.motion_file)[0].split('_')[0])
+        # get the label of the skill, from the <skill>_ prefix of the clip names
+        skill_number = int(self._motion_data.motion_names[0].split('_')[0])
         self.hoi_data_label_batch = torch.nn.functional.one_hot(torch.tensor(skill_number), num_classes=self.condition_size).repeat(self.num_envs,1).to(self.device)
         # self.hoi_data_label_batch = torch.zeros([self.num_envs, self.condition_size], device=self.device, dtype=torch.float)
 
-        self._subscribe_events_for_change_condition()
+        if self.viewer:
+            self._subscribe_events_for_change_condition()
 
         self.envid2motid = torch.zeros(self.num_envs, device=self.device, dtype=torch.long) #{}
         # self.envid2episode_lengths = torch.zeros(self.num_envs, device=self.device, dtype=torch.long)
@@ -84,77 +107,109 @@ class SkillMimicBallPlay(HumanoidWholeBodyWithObject):
     def post_physics_step(self):
         self._update_condition()
         
-        # extra calc of self._curr_obs, for imitation reward
-        self._compute_hoi_observations()
+        # extra calc of self._hoi_obs_hist.current, for imitation reward
+        with self._profiler.phase("hoi_obs"):
+            self._run_captured("hoi_obs", self._compute_hoi_observations)
 
         super().post_physics_step()
 
-        # self._compute_hoi_observations()
         self._update_hist_hoi_obs()
 
         return
 
     def _update_hist_hoi_obs(self, env_ids=None):
-        self._hist_obs = self._curr_obs.clone()
+        # the current frame becomes previous, the next step (or a reset in between) writes the new current frame
+        # in place. As _hist_obs was, previous stays the last frame before a reset
+        self._hoi_obs_hist.advance()
         return
 
+    def _capture_phase(self):
+        # the views of _hoi_obs_hist move every step, each ring position gets its own recording
+        return self._hoi_obs_hist.head
+
     def get_obs_size(self):
         obs_size = super().get_obs_size()
         
         obs_size += self.condition_size
         return obs_size
 
+    def _build_obs_layout(self):
+        layout = super()._build_obs_layout()
+        layout.add("condition", self.condition_size)
+        return layout
+
     def get_task_obs_size(self):
         return 0
     
     def _compute_observations(self, env_ids=None): # called @ reset & post step
-        obs = None
-        humanoid_obs = self._compute_humanoid_obs(env_ids)
-        obs = humanoid_obs
-
-        obj_obs = self._compute_obj_obs(env_ids)
-        obs = torch.cat([obs, obj_obs], dim=-1)
+        obs = self._get_obs_out(env_ids)
+        self._compute_humanoid_obs(env_ids, out=self._obs_layout.view(obs, "humanoid"))
+        self._compute_obj_obs(env_ids, out=self._obs_layout.view(obs, "obj"))
 
         if self._enable_task_obs:
-            task_obs = self.compute_task_obs(env_ids)
-            obs = torch.cat([obs, task_obs], dim = -1)
+            self._obs_layout.view(obs, "task")[:] = self.compute_task_obs(env_ids)
         # print("kkkkkkkkkkkkkk",self.hoi_data_label_batch)
         if (env_ids is None): #Z
-            textemb_batch = self.hoi_data_label_batch
-            obs = torch.cat((obs,textemb_batch),dim=-1)
-            self.obs_buf[:] = obs
-            env_ids = torch.arange(self.num_envs)
+            self._obs_layout.view(obs, "condition")[:] = self.hoi_data_label_batch
+            env_ids = torch.arange(self.num_envs, device=self.device)
             ts = self.progress_buf.clone() #self.progress_buf[0].clone()
-            self._curr_ref_obs = self.hoi_data_batch[env_ids,ts].clone() #ZC0
+            self._curr_ref_obs[:] = self._get_ref_obs(env_ids, ts) #ZC0
 
         else:
-            textemb_batch = self.hoi_data_label_batch[env_ids]
-            obs = torch.cat((obs,textemb_batch),dim=-1)
+            self._obs_layout.view(obs, "condition")[:] = self.hoi_data_label_batch[env_ids]
             self.obs_buf[env_ids] = obs
 
             ts = self.progress_buf[env_ids].clone() #self.progress_buf[env_ids][0].clone()
-            self._curr_ref_obs[env_ids] = self.hoi_data_batch[env_ids,ts].clone() #ZC0
+            self._curr_ref_obs[env_ids] = self._get_ref_obs(env_ids, ts) #ZC0
 
         return
 
+    def _get_ref_obs(self, env_ids, ts):
+        if self._ref_obs_on_demand:
+            return self._motion_data.get_ref_obs(env_ids, ts)
+        return self.hoi_data_batch[env_ids,ts]
+
     def _compute_reset(self):
         self.reset_buf[:], self._terminate_buf[:] = compute_humanoid_reset(self.reset_buf, self.progress_buf,
                                                    self._contact_forces,
                                                    self._rigid_body_pos, self.max_episode_length,
                                                    self._enable_early_termination, self._termination_heights, 
-                                                   self._curr_ref_obs, self._curr_obs, self._motion_data.envid2episode_lengths,
-                                                   self.isTest, self.cfg["env"]["episodeLength"]
+                                                   self._curr_ref_obs, self._hoi_obs_hist.current, self._motion_data.envid2episode_lengths,
+                                                   self.isTest, self.cfg.env["episodeLength"]
                                                    )
         return
     
+    def _compute_metrics(self):
+        if (self._metrics is None):
+            return
+        metrics = compute_evaluation_metrics(self._curr_ref_obs, self._hoi_obs_hist.current, self._contact_forces,
+                                             self._body_contact_ids, self._tar_contact_forces, self._hoi_offsets)
+        # frames past the end of the reference are zero rows, they are not scored
+        self._metrics.update(metrics, mask=(self.progress_buf < self._motion_data.envid2episode_lengths) & self._metrics_active)
+        return
+
+    def set_eval_starts(self, motion_ids, start_frames):
+        # the next resets start every env from its given motion and frame instead of sampling them, None goes back
+        # to the stateInit sampling
+        if (motion_ids is None):
+            self._eval_starts = None
+        else:
+            self._eval_starts = (motion_ids.to(self.device), start_frames.to(self.device))
+        return
+
+    def get_metrics_report(self):
+        # dataset, per skill and per clip metrics of the finished episodes, see MetricsAccumulator.report
+        return self._metrics.report()
+
     def _compute_reward(self, actions):
-        self.rew_buf[:] = compute_humanoid_reward(
+        self.rew_buf[:] = self._reward_fn(
                                                   self._curr_ref_obs,
-                                                  self._curr_obs,
-                                                  self._hist_obs,
+                                                  self._hoi_obs_hist.current,
+                                                  self._hoi_obs_hist.previous,
                                                   self._contact_forces,
+                                                  self._body_contact_ids,
                                                   self._tar_contact_forces,
-                                                  len(self._key_body_ids),
+                                                  self._hoi_offsets,
                                                   self._motion_data.reward_weights
                                                   )
         return
@@ -163,16 +218,24 @@ class SkillMimicBallPlay(HumanoidWholeBodyWithObject):
     def _load_motion(self, motion_file):
         self.skill_name = motion_file.split('/')[-1] #metric
         self.max_episode_length = 60
-        if self.cfg["env"]["episodeLength"] > 0:
-            self.max_episode_length =  self.cfg["env"]["episodeLength"]
+        if self.cfg.env["episodeLength"] > 0:
+            self.max_episode_length =  self.cfg.env["episodeLength"]
 
 
-        self._motion_data = MotionDataHandler(motion_file, self.device, self._key_body_ids, self.cfg, self.num_envs, 
+        # MotionDataHandler reads the layout of the yaml cfg, cfg["env"], and the run seed get_args stores in cfg.seed
+        motion_cfg = {"env": self.cfg.env, "seed": getattr(self.cfg, "seed", -1)}
+        self._motion_data = MotionDataHandler(motion_file, self.device, self._key_body_ids, motion_cfg, self.num_envs, 
                                             self.max_episode_length, self.reward_weights_default, self.init_vel, self.play_dataset)
         
         if self.play_dataset:
             self.max_episode_length = self._motion_data.max_episode_length
-        self.hoi_data_batch = torch.zeros([self.num_envs, self.max_episode_length, self.ref_hoi_obs_size], device=self.device, dtype=torch.float)
+
+        # on demand, _curr_ref_obs is gathered from the shared motion bank every step
+        # instead of keeping a [num_envs, max_episode_length, ref_hoi_obs_size] copy of each env's window
+        self._ref_obs_on_demand = self.cfg.env.get("refObsOnDemand", False)
+        self.hoi_data_batch = None
+        if not self._ref_obs_on_demand:
+            self.hoi_data_batch = torch.zeros([self.num_envs, self.max_episode_length, self.ref_hoi_obs_size], device=self.device, dtype=torch.float)
         
         return
     
@@ -196,13 +259,18 @@ class SkillMimicBallPlay(HumanoidWholeBodyWithObject):
     def _reset_envs(self, env_ids):
         if(len(env_ids)>0): #metric
             self.reached_target[env_ids] = 0
+            if (self._metrics is not None):
+                # the episodes that end here were scored against the motions assigned at their reset
+                self._metrics.finalize(env_ids, self._motion_data.envid2motid[env_ids])
         
         super()._reset_envs(env_ids)
 
         return
 
     def _reset_actors(self, env_ids):
-        if self._state_init == -1:
+        if self._eval_starts is not None:
+            self._reset_eval_state_init(env_ids)
+        elif self._state_init == -1:
             self._reset_random_ref_state_init(env_ids) #V1 Random Ref State Init (RRSI)
         elif self._state_init >= 2:
             self._reset_deterministic_ref_state_init(env_ids)
@@ -232,11 +300,7 @@ class SkillMimicBallPlay(HumanoidWholeBodyWithObject):
 
         
 
-        self.hoi_data_batch[env_ids], \
-        self.init_root_pos[env_ids], self.init_root_rot[env_ids],  self.init_root_pos_vel[env_ids], self.init_root_rot_vel[env_ids], \
-        self.init_dof_pos[env_ids], self.init_dof_pos_vel[env_ids], \
-        self.init_obj_pos[env_ids], self.init_obj_pos_vel[env_ids], self.init_obj_rot[env_ids], self.init_obj_rot_vel[env_ids] \
-            = self._motion_data.get_initial_state(env_ids, motion_ids, motion_times)
+        self._set_initial_state(env_ids, motion_ids, motion_times)
 
         return
     
@@ -246,11 +310,24 @@ class SkillMimicBallPlay(HumanoidWholeBodyWithObject):
         motion_ids = self._motion_data.sample_motions(num_envs)
         motion_times = torch.full(motion_ids.shape, self._state_init, device=self.device, dtype=torch.int)
 
-        self.hoi_data_batch[env_ids], \
+        self._set_initial_state(env_ids, motion_ids, motion_times)
+
+        return
+
+    def _reset_eval_state_init(self, env_ids):
+        motion_ids, start_frames = self._eval_starts
+        self._set_initial_state(env_ids, motion_ids[env_ids], start_frames[env_ids])
+
+        return
+
+    def _set_initial_state(self, env_ids, motion_ids, motion_times):
+        hoi_data, \
         self.init_root_pos[env_ids], self.init_root_rot[env_ids],  self.init_root_pos_vel[env_ids], self.init_root_rot_vel[env_ids], \
         self.init_dof_pos[env_ids], self.init_dof_pos_vel[env_ids], \
         self.init_obj_pos[env_ids], self.init_obj_pos_vel[env_ids], self.init_obj_rot[env_ids], self.init_obj_rot_vel[env_ids] \
-            = self._motion_data.get_initial_state(env_ids, motion_ids, motion_times)
+            = self._motion_data.get_initial_state(env_ids, motion_ids, motion_times, return_hoi_data=not self._ref_obs_on_demand)
+        if not self._ref_obs_on_demand:
+            self.hoi_data_batch[env_ids] = hoi_data
 
         return
 
@@ -258,78 +335,73 @@ class SkillMimicBallPlay(HumanoidWholeBodyWithObject):
         key_body_pos = self._rigid_body_pos[:, self._key_body_ids, :]
 
         if (env_ids is None):
-            self._curr_obs[:] = build_hoi_observations(self._rigid_body_pos[:, 0, :],
-                                                               self._rigid_body_rot[:, 0, :],
-                                                               self._rigid_body_vel[:, 0, :],
-                                                               self._rigid_body_ang_vel[:, 0, :],
-                                                               self._dof_pos, self._dof_vel, key_body_pos,
-                                                               self._local_root_obs, self._root_height_obs, 
-                                                               self._dof_obs_size, self._target_states,
-                                                               self._hist_obs,
-                                                               self.progress_buf)
+            build_hoi_observations(self._rigid_body_pos[:, 0, :],
+                                   self._rigid_body_rot[:, 0, :],
+                                   self._rigid_body_vel[:, 0, :],
+                                   self._rigid_body_ang_vel[:, 0, :],
+                                   self._dof_pos, self._dof_vel, key_body_pos,
+                                   self._local_root_obs, self._root_height_obs, 
+                                   self._dof_obs_size, self._target_states,
+                                   self._hoi_obs_hist.previous,
+                                   self.progress_buf, self._hoi_offsets, self._hoi_obs_hist.current)
         else:
-            self._curr_obs[env_ids] = build_hoi_observations(self._rigid_body_pos[env_ids][:, 0, :],
+            out = torch.empty((len(env_ids), self.ref_hoi_obs_size), device=self.device, dtype=torch.float)
+            self._hoi_obs_hist.current[env_ids] = build_hoi_observations(self._rigid_body_pos[env_ids][:, 0, :],
                                                                    self._rigid_body_rot[env_ids][:, 0, :],
                                                                    self._rigid_body_vel[env_ids][:, 0, :],
                                                                    self._rigid_body_ang_vel[env_ids][:, 0, :],
                                                                    self._dof_pos[env_ids], self._dof_vel[env_ids], key_body_pos[env_ids],
                                                                    self._local_root_obs, self._root_height_obs, 
                                                                    self._dof_obs_size, self._target_states[env_ids],
-                                                                   self._hist_obs[env_ids],
-                                                                   self.progress_buf[env_ids])
+                                                                   self._hoi_obs_hist.previous[env_ids],
+                                                                   self.progress_buf[env_ids], self._hoi_offsets, out)
         
         return
     
     def _update_condition(self):
         for evt in self.evts:
             if evt.action.isdigit() and evt.value > 0:
-                self.hoi_data_label_batch = torch.nn.functional.one_hot(torch.tensor(int(evt.action)).to("cuda"), num_classes=self.condition_size).repeat(self.hoi_data_label_batch.shape[0],1)
+                self.hoi_data_label_batch[:] = torch.nn.functional.one_hot(torch.tensor(int(evt.action)), num_classes=self.condition_size)
             
     def play_dataset_step(self, time): #Z12
 
         t = time
 
-        for env_id, env_ptr in enumerate(self.envs):
-            # t += self.envid2idt[env_id]
+        ### gather the reference frame of every env from the motion bank ###
+        frames = self._motion_data.get_frame_ids(self.envid2motid, t)
+        motion_bank = self._motion_data.motion_bank
 
-            ### update object ###
-            motid = self.envid2motid[env_id].item()
-            self._target_states[env_id, :3] = self._motion_data.hoi_data_dict[motid]['obj_pos'][t,:]
-            self._target_states[env_id, 3:7] = self._motion_data.hoi_data_dict[motid]['obj_rot'][t,:]
-            self._target_states[env_id, 7:10] = torch.zeros_like(self._target_states[env_id, 7:10])
-            self._target_states[env_id, 10:13] = torch.zeros_like(self._target_states[env_id, 10:13])
-
-            ### update subject ###   
-            _humanoid_root_pos = self._motion_data.hoi_data_dict[motid]['root_pos'][t,:].clone()
-            _humanoid_root_rot = self._motion_data.hoi_data_dict[motid]['root_rot'][t,:].clone()
-            self._humanoid_root_states[env_id, 0:3] = _humanoid_root_pos
-            self._humanoid_root_states[env_id, 3:7] = _humanoid_root_rot
-            self._humanoid_root_states[env_id, 7:10] = torch.zeros_like(self._humanoid_root_states[env_id, 7:10])
-            self._humanoid_root_states[env_id, 10:13] = torch.zeros_like(self._humanoid_root_states[env_id, 10:13])
-            
-            self._dof_pos[env_id] = self._motion_data.hoi_data_dict[motid]['dof_pos'][t,:].clone()
-            # self._dof_pos[:,108:156] = 0
-            self._dof_vel[env_id] = torch.zeros_like(self._dof_vel[env_id])
+        ### update object ###
+        self._target_states[:, :3] = motion_bank['obj_pos'][frames]
+        self._target_states[:, 3:7] = motion_bank['obj_rot'][frames]
+        self._target_states[:, 7:10] = 0
+        self._target_states[:, 10:13] = 0
 
-            # env_id_int32 = self._humanoid_actor_ids[env_id].unsqueeze(0)
+        ### update subject ###
+        self._humanoid_root_states[:, 0:3] = motion_bank['root_pos'][frames]
+        self._humanoid_root_states[:, 3:7] = motion_bank['root_rot'][frames]
+        self._humanoid_root_states[:, 7:10] = 0
+        self._humanoid_root_states[:, 10:13] = 0
 
+        self._dof_pos[:] = motion_bank['dof_pos'][frames]
+        # self._dof_pos[:,108:156] = 0
+        self._dof_vel[:] = 0
 
+        obj_contact = torch.any(motion_bank['contact'][frames] > 0.1, dim=-1).cpu().numpy()
+        # angle, _ = torch_utils.exp_map_to_angle_axis(root_rot_vel)
+        angle = torch.norm(motion_bank['root_rot_vel'][frames].float(), dim=-1)
+        abnormal = (torch.abs(angle) > 5.).cpu().numpy() #Z
+        angle = angle.cpu().numpy()
 
-            contact = self._motion_data.hoi_data_dict[motid]['contact'][t,:]
-            obj_contact = torch.any(contact > 0.1, dim=-1)
-            root_rot_vel = self._motion_data.hoi_data_dict[motid]['root_rot_vel'][t,:]
-            # angle, _ = torch_utils.exp_map_to_angle_axis(root_rot_vel)
-            angle = torch.norm(root_rot_vel)
-            abnormal = torch.any(torch.abs(angle) > 5.) #Z
+        for env_id, env_ptr in enumerate(self.envs):
+            # t += self.envid2idt[env_id]
 
-            if abnormal == True:
-                print("frame:", t, "abnormal:", abnormal, "angle", angle)
-                # print(" ", self._motion_data.hoi_data_dict[motid]['root_rot_vel'][t])
-                # print(" ", angle)
+            if abnormal[env_id] == True:
+                print("frame:", t, "abnormal:", abnormal[env_id], "angle", angle[env_id])
                 self.show_abnorm[env_id] = 10
 
             handle = self._target_handles[env_id]
-            if obj_contact == True:
+            if obj_contact[env_id] == True:
                 # print(t, "contact")
                 self.gym.set_rigid_body_color(env_ptr, handle, 0, gymapi.MESH_VISUAL,
                                             gymapi.Vec3(1., 0., 0.))
@@ -337,7 +409,7 @@ class SkillMimicBallPlay(HumanoidWholeBodyWithObject):
                 self.gym.set_rigid_body_color(env_ptr, handle, 0, gymapi.MESH_VISUAL,
                                             gymapi.Vec3(0., 1., 0.))
             
-            if abnormal == True or self.show_abnorm[env_id] > 0: #Z
+            if abnormal[env_id] == True or self.show_abnorm[env_id] > 0: #Z
                 for j in range(self.num_bodies): #Z humanoid_handle == 0
                     self.gym.set_rigid_body_color(env_ptr, 0, j, gymapi.MESH_VISUAL, gymapi.Vec3(0., 0., 1.)) 
                 self.show_abnorm[env_id] -= 1
@@ -345,12 +417,13 @@ class SkillMimicBallPlay(HumanoidWholeBodyWithObject):
                 for j in range(self.num_bodies): #Z humanoid_handle == 0
                     self.gym.set_rigid_body_color(env_ptr, 0, j, gymapi.MESH_VISUAL, gymapi.Vec3(0., 1., 0.)) 
       
-        self.gym.set_actor_root_state_tensor(self.sim, gymtorch.unwrap_tensor(self._root_states))
-        self.gym.set_dof_state_tensor(self.sim, gymtorch.unwrap_tensor(self._dof_state))
+        self._physics.set_root_states()
+        self._physics.set_dof_states()
         self._refresh_sim_tensors()     
+        self._update_heading_frame()
 
         self.render(t=time)
-        self.gym.simulate(self.sim)
+        self._physics.simulate()
 
         self._compute_observations()
 
@@ -362,11 +435,13 @@ class SkillMimicBallPlay(HumanoidWholeBodyWithObject):
 
         self.gym.clear_lines(self.viewer)
 
-        starts = self._motion_data.hoi_data_dict[0]['hoi_data'][t, :3]
+        frame = self._motion_data.get_frame_ids(0, t)
+        starts = self._motion_data.motion_bank['hoi_data'][frame, :3].float()
+        key_body_pos = self._motion_data.motion_bank['key_body_pos'][frame].float()
 
         for i, env_ptr in enumerate(self.envs):
             for j in range(len(self._key_body_ids)):
-                vec = self._motion_data.hoi_data_dict[0]['key_body_pos'][t, j*3:j*3+3]
+                vec = key_body_pos[j*3:j*3+3]
                 vec = torch.cat([starts, vec], dim=-1).cpu().numpy().reshape([1, 6])
                 self.gym.add_lines(self.viewer, env_ptr, 1, vec, cols)
 
@@ -416,7 +491,8 @@ class SkillMimicBallPlay(HumanoidWholeBodyWithObject):
 
 # @torch.jit.script
 def build_hoi_observations(root_pos, root_rot, root_vel, root_ang_vel, dof_pos, dof_vel, key_body_pos, 
-                           local_root_obs, root_height_obs, dof_obs_size, target_states, hist_obs, progress_buf):
+                           local_root_obs, root_height_obs, dof_obs_size, target_states, hist_obs, progress_buf, hoi_layout, out):
+    # every field is written into its hoi_layout columns of out
 
     ## diffvel, set 0 for the first frame
     # hist_dof_pos = hist_obs[:,6:6+156]
@@ -425,44 +501,52 @@ def build_hoi_observations(root_pos, root_rot, root_vel, root_ang_vel, dof_pos,
 
     dof_vel = dof_vel*(progress_buf!=1).unsqueeze(dim=-1)
 
-    contact = torch.zeros(key_body_pos.shape[0],1,device=dof_vel.device)
-    obs = torch.cat((root_pos, torch_utils.quat_to_exp_map(root_rot), dof_pos, dof_vel, target_states[:,:10], key_body_pos.contiguous().view(-1,key_body_pos.shape[1]*key_body_pos.shape[2]), contact), dim=-1)
-    return obs
+    hoi_field(out, hoi_layout, "root_pos")[:] = root_pos
+    hoi_field(out, hoi_layout, "root_rot")[:] = torch_utils.quat_to_exp_map(root_rot)
+    hoi_field(out, hoi_layout, "dof_pos")[:] = dof_pos
+    hoi_field(out, hoi_layout, "dof_pos_vel")[:] = dof_vel
+    hoi_field(out, hoi_layout, "obj_pos")[:] = target_states[:, 0:3]
+    hoi_field(out, hoi_layout, "obj_rot")[:] = target_states[:, 3:7]
+    hoi_field(out, hoi_layout, "obj_pos_vel")[:] = target_states[:, 7:10]
+    hoi_field(out, hoi_layout, "key_pos")[:] = key_body_pos.reshape(key_body_pos.shape[0], -1)
+    hoi_field(out, hoi_layout, "contact")[:] = 0 # fake one
+    return out
 
 # @torch.jit.script
-def compute_humanoid_reward(hoi_ref, hoi_obs, hoi_obs_hist, contact_buf, tar_contact_forces, len_keypos, w): #ZCr
-    ## type: (Tensor, Tensor, Tensor, Tensor, Int, float) -> Tensor
+def compute_humanoid_reward(hoi_ref, hoi_obs, hoi_obs_hist, contact_buf, body_contact_ids, tar_contact_forces, hoi_layout, w): #ZCr
+    # type: (Tensor, Tensor, Tensor, Tensor, Tensor, Tensor, Dict[str, Tuple[int, int]], Dict[str, Tensor]) -> Tensor
 
     ### data preprocess ###
 
     # simulated states
-    root_pos = hoi_obs[:,:3]
-    root_rot = hoi_obs[:,3:3+3]
-    dof_pos = hoi_obs[:,6:6+52*3]
-    dof_pos_vel = hoi_obs[:,162:162+52*3]
-    obj_pos = hoi_obs[:,318:318+3]
-    obj_rot = hoi_obs[:,321:321+4]
-    obj_pos_vel = hoi_obs[:,325:325+3]
-    key_pos = hoi_obs[:,328:328+len_keypos*3]
-    contact = hoi_obs[:,-1:]# fake one
+    root_pos = hoi_field(hoi_obs, hoi_layout, "root_pos")
+    root_rot = hoi_field(hoi_obs, hoi_layout, "root_rot")
+    dof_pos = hoi_field(hoi_obs, hoi_layout, "dof_pos")
+    dof_pos_vel = hoi_field(hoi_obs, hoi_layout, "dof_pos_vel")
+    obj_pos = hoi_field(hoi_obs, hoi_layout, "obj_pos")
+    obj_rot = hoi_field(hoi_obs, hoi_layout, "obj_rot")
+    obj_pos_vel = hoi_field(hoi_obs, hoi_layout, "obj_pos_vel")
+    key_pos = hoi_field(hoi_obs, hoi_layout, "key_pos")
+    contact = hoi_field(hoi_obs, hoi_layout, "contact")# fake one
+    len_keypos = key_pos.shape[-1] // 3
     key_pos = torch.cat((root_pos, key_pos),dim=-1)
     body_rot = torch.cat((root_rot, dof_pos),dim=-1)
     ig = key_pos.view(-1,len_keypos+1,3).transpose(0,1) - obj_pos[:,:3]
     ig_wrist = ig.transpose(0,1)[:,0:7+1,:].view(-1,(7+1)*3) #ZC
     ig = ig.transpose(0,1).view(-1,(len_keypos+1)*3)
 
-    dof_pos_vel_hist = hoi_obs_hist[:,162:162+52*3] #ZC
+    dof_pos_vel_hist = hoi_field(hoi_obs_hist, hoi_layout, "dof_pos_vel") #ZC
 
     # reference states
-    ref_root_pos = hoi_ref[:,:3]
-    ref_root_rot = hoi_ref[:,3:3+3]
-    ref_dof_pos = hoi_ref[:,6:6+52*3]
-    ref_dof_pos_vel = hoi_ref[:,162:162+52*3]
-    ref_obj_pos = hoi_ref[:,318:318+3]
-    ref_obj_rot = hoi_ref[:,321:321+4]
-    ref_obj_pos_vel = hoi_ref[:,325:325+3]
-    ref_key_pos = hoi_ref[:,328:328+len_keypos*3]
-    ref_obj_contact = hoi_ref[:,-1:]
+    ref_root_pos = hoi_field(hoi_ref, hoi_layout, "root_pos")
+    ref_root_rot = hoi_field(hoi_ref, hoi_layout, "root_rot")
+    ref_dof_pos = hoi_field(hoi_ref, hoi_layout, "dof_pos")
+    ref_dof_pos_vel = hoi_field(hoi_ref, hoi_layout, "dof_pos_vel")
+    ref_obj_pos = hoi_field(hoi_ref, hoi_layout, "obj_pos")
+    ref_obj_rot = hoi_field(hoi_ref, hoi_layout, "obj_rot")
+    ref_obj_pos_vel = hoi_field(hoi_ref, hoi_layout, "obj_pos_vel")
+    ref_key_pos = hoi_field(hoi_ref, hoi_layout, "key_pos")
+    ref_obj_contact = hoi_field(hoi_ref, hoi_layout, "contact")
     ref_key_pos = torch.cat((ref_root_pos, ref_key_pos),dim=-1)
     ref_body_rot = torch.cat((ref_root_rot, ref_dof_pos),dim=-1)
     ref_ig = ref_key_pos.view(-1,len_keypos+1,3).transpose(0,1) - ref_obj_pos[:,:3]
@@ -563,13 +647,12 @@ def compute_humanoid_reward(hoi_ref, hoi_obs, hoi_obs_hist, contact_buf, tar_con
     # R_Hand, 38-52
 
     # body contact
-    contact_body_ids = [0,1,2,5,6,9,10,11,12,13,14,15,16,17,34,35,36]
-    body_contact_buf = contact_buf[:, contact_body_ids, :].clone()
-    body_contact = torch.all(torch.abs(body_contact_buf) < 0.1, dim=-1)
-    body_contact = 1. - torch.all(body_contact, dim=-1).to(float) # =0 when no contact happens to the body
+    # body_contact_ids, see BODY_CONTACT_IDS
+    body_contact = torch.amax(torch.abs(contact_buf[:, body_contact_ids]), dim=[-2, -1]) < 0.1
+    body_contact = 1. - body_contact.to(torch.float64) # =0 when no contact happens to the body
 
     # object contact
-    obj_contact = torch.any(torch.abs(tar_contact_forces[..., 0:2]) > 0.1, dim=-1).to(float) # =1 when contact happens to the object
+    obj_contact = torch.any(torch.abs(tar_contact_forces[..., 0:2]) > 0.1, dim=-1).to(torch.float64) # =1 when contact happens to the object
 
     ref_body_contact = torch.zeros_like(ref_obj_contact) # no body contact for all time
     ecg1 = torch.abs(body_contact - ref_body_contact[:,0])
@@ -586,6 +669,16 @@ def compute_humanoid_reward(hoi_ref, hoi_obs, hoi_obs_hist, contact_buf, tar_con
 
     return reward
 
+def build_reward_fn(mode):
+    # eager runs compute_humanoid_reward op by op, jit scripts it (fused on GPU by the TorchScript fuser),
+    # compile hands it to torch.compile which fuses the element-wise ops and reductions on CPU and GPU
+    if mode == "jit":
+        return torch.jit.script(compute_humanoid_reward)
+    elif mode == "compile":
+        return torch.compile(compute_humanoid_reward, dynamic=False)
+    assert mode == "eager", f"Unsupported rewardCompile mode: {mode}"
+    return compute_humanoid_reward
+
 @torch.jit.script
 def compute_humanoid_reset(reset_buf, progress_buf, contact_buf, rigid_body_pos,
                            max_episode_length, enable_early_termination, termination_heights, hoi_ref, hoi_obs, envid2episode_lengths,
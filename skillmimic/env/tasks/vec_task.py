@@ -120,21 +120,97 @@ class VecTaskGPU(VecTask):
 
 # Python CPU/GPU Class
 class VecTaskPython(VecTask):
+    # The tensors returned by step(), reset() and get_state() are buffers owned by the wrapper (or, when the task
+    # and the RL device match, the task's own reward and reset buffers), overwritten in place by the next call.
+    # snapshot() copies the last outputs for callers that keep them across steps.
+    # With different devices, the outputs go through pinned host buffers with non-blocking copies: a CUDA task
+    # is clamped on its device and copied into pinned outputs, a CPU task is clamped into pinned staging buffers
+    # and copied to the RL device.
+
+    def __init__(self, task, rl_device, clip_observations=5.0, clip_actions=1.0):
+        super().__init__(task, rl_device, clip_observations=clip_observations, clip_actions=clip_actions)
+
+        self.sim_device = torch.device(self.task.device)
+        self._rl_device = torch.device(self.rl_device)
+        self._same_device = self.sim_device == self._rl_device
+        self._copy_done = None
+        if (not self._same_device and torch.cuda.is_available()):
+            self._copy_done = torch.cuda.Event()
+
+        self._actions = torch.zeros((self.num_envs, self.num_actions), device=self._rl_device, dtype=torch.float)
+        self._reset_actions = torch.zeros((self.num_envs, self.num_actions), device=self.sim_device, dtype=torch.float)
+        self._obs = self._output_buffers(self.task.obs_buf)
+        self._rew = self._output_buffers(self.task.rew_buf)
+        self._resets = self._output_buffers(self.task.reset_buf)
+        self._states = self._output_buffers(self.task.states_buf)
+        self._last_outputs = ()
+        return
+
+    def _output_buffers(self, buf):
+        # (staging on the task side, output on the RL device); one buffer serves as both when the devices match
+        if self._same_device:
+            out = torch.empty_like(buf)
+            return out, out
+        pin = torch.cuda.is_available()
+        if (self._rl_device.type == 'cpu'):
+            return torch.empty_like(buf), torch.empty(buf.shape, dtype=buf.dtype, pin_memory=pin)
+        return torch.empty(buf.shape, dtype=buf.dtype, pin_memory=pin), torch.empty_like(buf, device=self._rl_device)
+
+    def _to_rl_device(self, buffers, buf, clip=None):
+        staging, out = buffers
+        if (self._same_device and clip is None):
+            return buf
+        if (self._copy_done is not None and self.sim_device.type == 'cpu'):
+            # the copy of the last step may still read the staging buffer
+            self._copy_done.synchronize()
+        if (clip is None):
+            staging.copy_(buf)
+        else:
+            torch.clamp(buf, -clip, clip, out=staging)
+        if (staging is not out):
+            out.copy_(staging, non_blocking=True)
+        return out
+
+    def _finish_copies(self):
+        if (self._copy_done is not None):
+            self._copy_done.record()
+            if (self._rl_device.type == 'cpu'):
+                # the host reads the outputs right away
+                self._copy_done.synchronize()
+        return
 
     def get_state(self):
-        return torch.clamp(self.task.states_buf, -self.clip_obs, self.clip_obs).to(self.rl_device)
+        state = self._to_rl_device(self._states, self.task.states_buf, self.clip_obs)
+        self._finish_copies()
+        return state
 
     def step(self, actions):
-        actions_tensor = torch.clamp(actions, -self.clip_actions, self.clip_actions)
+        actions_tensor = torch.clamp(actions, -self.clip_actions, self.clip_actions, out=self._actions)
 
         self.task.step(actions_tensor)
 
-        return torch.clamp(self.task.obs_buf, -self.clip_obs, self.clip_obs).to(self.rl_device), self.task.rew_buf.to(self.rl_device), self.task.reset_buf.to(self.rl_device), self.task.extras
+        obs = self._to_rl_device(self._obs, self.task.obs_buf, self.clip_obs)
+        rew = self._to_rl_device(self._rew, self.task.rew_buf)
+        resets = self._to_rl_device(self._resets, self.task.reset_buf)
+        self._finish_copies()
+        self._last_outputs = (obs, rew, resets)
+        return obs, rew, resets, self.task.extras
 
     def reset(self):
-        actions = 0.01 * (1 - 2 * torch.rand([self.task.num_envs, self.task.num_actions], dtype=torch.float32, device=self.rl_device))
+        actions = self._reset_actions.uniform_(-0.01, 0.01)
 
         # step the simulator
         self.task.step(actions)
 
-        return torch.clamp(self.task.obs_buf, -self.clip_obs, self.clip_obs).to(self.rl_device)
+        return self.get_obs()
+
+    def get_obs(self):
+        # the observations of the last step, without stepping
+        obs = self._to_rl_device(self._obs, self.task.obs_buf, self.clip_obs)
+        self._finish_copies()
+        self._last_outputs = (obs,)
+        return obs
+
+    def snapshot(self):
+        # copies of the tensors the last step() (obs, rewards, resets) or reset() (obs) returned
+        return tuple(t.clone() for t in self._last_outputs)
@@ -0,0 +1,253 @@
+import concurrent.futures
+import contextlib
+import time
+import torch
+
+from env.tasks.vec_task_wrappers import VecTaskPythonWrapper
+
+
+class VecTaskGroups:
+    # num_envs split into env groups, one task instance each, behind the VecTaskPythonWrapper API. The groups step
+    # on worker threads, on their own CUDA streams, so the policy computes the actions of one group while the
+    # physics and post-physics of the others run:
+    #   obs = env.reset()
+    #   for step in range(num_steps):
+    #       for g in range(env.num_groups):
+    #           obs_g, rew_g, resets_g, extras_g = env.step_wait(g)  # waits for the step in flight of group g
+    #           env.step_async(g, policy(obs_g))                     # overlaps the steps of the other groups
+    # rollout(policy, num_steps) runs this loop. step(actions) steps every group at once and returns the joined
+    # outputs, like VecTaskPythonWrapper.step.
+    #
+    # A group always acts on its own latest observations. Its staleness is the time they waited for the policy
+    # after its step finished; stats() reports it with the throughput and the time spent waiting for steps.
+    # With deterministic, every group step runs inline on the calling thread in the same order as the pipeline,
+    # so a run replays exactly (the tasks share torch's global RNG), without the overlap.
+    #
+    # The groups are separate task instances in one process. Isaac Lab allows a single SimulationContext per
+    # process, so only tasks on the kinematic backend (physicsBackend: kinematic) can be grouped; the Isaac Lab
+    # backend would fail while building the second DirectRLEnv.
+
+    def __init__(self, tasks, rl_device, clip_observations=5.0, clip_actions=1.0, deterministic=False):
+        backends = {task.cfg.env.get("physicsBackend", "gym") for task in tasks}
+        if (backends != {"kinematic"}):
+            raise ValueError(f"Env groups need tasks on the kinematic physicsBackend, got {sorted(backends)}: "
+                             "Isaac Lab runs a single SimulationContext per process")
+        self.groups = [VecTaskPythonWrapper(task, rl_device, clip_observations, clip_actions) for task in tasks]
+        self.num_groups = len(self.groups)
+        self.rl_device = rl_device
+        self.clip_obs = clip_observations
+        self.clip_actions = clip_actions
+        self.deterministic = deterministic
+        assert all(g.num_obs == self.groups[0].num_obs and g.num_acts == self.groups[0].num_acts for g in self.groups), \
+            "Env groups need the same observations and actions"
+
+        self.group_sizes = [g.num_envs for g in self.groups]
+        self.group_offsets = [sum(self.group_sizes[:i]) for i in range(self.num_groups + 1)]
+        self.num_environments = self.group_offsets[-1]
+        self.num_agents = 1
+        self.num_observations = self.groups[0].num_obs
+        self.num_states = self.groups[0].num_states
+        self.num_actions = self.groups[0].num_acts
+
+        sim_device = torch.device(tasks[0].device)
+        self._streams = [torch.cuda.Stream(sim_device) if sim_device.type == 'cuda' else None for _ in self.groups]
+        self._executors = None
+        if (not deterministic):
+            self._executors = [concurrent.futures.ThreadPoolExecutor(max_workers=1) for _ in self.groups]
+        self._in_flight = [None] * self.num_groups # future (or result when deterministic) of the step of each group
+        self._results = [None] * self.num_groups   # last (obs, rewards, resets, extras) of each group
+        self._ready_time = [None] * self.num_groups
+
+        self._obs = torch.zeros((self.num_envs, self.num_obs), device=rl_device, dtype=torch.float)
+        self._rew = torch.zeros(self.num_envs, device=rl_device, dtype=torch.float)
+        self._resets = torch.zeros(self.num_envs, device=rl_device, dtype=tasks[0].reset_buf.dtype)
+        self._group_resets = [torch.zeros_like(self._resets[:size]) for size in self.group_sizes]
+        self.reset_stats()
+        return
+
+    def step_async(self, group, actions, reset_done=False):
+        # starts the step of group with its [group_size, num_actions] actions. With reset_done, the envs the step
+        # finishes are reset right after it, the returned resets are the ones of the step
+        assert self._in_flight[group] is None, f"Env group {group} is still stepping, step_wait() for it first"
+        if (self._ready_time[group] is not None):
+            staleness = time.perf_counter() - self._ready_time[group]
+            self._staleness_sum += staleness
+            self._staleness_max = max(self._staleness_max, staleness)
+            self._num_staleness += 1
+        if (self._start_time is None):
+            self._start_time = time.perf_counter()
+
+        actions_ready = None
+        stream = self._streams[group]
+        if (stream is not None):
+            # the step reads the actions and overwrites the outputs the policy read on the current stream
+            actions.record_stream(stream)
+            actions_ready = torch.cuda.Event()
+            actions_ready.record()
+        if (self._executors is None):
+            self._in_flight[group] = self._step_group(group, actions, actions_ready, reset_done)
+        else:
+            self._in_flight[group] = self._executors[group].submit(self._step_group, group, actions, actions_ready, reset_done)
+        return
+
+    def _step_group(self, group, actions, actions_ready, reset_done):
+        env = self.groups[group]
+        stream = self._streams[group]
+        with torch.cuda.stream(stream) if stream is not None else contextlib.nullcontext():
+            if (actions_ready is not None):
+                stream.wait_event(actions_ready)
+            obs, rew, resets, extras = env.step(actions)
+            num_resets = 0
+            if (reset_done):
+                resets = self._group_resets[group].copy_(resets)
+                env_ids = resets.nonzero(as_tuple=False).flatten()
+                num_resets = len(env_ids)
+                if (num_resets > 0):
+                    obs = env.reset(env_ids)
+            done = None
+            if (stream is not None):
+                done = torch.cuda.Event()
+                done.record(stream)
+        return (obs, rew, resets, extras), done, num_resets, time.perf_counter()
+
+    def step_wait(self, group):
+        # outputs of the last step of group, or its reset observations (with None rewards and resets) when it has
+        # not stepped since reset()
+        if (self._in_flight[group] is not None):
+            start = time.perf_counter()
+            step = self._in_flight[group]
+            results, done, num_resets, ready_time = step if self._executors is None else step.result()
+            self._wait_time += time.perf_counter() - start
+            self._in_flight[group] = None
+            if (done is not None):
+                torch.cuda.current_stream().wait_event(done)
+            self._results[group] = results
+            self._ready_time[group] = ready_time
+            self._env_steps += self.group_sizes[group]
+            self._num_waits += 1
+            self._num_resets += num_resets
+        assert self._results[group] is not None, "reset() the env groups before stepping them"
+        return self._results[group]
+
+    def step(self, actions):
+        # the groups clip their actions
+        for g in range(self.num_groups):
+            self.step_async(g, actions[self.group_offsets[g]:self.group_offsets[g + 1]])
+
+        extras = []
+        for g in range(self.num_groups):
+            obs, rew, resets, group_extras = self.step_wait(g)
+            envs = slice(self.group_offsets[g], self.group_offsets[g + 1])
+            self._obs[envs] = obs
+            self._rew[envs] = rew
+            self._resets[envs] = resets
+            extras.append(group_extras)
+        return self._obs, self._rew, self._resets, self._merge_extras(extras)
+
+    def reset(self, env_ids=None):
+        self.wait_all()
+        for g, env in enumerate(self.groups):
+            group_ids = None
+            if (env_ids is not None):
+                in_group = (env_ids >= self.group_offsets[g]) & (env_ids < self.group_offsets[g + 1])
+                group_ids = env_ids[in_group] - self.group_offsets[g]
+            obs = env.reset(group_ids) if group_ids is None or len(group_ids) > 0 else env.get_obs()
+            self._obs[self.group_offsets[g]:self.group_offsets[g + 1]] = obs
+            self._results[g] = (obs, None, None, {})
+            self._ready_time[g] = None
+        return self._obs
+
+    def rollout(self, policy, num_steps, callback=None):
+        # num_steps pipelined steps of every group from its last outputs, resetting the envs that finish;
+        # callback(group, obs, rewards, resets, extras) sees the outputs of every group step
+        for g in range(self.num_groups):
+            self.step_async(g, policy(self.step_wait(g)[0]), reset_done=True)
+        for step in range(num_steps):
+            for g in range(self.num_groups):
+                obs, rew, resets, extras = self.step_wait(g)
+                if (callback is not None):
+                    callback(g, obs, rew, resets, extras)
+                if (step < num_steps - 1):
+                    self.step_async(g, policy(obs), reset_done=True)
+        return self.stats()
+
+    def wait_all(self):
+        for g in range(self.num_groups):
+            if (self._in_flight[g] is not None):
+                self.step_wait(g)
+        return
+
+    def reset_stats(self):
+        self._start_time = None
+        self._env_steps = 0
+        self._num_waits = 0
+        self._num_resets = 0
+        self._wait_time = 0.
+        self._staleness_sum = 0.
+        self._staleness_max = 0.
+        self._num_staleness = 0
+        return
+
+    def stats(self):
+        # throughput and staleness since reset_stats(), over the group steps step_wait() collected
+        elapsed = time.perf_counter() - self._start_time if self._start_time is not None else 0.
+        num_steps = self._env_steps / self.num_envs
+        return {"num_groups": self.num_groups,
+                "deterministic": self.deterministic,
+                "env_steps_per_s": self._env_steps / elapsed if elapsed > 0 else 0.,
+                "step_ms": elapsed / num_steps * 1e3 if num_steps > 0 else 0.,
+                "wait_ms": self._wait_time / max(self._num_waits, 1) * 1e3,
+                "staleness_ms": self._staleness_sum / max(self._num_staleness, 1) * 1e3,
+                "staleness_max_ms": self._staleness_max * 1e3,
+                "reset_rate": self._num_resets / max(self._env_steps, 1)}
+
+    def _merge_extras(self, extras):
+        # per-env tensors are joined across the groups, everything else is the first group's
+        merged = {}
+        for k, v in extras[0].items():
+            if (torch.is_tensor(v) and v.dim() > 0 and v.shape[0] == self.group_sizes[0]):
+                merged[k] = torch.cat([e[k] for e in extras])
+            else:
+                merged[k] = v
+        return merged
+
+    def close(self):
+        self.wait_all()
+        if (self._executors is not None):
+            for executor in self._executors:
+                executor.shutdown()
+        return
+
+    def get_state(self):
+        return torch.cat([g.get_state() for g in self.groups])
+
+    def get_number_of_agents(self):
+        return self.num_agents
+
+    @property
+    def observation_space(self):
+        return self.groups[0].observation_space
+
+    @property
+    def action_space(self):
+        return self.groups[0].action_space
+
+    @property
+    def amp_observation_space(self):
+        return self.groups[0].amp_observation_space
+
+    def fetch_amp_obs_demo(self, num_samples):
+        return self.groups[0].fetch_amp_obs_demo(num_samples)
+
+    @property
+    def num_envs(self):
+        return self.num_environments
+
+    @property
+    def num_acts(self):
+        return self.num_actions
+
+    @property
+    def num_obs(self):
+        return self.num_observations
+
@@ -0,0 +1,35 @@
+import argparse
+import time
+import torch
+
+from projects.SkillMimicLab.skillmimic.utils.motion_data_handler import MotionDataHandler, REWARD_TERMS
+
+# Prebuilds the preprocessed motion cache of one or more motion directories, e.g.
+#   python -m projects.SkillMimicLab.skillmimic.utils.build_motion_cache skillmimic/data/motions/BallPlay-M/layup \
+#       --key_body_ids 5 10 15 20 25 30 --data_fps 25 --data_frames_scale 1
+# The settings must match the ones the task runs with, otherwise the task will not hit the cache.
+
+parser = argparse.ArgumentParser()
+parser.add_argument("motion_dirs", type=str, nargs='+')
+parser.add_argument("--key_body_ids", type=int, nargs='+', required=True, help="Rigid body indices of cfg keyBodies")
+parser.add_argument("--data_fps", type=float, required=True)
+parser.add_argument("--data_frames_scale", type=float, default=1)
+parser.add_argument("--init_vel", action='store_true', default=False)
+parser.add_argument("--cache_dir", type=str, default=None, help="Defaults to MOTION_CACHE_DIR, ~/.cache/skillmimic/motions")
+parser.add_argument("--device", type=str, default='cpu')
+args = parser.parse_args()
+
+cfg = {"env": {
+    "dataFPS": args.data_fps,
+    "dataFramesScale": args.data_frames_scale,
+    "useMotionCache": True,
+    "motionCacheDir": args.cache_dir,
+}}
+reward_weights_default = dict.fromkeys(REWARD_TERMS, 0.)
+key_body_ids = torch.tensor(args.key_body_ids, dtype=torch.long)
+
+for motion_dir in args.motion_dirs:
+    motion_dir = motion_dir.rstrip('/')
+    start = time.time()
+    motion_data = MotionDataHandler(motion_dir, args.device, key_body_ids, cfg, 1, 1, reward_weights_default, args.init_vel)
+    print(f'{motion_dir}: {motion_data.num_motions} clips, {int(motion_data.motion_lengths.sum())} frames, {time.time() - start:.2f}s')
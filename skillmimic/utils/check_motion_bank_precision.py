@@ -0,0 +1,91 @@
+import argparse
+import copy
+import torch
+import yaml
+
+from projects.SkillMimicLab.skillmimic.utils.motion_data_handler import MotionDataHandler
+from projects.SkillMimicLab.skillmimic.utils.metrics import compute_evaluation_metrics, BODY_CONTACT_IDS
+from projects.SkillMimicLab.skillmimic.benchmarks.common import use_isaac_lab_stand_in
+
+use_isaac_lab_stand_in()
+from env.tasks.skillmimic import compute_humanoid_reward
+
+# Reports the error a half precision motion bank (env.motionBankDtype) introduces, e.g.
+#   python -m projects.SkillMimicLab.skillmimic.utils.check_motion_bank_precision skillmimic/data/motions/BallPlay-M/layup \
+#       --cfg_env skillmimic/data/cfg/skillmimic.yaml --key_body_ids 5 10 15 20 25 30 --device cuda:0
+# Every frame of the dataset is used as the reference once. The simulated HOI state is the float32 reference
+# plus gaussian noise, so the reward and metrics are evaluated around realistic tracking errors.
+
+parser = argparse.ArgumentParser()
+parser.add_argument("motion_dirs", type=str, nargs='+')
+parser.add_argument("--cfg_env", type=str, required=True, help="Environment configuration file (.yaml)")
+parser.add_argument("--key_body_ids", type=int, nargs='+', required=True, help="Rigid body indices of cfg keyBodies")
+parser.add_argument("--dtypes", type=str, nargs='+', default=["float16", "bfloat16"])
+parser.add_argument("--noise", type=float, default=0.05, help="Std of the simulated tracking error")
+parser.add_argument("--batch_size", type=int, default=65536)
+parser.add_argument("--seed", type=int, default=0)
+parser.add_argument("--device", type=str, default='cpu')
+args = parser.parse_args()
+
+with open(args.cfg_env, 'r') as f:
+    cfg = yaml.load(f, Loader=yaml.SafeLoader)
+reward_weights = {k: float(v) for k, v in cfg["env"]["rewardWeights"].items()}
+key_body_ids = torch.tensor(args.key_body_ids, dtype=torch.long)
+metric_names = ["accuracy", "pos_error_body", "pos_error_ball", "contact_error"]
+
+
+def load(motion_dir, dtype):
+    dtype_cfg = copy.deepcopy(cfg)
+    dtype_cfg["env"]["motionBankDtype"] = dtype
+    return MotionDataHandler(motion_dir, args.device, key_body_ids, dtype_cfg, 1, 1, cfg["env"]["rewardWeights"], cfg["env"]["initVel"])
+
+
+def bank_bytes(motion_data):
+    return sum(v.numel() * v.element_size() for v in motion_data.motion_bank.values())
+
+
+for motion_dir in args.motion_dirs:
+    reference = load(motion_dir, "float32")
+    num_frames = reference.motion_bank['hoi_data'].shape[0]
+    print(f'{motion_dir}: {reference.num_motions} clips, {num_frames} frames, float32 bank {bank_bytes(reference)/2**20:.1f} MiB')
+
+    for dtype in args.dtypes:
+        motion_data = load(motion_dir, dtype)
+        print(f'  {dtype}: bank {bank_bytes(motion_data)/2**20:.1f} MiB')
+
+        for key in reference.motion_bank:
+            error = (motion_data.motion_bank[key].float() - reference.motion_bank[key]).abs().max().item()
+            print(f'    {key:<18} max abs error {error:.3e}')
+
+        generator = torch.Generator(device=args.device)
+        generator.manual_seed(args.seed)
+        reward_error = 0.
+        metric_errors = [0.] * len(metric_names)
+        accuracy_flips = 0
+        body_contact_ids = torch.tensor(BODY_CONTACT_IDS, device=args.device, dtype=torch.long)
+        hoi_offsets = reference.hoi_layout.offsets()
+        for start in range(0, num_frames, args.batch_size):
+            frame_ids = torch.arange(start, min(start + args.batch_size, num_frames), device=args.device)
+            num_envs = frame_ids.shape[0]
+            ref = reference.motion_bank['hoi_data'][frame_ids]
+            ref_half = motion_data.motion_bank['hoi_data'][frame_ids].float()
+
+            obs = ref + torch.randn(ref.shape, device=args.device, generator=generator) * args.noise
+            obs_hist = ref + torch.randn(ref.shape, device=args.device, generator=generator) * args.noise
+            contact_buf = (torch.rand((num_envs, 53, 3), device=args.device, generator=generator) < 0.05).float()
+            tar_contact_forces = (torch.rand((num_envs, 3), device=args.device, generator=generator) < 0.5).float()
+
+            reward = compute_humanoid_reward(ref, obs, obs_hist, contact_buf, body_contact_ids, tar_contact_forces, hoi_offsets, reward_weights)
+            reward_half = compute_humanoid_reward(ref_half, obs, obs_hist, contact_buf, body_contact_ids, tar_contact_forces, hoi_offsets, reward_weights)
+            reward_error = max(reward_error, (reward_half - reward).abs().max().item())
+
+            metrics = compute_evaluation_metrics(ref, obs, contact_buf, body_contact_ids, tar_contact_forces, hoi_offsets)
+            metrics_half = compute_evaluation_metrics(ref_half, obs, contact_buf, body_contact_ids, tar_contact_forces, hoi_offsets)
+            for i, (metric, metric_half) in enumerate(zip(metrics, metrics_half)):
+                metric_errors[i] = max(metric_errors[i], (metric_half - metric).abs().max().item())
+            accuracy_flips += int((metrics_half[0] != metrics[0]).sum())
+
+        print(f'    {"reward":<18} max abs error {reward_error:.3e}')
+        for name, error in zip(metric_names, metric_errors):
+            print(f'    {name:<18} max abs error {error:.3e}')
+        print(f'    accuracy flips     {accuracy_flips} / {num_frames} frames')
@@ -37,6 +37,7 @@ import numpy as np
 import random
 import torch
 import argparse
+from types import SimpleNamespace
 
 
 SIM_TIMESTEP = 1.0 / 60.0
@@ -79,6 +80,26 @@ def set_seed(seed, torch_deterministic=False):
     return seed
 
 
+def load_kinematic_cfg(args):
+    # the kinematic backend builds no Isaac Lab scene, so its cfg is the env section of --cfg_env with the fields
+    # of SkillmimiceEnvCfg the tasks read; load_cfg adds the overrides, the seed and args
+    with open(os.path.join(os.getcwd(), args.cfg_env), 'r') as f:
+        cfg_env = yaml.load(f, Loader=yaml.SafeLoader)
+    env = cfg_env["env"]
+    # the command line flags that were given override the yaml
+    if args.motion_file:
+        env["motion_file"] = args.motion_file
+    if args.projtype != "None" or "projtype" not in env:
+        env["projtype"] = args.projtype
+    if args.state_init != "Random" or "stateInit" not in env:
+        env["stateInit"] = args.state_init
+    env["playdataset"] = args.play_dataset or env.get("playdataset", False)
+    env["saveImages"] = args.save_images or env.get("saveImages", False)
+    env["initVel"] = args.init_vel or env.get("initVel", False)
+    device = getattr(args, "device", "cpu")
+    return SimpleNamespace(env=env, sim=SimpleNamespace(device=device))
+
+
 def load_cfg(args):
     print("lllllllllllllllllllllllllllll",args)
     with open(os.path.join(os.getcwd(), args.cfg_train), 'r') as f:
@@ -86,9 +107,12 @@ def load_cfg(args):
 
     #with open(os.path.join(os.getcwd(), args.cfg_env), 'r') as f:
     #    cfg = yaml.load(f, Loader=yaml.SafeLoader)
-    from projects.SkillMimicLab.skillmimic.data.cfg.skillmimic_cfg import SkillmimiceEnvCfg
+    if args.physics_backend == "kinematic":
+        cfg = load_kinematic_cfg(args)
+    else:
+        from projects.SkillMimicLab.skillmimic.data.cfg.skillmimic_cfg import SkillmimiceEnvCfg
 
-    cfg = SkillmimiceEnvCfg()
+        cfg = SkillmimiceEnvCfg()
 
     # Override number of environments if passed on the command line
     if args.num_envs > 0:
@@ -146,6 +170,14 @@ def load_cfg(args):
 
     cfg_train["params"]["config"]["num_actors"] = cfg.env["numEnvs"]
 
+    cfg.env["physicsBackend"] = args.physics_backend
+    cfg.env["profileStep"] = args.profile_step
+    cfg.env["profileTrace"] = args.profile_trace
+
+    # the evaluation sweep scores every episode
+    if args.eval:
+        cfg.env["trackMetrics"] = True
+
     seed = cfg_train["params"].get("seed", -1)
     if args.seed is not None:
         seed = args.seed
@@ -265,6 +297,22 @@ def get_args(benchmark=False):
             "help": "Specify the checkpoint to continue training"},
         {"name": "--state_init", "type": str, "default": "Random", 
             "help": "Specify a specific initialization frame and disable random initialization. Or Random Reference State Init"},
+        {"name": "--physics_backend", "type": str, "default": "gym",
+            "help": "Simulator the tasks step through: gym, or kinematic for the pure torch stand-in of physics_backend.py"},
+        {"name": "--profile_step", "action": "store_true", "default": False,
+            "help": "Time the phases of the env step and report their percentiles in extras and the log"},
+        {"name": "--profile_trace", "type": str, "default": None,
+            "help": "With --profile_step, also export a Chrome trace of the first steps to this path (.json)"},
+        {"name": "--eval", "action": "store_true", "default": False,
+            "help": "Sweep every clip and start frame of the motion file with the trained policy and report the metrics"},
+        {"name": "--eval_stride", "type": int, "default": 1,
+            "help": "Frames between the start frames of the evaluation sweep"},
+        {"name": "--eval_shard", "type": int, "default": 0,
+            "help": "Shard of the evaluation sweep this process runs"},
+        {"name": "--eval_num_shards", "type": int, "default": 1,
+            "help": "Number of processes the evaluation sweep is split across"},
+        {"name": "--eval_report", "type": str, "default": "output/eval/report.json",
+            "help": "Evaluation report (.json), the resumable state of each shard is kept next to it"},
     ]
 
     if benchmark:
@@ -0,0 +1,57 @@
+import torch
+from torch import Tensor
+from typing import Dict, Tuple
+
+from projects.SkillMimicLab.skillmimic.utils.obs_layout import ObsLayout
+
+# Layouts of the HOI vectors. build_hoi_layout is the vector the reward and metrics compare: the reference hoi_data
+# of MotionDataHandler and the simulated state of build_hoi_observations. build_motion_file_layout is the raw
+# per-frame vector of the motion .pt files that _process_sequence reads.
+# The kernels take layout.offsets(), a Dict[str, Tuple[int, int]] TorchScript accepts, and slice it with hoi_field.
+
+
+def build_hoi_layout(num_dofs, num_key_bodies):
+    layout = ObsLayout()
+    layout.add("root_pos", 3)
+    layout.add("root_rot", 3) # exponential map
+    layout.add("dof_pos", num_dofs)
+    layout.add("dof_pos_vel", num_dofs)
+    layout.add("obj_pos", 3)
+    layout.add("obj_rot", 4) # quaternion
+    layout.add("obj_pos_vel", 3)
+    layout.add("key_pos", num_key_bodies * 3)
+    layout.add("contact", 1)
+    return layout
+
+
+def build_motion_file_layout(num_dofs=52*3, num_bodies=53):
+    layout = ObsLayout()
+    layout.add("root_pos", 3)
+    layout.add("root_rot", 3) # exponential map
+    layout.skip(3)
+    layout.add("dof_pos", num_dofs)
+    layout.add("body_pos", num_bodies * 3)
+    layout.add("obj_pos", 3)
+    layout.add("obj_rot", 3) # negated exponential map
+    layout.skip(6)
+    layout.add("contact", 1)
+    return layout
+
+
+def hoi_field(hoi, layout, name):
+    # type: (Tensor, Dict[str, Tuple[int, int]], str) -> Tensor
+    start, stop = layout[name]
+    return hoi[..., start:stop]
+
+
+def check_hoi_layout(layout, motion_layout, hoi_data):
+    # startup self-check: the layout of the simulated HOI state matches the one the motion bank was packed with,
+    # and its fields read values that look like what they are named after
+    assert layout.slices == motion_layout.slices, f"{layout} does not match the motion bank {motion_layout}"
+    assert hoi_data.shape[-1] == layout.size, f"Motion bank hoi_data has {hoi_data.shape[-1]} columns, {layout} has {layout.size}"
+
+    obj_rot_norm = layout.view(hoi_data, "obj_rot").float().norm(dim=-1)
+    assert torch.allclose(obj_rot_norm, torch.ones_like(obj_rot_norm), atol=1e-2), f"obj_rot of {layout} is not a unit quaternion"
+    contact = layout.view(hoi_data, "contact")
+    assert torch.all((contact == 0) | (contact == 1)), f"contact of {layout} is not 0 or 1"
+    return
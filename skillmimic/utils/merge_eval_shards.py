@@ -0,0 +1,18 @@
+import argparse
+
+from projects.SkillMimicLab.skillmimic.utils.offline_eval import merge_eval_states, write_eval_report
+
+# Combines the shards of an --eval sweep into one report, e.g.
+#   python -m projects.SkillMimicLab.skillmimic.utils.merge_eval_shards output/eval/report.shard*of4.pt \
+#       --report output/eval/report.json
+# The sweep is marked complete in the report only when every shard finished all of its batches.
+
+parser = argparse.ArgumentParser()
+parser.add_argument("states", type=str, nargs='+', help="State files the shards wrote")
+parser.add_argument("--report", type=str, required=True)
+args = parser.parse_args()
+
+report = merge_eval_states(args.states)
+write_eval_report(report, args.report)
+print(f'{len(report["sweep"]["shards"])}/{report["sweep"]["num_shards"]} shards, {report["dataset"]["episodes"]} episodes, '
+      f'accuracy {report["dataset"]["accuracy"]}, success rate {report["dataset"]["success_rate"]}')
@@ -0,0 +1,127 @@
+import torch
+
+# outputs of compute_evaluation_metrics, in order
+METRIC_NAMES = ["accuracy", "pos_error_body", "pos_error_ball", "contact_error"]
+
+
+class MetricsAccumulator:
+    # Running sums of compute_evaluation_metrics on the device: per env for the episodes in flight, per motion
+    # and per skill (motion class) for the finished ones. update() and finalize() are tensor ops only, nothing
+    # is read back to the host until report().
+    #
+    # Means are over frames, like the Acc and MPJPE of the paper. An episode counts as a success when its mean
+    # accuracy reaches success_accuracy.
+
+    def __init__(self, num_envs, motion_class, device, success_accuracy=0.5, motion_names=None):
+        self.device = device
+        self.num_metrics = len(METRIC_NAMES)
+        self.success_accuracy = success_accuracy
+        self.motion_names = motion_names
+        self.motion_class = torch.as_tensor(motion_class, device=self.device, dtype=torch.long)
+        self.skills, self._motion_skill = torch.unique(self.motion_class, return_inverse=True)
+        num_motions = self.motion_class.shape[0]
+        num_skills = self.skills.shape[0]
+
+        # [..., num_metrics] sums over frames, float64 so long sweeps do not lose precision
+        self.env_sums = torch.zeros((num_envs, self.num_metrics), device=self.device, dtype=torch.float64)
+        self.env_frames = torch.zeros(num_envs, device=self.device, dtype=torch.float64)
+        self.motion_sums = torch.zeros((num_motions, self.num_metrics), device=self.device, dtype=torch.float64)
+        self.motion_frames = torch.zeros(num_motions, device=self.device, dtype=torch.float64)
+        self.motion_episodes = torch.zeros(num_motions, device=self.device, dtype=torch.float64)
+        self.motion_successes = torch.zeros(num_motions, device=self.device, dtype=torch.float64)
+        self.skill_sums = torch.zeros((num_skills, self.num_metrics), device=self.device, dtype=torch.float64)
+        self.skill_frames = torch.zeros(num_skills, device=self.device, dtype=torch.float64)
+        self.skill_episodes = torch.zeros(num_skills, device=self.device, dtype=torch.float64)
+        self.skill_successes = torch.zeros(num_skills, device=self.device, dtype=torch.float64)
+        return
+
+    def update(self, metrics, mask=None):
+        # metrics: the [num_envs] tensors of compute_evaluation_metrics, mask [num_envs] (bool) selects the envs
+        # whose frame counts, e.g. frames past the end of the reference are left out
+        values = torch.stack(metrics, dim=-1).to(torch.float64)
+        if (mask is None):
+            self.env_sums += values
+            self.env_frames += 1
+        else:
+            weight = mask.to(torch.float64)
+            self.env_sums += values * weight.unsqueeze(-1)
+            self.env_frames += weight
+        return
+
+    def finalize(self, env_ids, motion_ids):
+        # closes the episodes of env_ids, which were playing motion_ids, and clears their running sums.
+        # Envs without tracked frames (e.g. the first reset) add nothing.
+        sums = self.env_sums[env_ids]
+        frames = self.env_frames[env_ids]
+        finished = (frames > 0).to(torch.float64)
+        mean_accuracy = sums[:, 0] / frames.clamp(min=1)
+        success = (mean_accuracy >= self.success_accuracy).to(torch.float64) * finished
+
+        self.motion_sums.index_add_(0, motion_ids, sums)
+        self.motion_frames.index_add_(0, motion_ids, frames)
+        self.motion_episodes.index_add_(0, motion_ids, finished)
+        self.motion_successes.index_add_(0, motion_ids, success)
+
+        skill_ids = self._motion_skill[motion_ids]
+        self.skill_sums.index_add_(0, skill_ids, sums)
+        self.skill_frames.index_add_(0, skill_ids, frames)
+        self.skill_episodes.index_add_(0, skill_ids, finished)
+        self.skill_successes.index_add_(0, skill_ids, success)
+
+        self.env_sums[env_ids] = 0
+        self.env_frames[env_ids] = 0
+        return
+
+    def reset(self):
+        for buf in [self.env_sums, self.env_frames, self.motion_sums, self.motion_frames, self.motion_episodes,
+                    self.motion_successes, self.skill_sums, self.skill_frames, self.skill_episodes, self.skill_successes]:
+            buf.zero_()
+        return
+
+    def state_dict(self):
+        # host copy of the finished episodes, the per skill sums follow from the per motion ones
+        return {"motion_class": self.motion_class.cpu(), "motion_names": self.motion_names,
+                "motion_sums": self.motion_sums.cpu(), "motion_frames": self.motion_frames.cpu(),
+                "motion_episodes": self.motion_episodes.cpu(), "motion_successes": self.motion_successes.cpu()}
+
+    def add_state_dict(self, state):
+        # adds the finished episodes of state, e.g. of another shard of the same sweep
+        assert torch.equal(state["motion_class"], self.motion_class.cpu()), "State of a different motion set"
+        for key in ["motion_sums", "motion_frames", "motion_episodes", "motion_successes"]:
+            motion_buf = getattr(self, key)
+            motion_buf += state[key].to(self.device)
+            skill_buf = getattr(self, key.replace("motion_", "skill_"))
+            skill_buf.index_add_(0, self._motion_skill, state[key].to(self.device))
+        return
+
+    def report(self):
+        # dataset, per skill and per clip means of the finished episodes, synchronizes with the device
+        def summarize(sums, frames, episodes, successes):
+            # None when nothing was scored, so the report stays plain JSON
+            entry = {name: (sums[i] / frames if frames > 0 else None) for i, name in enumerate(METRIC_NAMES)}
+            entry["success_rate"] = successes / episodes if episodes > 0 else None
+            entry["episodes"] = int(episodes)
+            entry["frames"] = int(frames)
+            return entry
+
+        motion_sums, motion_frames = self.motion_sums.tolist(), self.motion_frames.tolist()
+        motion_episodes, motion_successes = self.motion_episodes.tolist(), self.motion_successes.tolist()
+        skill_sums, skill_frames = self.skill_sums.tolist(), self.skill_frames.tolist()
+        skill_episodes, skill_successes = self.skill_episodes.tolist(), self.skill_successes.tolist()
+        motion_class = self.motion_class.tolist()
+
+        clips = []
+        for m in range(len(motion_frames)):
+            clip = {"motion_id": m, "skill": motion_class[m]}
+            if (self.motion_names is not None):
+                clip["name"] = self.motion_names[m]
+            clip.update(summarize(motion_sums[m], motion_frames[m], motion_episodes[m], motion_successes[m]))
+            clips.append(clip)
+
+        skills = {}
+        for s, skill in enumerate(self.skills.tolist()):
+            skills[skill] = summarize(skill_sums[s], skill_frames[s], skill_episodes[s], skill_successes[s])
+
+        dataset = summarize([sum(s[i] for s in skill_sums) for i in range(self.num_metrics)], sum(skill_frames),
+                            sum(skill_episodes), sum(skill_successes))
+        return {"dataset": dataset, "skills": skills, "clips": clips}
@@ -2,65 +2,246 @@ import os
 import glob
 import torch
 import numpy as np
-import torch.nn.functional as F
 import re
+import hashlib
+import time
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
 from projects.SkillMimicLab.skillmimic.utils import torch_utils
+from projects.SkillMimicLab.skillmimic.utils.motion_sampler import AliasMotionSampler
+from projects.SkillMimicLab.skillmimic.utils.hoi_layout import build_hoi_layout, build_motion_file_layout
+
+# bump when the cached layout or _process_sequence changes
+MOTION_CACHE_VERSION = 1
+# default cfg["env"]["motionCacheDir"], outside the datasets, which may be read-only or shared
+MOTION_CACHE_DIR = os.path.join(os.environ.get('XDG_CACHE_HOME') or os.path.join(os.path.expanduser('~'), '.cache'),
+                                'skillmimic', 'motions')
+
+# columns of MotionDataHandler.reward_weight_table
+REWARD_TERMS = ["p", "r", "op", "ig", "cg1", "cg2", "pv", "rv", "or", "opv", "orv"]
 
 class MotionDataHandler:
     def __init__(self, motion_file, device, key_body_ids, cfg, num_envs, max_episode_length, reward_weights_default, 
                 init_vel=False, play_dataset=False):
         self.device = device
-        self._key_body_ids = key_body_ids
+        self._key_body_ids = torch.as_tensor(key_body_ids).cpu() # clips are preprocessed on the host
         self.cfg = cfg
         self.init_vel = init_vel
         self.play_dataset = play_dataset #V1
         self.max_episode_length = max_episode_length
+
+        # columns of the motion files and of the hoi_data rows built from them
+        self.motion_file_layout = build_motion_file_layout()
+        num_dofs = self.motion_file_layout.slices["dof_pos"].stop - self.motion_file_layout.slices["dof_pos"].start
+        self.hoi_layout = build_hoi_layout(num_dofs, len(self._key_body_ids))
         
-        self.hoi_data_dict = {}
+        # storage dtype of the motion bank on the device, gathers are upcast to float32
+        storage_dtype = cfg["env"].get("motionBankDtype", "float32")
+        assert storage_dtype in ["float32", "float16", "bfloat16"], f"Unsupported motionBankDtype: {storage_dtype}"
+        self.storage_dtype = getattr(torch, storage_dtype)
+
+        self.motion_bank = {}
+        self.motion_offsets = None
         self.hoi_data_label_batch = None
         self.motion_lengths = None
         self.load_motion(motion_file)
 
+        # per-run generator for motion and start frame sampling, seeded with the run seed. Without one (-1) it
+        # follows the global torch seed, the one set_seed draws for the run. Created after load_motion: a process
+        # pool pickles the handler, which must hold only host state by then
+        self.generator = torch.Generator(device=self.device)
+        seed = cfg.get("seed", -1)
+        if seed is None or seed < 0:
+            seed = torch.initial_seed()
+        self.generator.manual_seed(seed)
+
         self.num_envs = num_envs
         self.envid2motid = torch.zeros(self.num_envs, device=self.device, dtype=torch.long)
         self.envid2episode_lengths = torch.zeros(self.num_envs, device=self.device, dtype=torch.long)
+        self.envid2start_frame = torch.zeros(self.num_envs, device=self.device, dtype=torch.long)
+        self._episode_frame_ids = torch.arange(int(self.max_episode_length), device=self.device, dtype=torch.long)
 
         self.reward_weights_default = reward_weights_default
-        self.reward_weights = {}
-        self.reward_weights["p"] = (torch.ones((self.num_envs), device=self.device, dtype=torch.float)*self.reward_weights_default["p"])
-        self.reward_weights["r"] = (torch.ones((self.num_envs), device=self.device, dtype=torch.float)*self.reward_weights_default["r"])
-        self.reward_weights["op"] = (torch.ones((self.num_envs), device=self.device, dtype=torch.float)*self.reward_weights_default["op"])
-        self.reward_weights["ig"] = (torch.ones((self.num_envs), device=self.device, dtype=torch.float)*self.reward_weights_default["ig"])
-        self.reward_weights["cg1"] = (torch.ones((self.num_envs), device=self.device, dtype=torch.float)*self.reward_weights_default["cg1"])
-        self.reward_weights["cg2"] = (torch.ones((self.num_envs), device=self.device, dtype=torch.float)*self.reward_weights_default["cg2"])
-        self.reward_weights["pv"] = (torch.ones((self.num_envs), device=self.device, dtype=torch.float)*self.reward_weights_default["pv"])
-        self.reward_weights["rv"] = (torch.ones((self.num_envs), device=self.device, dtype=torch.float)*self.reward_weights_default["rv"])
-        self.reward_weights["or"] = (torch.ones((self.num_envs), device=self.device, dtype=torch.float)*self.reward_weights_default["or"])
-        self.reward_weights["opv"] = (torch.ones((self.num_envs), device=self.device, dtype=torch.float)*self.reward_weights_default["opv"])
-        self.reward_weights["orv"] = (torch.ones((self.num_envs), device=self.device, dtype=torch.float)*self.reward_weights_default["orv"])
+        # one row of reward weights per env, a reset copies the row of the motion's weight class
+        self.class_reward_weights = self._build_class_reward_weights()
+        self.motion_reward_class = (self.motion_class == 0).long()
+        self.reward_weight_table = self.class_reward_weights[0].repeat(self.num_envs, 1)
+        # column views into the table, they follow every reset without being rebuilt
+        self.reward_weights = {k: self.reward_weight_table[:, i] for i, k in enumerate(REWARD_TERMS)}
 
     def load_motion(self, motion_file):
+        timings = {}
+        start = time.perf_counter()
         self.skill_name = motion_file.split('/')[-1]
         all_seqs = glob.glob(motion_file + '/*.pt')
-        self.num_motions = len(all_seqs)
-        self.motion_lengths = torch.zeros(len(all_seqs), device=self.device, dtype=torch.long)
-        motion_class = np.zeros(len(all_seqs), dtype=int)
-        self.layup_target = torch.zeros((len(all_seqs), 3), device=self.device, dtype=torch.float)
-        self.root_target = torch.zeros((len(all_seqs), 3), device=self.device, dtype=torch.float)
-
         all_seqs.sort(key=self._sort_key)
-        for i, seq_path in enumerate(all_seqs):
-            loaded_dict = self._process_sequence(seq_path)
-            self.hoi_data_dict[i] = loaded_dict
-            self.motion_lengths[i] = loaded_dict['hoi_data'].shape[0]
+        self.num_motions = len(all_seqs)
+        self.motion_names = [os.path.basename(seq_path) for seq_path in all_seqs]
+
+        cache_path = self.get_cache_path(motion_file, all_seqs) if self.cfg["env"].get("useMotionCache", True) else None
+        timings['scan'] = time.perf_counter() - start
+
+        motion = self._load_motion_cache(cache_path) if cache_path is not None else None
+        timings['cache'] = time.perf_counter() - start - sum(timings.values())
+        if motion is None:
+            motion = self._process_motions(all_seqs, timings)
+            if cache_path is not None:
+                self._save_motion_cache(cache_path, motion)
+                timings['cache'] += time.perf_counter() - start - sum(timings.values())
+
+        self.motion_bank = self._transfer_motion_bank(motion['motion_bank'])
+        self.motion_lengths = motion['motion_lengths'].to(self.device)
+        self.motion_offsets = torch.cumsum(self.motion_lengths, dim=0) - self.motion_lengths
+        self.layup_target = motion['layup_target'].to(self.device)
+        self.root_target = motion['root_target'].to(self.device)
+        self.motion_class = motion['motion_class'].to(self.device)
+        self._compute_start_frame_range()
+        self._compute_motion_weights(motion['motion_class'].numpy())
+        if self.play_dataset:
+            self.max_episode_length = self.motion_lengths.min() - 1
+        timings['transfer'] = time.perf_counter() - start - sum(timings.values())
+
+        self.load_timings = timings
+        print(f'Loaded {self.num_motions} motions ({int(motion["motion_lengths"].sum())} frames) from {motion_file} in '
+              f'{sum(timings.values()):.2f}s: ' + ', '.join(f'{k} {v:.2f}s' for k, v in timings.items()))
+
+    def _process_motions(self, all_seqs, timings):
+        start = time.perf_counter()
+        # clips are read and preprocessed on the host, optionally on a worker pool;
+        # map keeps the sorted order so the result does not depend on the pool
+        num_workers = self.cfg["env"].get("motionLoadWorkers", 0)
+        if num_workers > 1 and len(all_seqs) > 1:
+            pool_type = self.cfg["env"].get("motionLoadPool", "thread")
+            assert pool_type in ["thread", "process"], pool_type
+            executor = ProcessPoolExecutor if pool_type == "process" else ThreadPoolExecutor
+            with executor(max_workers=num_workers) as pool:
+                clips = list(pool.map(self._process_sequence, all_seqs))
+        else:
+            clips = [self._process_sequence(seq_path) for seq_path in all_seqs]
+        timings['process'] = time.perf_counter() - start
+
+        motion_lengths = torch.zeros(len(all_seqs), dtype=torch.long)
+        motion_class = torch.zeros(len(all_seqs), dtype=torch.long)
+        layup_target = torch.zeros((len(all_seqs), 3), dtype=torch.float)
+        root_target = torch.zeros((len(all_seqs), 3), dtype=torch.float)
+        for i, loaded_dict in enumerate(clips):
+            motion_lengths[i] = loaded_dict['hoi_data'].shape[0]
             motion_class[i] = int(loaded_dict['hoi_data_text'])
             if self.skill_name in ['layup', "SHOT_up"]:
                 layup_target_ind = torch.argmax(loaded_dict['obj_pos'][:, 2])
-                self.layup_target[i] = loaded_dict['obj_pos'][layup_target_ind]
-                self.root_target[i] = loaded_dict['root_pos'][layup_target_ind]
-        self._compute_motion_weights(motion_class)
-        if self.play_dataset:
-            self.max_episode_length = self.motion_lengths.min() - 1
+                layup_target[i] = loaded_dict['obj_pos'][layup_target_ind]
+                root_target[i] = loaded_dict['root_pos'][layup_target_ind]
+
+        motion_bank = self._pack_motion_bank(clips)
+        timings['pack'] = time.perf_counter() - start - timings['process']
+
+        return {
+            'motion_bank': motion_bank,
+            'motion_lengths': motion_lengths,
+            'motion_class': motion_class,
+            'layup_target': layup_target,
+            'root_target': root_target,
+        }
+
+    def _pack_motion_bank(self, clips):
+        # All clips are concatenated along the frame axis, one tensor per field.
+        # Frame t of motion m lives at row motion_offsets[m] + t.
+        motion_bank = {}
+        for key in clips[0]:
+            if key == 'hoi_data_text':
+                continue
+            fields = []
+            for clip in clips:
+                field = clip[key]
+                # root_rot_vel is one frame shorter than the clip, zero-pad it so all fields share the offsets
+                num_pad = clip['hoi_data'].shape[0] - field.shape[0]
+                if num_pad > 0:
+                    field = torch.cat((field, field.new_zeros((num_pad,) + field.shape[1:])), dim=0)
+                fields.append(field)
+            motion_bank[key] = torch.cat(fields, dim=0).contiguous()
+        return motion_bank
+
+    def get_cache_path(self, motion_file, all_seqs):
+        """
+        Cache entries live in cfg["env"]["motionCacheDir"] (MOTION_CACHE_DIR by default) and are named
+        <skill>_<dir hash>_<clips hash>_<settings hash>.pt, the dir hash keeps the motion directories apart. The clips
+        hash covers the clip list with mtimes and sizes, the settings hash every setting _process_sequence depends on,
+        so any change to them selects a new entry. Runs with different settings on the same clips keep their own entries.
+        """
+        cache_dir = self.cfg["env"].get("motionCacheDir", None) or MOTION_CACHE_DIR
+        dir_hash = hashlib.sha1(os.path.abspath(motion_file).encode()).hexdigest()[:8]
+
+        clips_hash = hashlib.sha1()
+        clips_hash.update(str(MOTION_CACHE_VERSION).encode())
+        for seq_path in all_seqs:
+            stat = os.stat(seq_path)
+            clips_hash.update(f'{os.path.basename(seq_path)}:{stat.st_mtime_ns}:{stat.st_size};'.encode())
+        settings_hash = hashlib.sha1(repr((
+            float(self.cfg["env"]["dataFPS"]),
+            float(self.cfg["env"]["dataFramesScale"]),
+            torch.as_tensor(self._key_body_ids).tolist(),
+            bool(self.init_vel),
+        )).encode())
+
+        name = f'{self.skill_name}_{dir_hash}_{clips_hash.hexdigest()[:16]}_{settings_hash.hexdigest()[:8]}.pt'
+        return os.path.join(cache_dir, name)
+
+    def _load_motion_cache(self, cache_path):
+        if not os.path.isfile(cache_path):
+            return None
+        try:
+            motion = torch.load(cache_path, map_location='cpu')
+        except Exception as e:
+            print(f'Ignoring unreadable motion cache {cache_path}: {e}')
+            return None
+        if motion.get('version', None) != MOTION_CACHE_VERSION:
+            return None
+        print(f'Loaded motion cache {cache_path}')
+        return motion
+
+    def _save_motion_cache(self, cache_path, motion):
+        cache_dir, name = os.path.split(cache_path)
+        prefix, clips_hash, _ = name.rsplit('_', 2)
+        prefix += '_'
+        motion = dict(motion, version=MOTION_CACHE_VERSION)
+        motion['motion_bank'] = {k: v.cpu() for k, v in motion['motion_bank'].items()}
+        try:
+            os.makedirs(cache_dir, exist_ok=True)
+            # write to a temp file first so an interrupted run never leaves a truncated entry behind
+            tmp_path = cache_path + f'.tmp{os.getpid()}'
+            torch.save(motion, tmp_path)
+            os.replace(tmp_path, cache_path)
+            # entries of the same motion directory built from another clip list are stale now,
+            # the ones of other settings on the current clips stay
+            for stale_path in glob.glob(os.path.join(glob.escape(cache_dir), glob.escape(prefix) + '*.pt')):
+                if not os.path.basename(stale_path)[len(prefix):].startswith(clips_hash + '_'):
+                    os.remove(stale_path)
+        except OSError as e:
+            print(f'Could not write motion cache {cache_path}: {e}')
+            return
+        print(f'Saved motion cache {cache_path}')
+
+    def _transfer_motion_bank(self, host_bank):
+        # One host-to-device copy per dtype instead of one per field,
+        # each field becomes a contiguous view into the flat device buffer.
+        # Floating point fields are cast to the storage dtype on the host so only the cast data is copied.
+        host_bank = {k: v.to(self.storage_dtype) if v.is_floating_point() else v for k, v in host_bank.items()}
+        motion_bank = {}
+        for dtype in set(v.dtype for v in host_bank.values()):
+            keys = [k for k, v in host_bank.items() if v.dtype == dtype]
+            flat = torch.cat([host_bank[k].reshape(-1) for k in keys])
+            if torch.device(self.device).type == 'cuda':
+                flat = flat.pin_memory().to(self.device, non_blocking=True)
+            else:
+                flat = flat.to(self.device)
+            for k, field in zip(keys, flat.split([host_bank[k].numel() for k in keys])):
+                motion_bank[k] = field.view(host_bank[k].shape)
+        return motion_bank
+
+    def get_frame_ids(self, motion_ids, frames):
+        return self.motion_offsets[motion_ids] + frames
+
+    def get_motion_state(self, key, motion_ids, frames):
+        return self.motion_bank[key][self.get_frame_ids(motion_ids, frames)].float()
     
     def _sort_key(self, filename):
         match = re.search(r'\d+.pt$', filename)
@@ -68,16 +249,17 @@ class MotionDataHandler:
 
     def _process_sequence(self, seq_path):
         loaded_dict = {}
-        hoi_data = torch.load(seq_path)
+        hoi_data = torch.load(seq_path, map_location='cpu')
         loaded_dict['hoi_data_text'] = os.path.basename(seq_path)[0:3]
-        loaded_dict['hoi_data'] = hoi_data.detach().to(self.device)
+        loaded_dict['hoi_data'] = hoi_data.detach()
         data_frames_scale = self.cfg["env"]["dataFramesScale"]
         fps_data = self.cfg["env"]["dataFPS"] * data_frames_scale
 
-        loaded_dict['root_pos'] = loaded_dict['hoi_data'][:, 0:3].clone()
+        file_layout = self.motion_file_layout
+        loaded_dict['root_pos'] = file_layout.view(loaded_dict['hoi_data'], 'root_pos').clone()
         loaded_dict['root_pos_vel'] = self._compute_velocity(loaded_dict['root_pos'], fps_data)
 
-        loaded_dict['root_rot_3d'] = loaded_dict['hoi_data'][:, 3:6].clone()
+        loaded_dict['root_rot_3d'] = file_layout.view(loaded_dict['hoi_data'], 'root_rot').clone()
         loaded_dict['root_rot'] = torch_utils.exp_map_to_quat(loaded_dict['root_rot_3d']).clone()
         self.smooth_quat_seq(loaded_dict['root_rot'])
 
@@ -89,52 +271,56 @@ class MotionDataHandler:
         exp_map = torch_utils.angle_axis_to_exp_map(angle, axis)
         loaded_dict['root_rot_vel'] = self._compute_velocity(exp_map, fps_data)
 
-        loaded_dict['dof_pos'] = loaded_dict['hoi_data'][:, 9:9+156].clone()
+        loaded_dict['dof_pos'] = file_layout.view(loaded_dict['hoi_data'], 'dof_pos').clone()
         loaded_dict['dof_pos_vel'] = self._compute_velocity(loaded_dict['dof_pos'], fps_data)
 
         data_length = loaded_dict['hoi_data'].shape[0]
-        loaded_dict['body_pos'] = loaded_dict['hoi_data'][:, 165: 165+53*3].clone().view(data_length, 53, 3)
+        loaded_dict['body_pos'] = file_layout.view(loaded_dict['hoi_data'], 'body_pos').clone().view(data_length, -1, 3)
         loaded_dict['key_body_pos'] = loaded_dict['body_pos'][:, self._key_body_ids, :].view(data_length, -1).clone()
         loaded_dict['key_body_pos_vel'] = self._compute_velocity(loaded_dict['key_body_pos'], fps_data)
 
-        loaded_dict['obj_pos'] = loaded_dict['hoi_data'][:, 318+6:321+6].clone()
+        loaded_dict['obj_pos'] = file_layout.view(loaded_dict['hoi_data'], 'obj_pos').clone()
         loaded_dict['obj_pos_vel'] = self._compute_velocity(loaded_dict['obj_pos'], fps_data)
 
-        loaded_dict['obj_rot'] = -loaded_dict['hoi_data'][:, 321+6:324+6].clone()
+        loaded_dict['obj_rot'] = -file_layout.view(loaded_dict['hoi_data'], 'obj_rot').clone()
         loaded_dict['obj_rot_vel'] = self._compute_velocity(loaded_dict['obj_rot'], fps_data)
         if self.init_vel:
             loaded_dict['obj_pos_vel'] = torch.cat((loaded_dict['obj_pos_vel'][:1],loaded_dict['obj_pos_vel']),dim=0)
-        loaded_dict['obj_rot'] = torch_utils.exp_map_to_quat(-loaded_dict['hoi_data'][:, 327:330]).clone()
-
-        loaded_dict['contact'] = torch.round(loaded_dict['hoi_data'][:, 330+6:331+6].clone())
-
-        loaded_dict['hoi_data'] = torch.cat((
-            loaded_dict['root_pos'],
-            loaded_dict['root_rot_3d'],
-            loaded_dict['dof_pos'],
-            loaded_dict['dof_pos_vel'],
-            loaded_dict['obj_pos'],
-            loaded_dict['obj_rot'],
-            loaded_dict['obj_pos_vel'],
-            loaded_dict['key_body_pos'],
-            loaded_dict['contact']
-        ), dim=-1)
+        loaded_dict['obj_rot'] = torch_utils.exp_map_to_quat(-file_layout.view(loaded_dict['hoi_data'], 'obj_rot')).clone()
+
+        loaded_dict['contact'] = torch.round(file_layout.view(loaded_dict['hoi_data'], 'contact').clone())
+
+        # hoi_layout field -> loaded_dict key
+        hoi_fields = {
+            'root_pos': 'root_pos',
+            'root_rot': 'root_rot_3d',
+            'dof_pos': 'dof_pos',
+            'dof_pos_vel': 'dof_pos_vel',
+            'obj_pos': 'obj_pos',
+            'obj_rot': 'obj_rot',
+            'obj_pos_vel': 'obj_pos_vel',
+            'key_pos': 'key_body_pos',
+            'contact': 'contact',
+        }
+        hoi_data = loaded_dict['root_pos'].new_empty((data_length, self.hoi_layout.size))
+        for name in self.hoi_layout.slices:
+            self.hoi_layout.view(hoi_data, name)[:] = loaded_dict[hoi_fields[name]]
+        loaded_dict['hoi_data'] = hoi_data
         
         return loaded_dict
 
     def _compute_velocity(self, positions, fps):
         velocity = (positions[1:, :].clone() - positions[:-1, :].clone()) * fps
-        velocity = torch.cat((torch.zeros((1, positions.shape[-1])).to(self.device), velocity), dim=0)
+        velocity = torch.cat((positions.new_zeros((1, positions.shape[-1])), velocity), dim=0)
         return velocity
 
-    def smooth_quat_seq(self, quat_seq):
-        n = quat_seq.size(0)
-
-        for i in range(1, n):
-            dot_product = torch.dot(quat_seq[i-1], quat_seq[i])
-            if dot_product < 0:
-                quat_seq[i] *=-1
-
+    def smooth_quat_seq(self, quat_seq, seq_starts=None):
+        # Flip quaternions onto the hemisphere of their predecessor, in place and without host syncs.
+        # seq_starts [T] (bool) marks the first frame of each clip when smoothing a packed bank.
+        if seq_starts is None:
+            seq_starts = torch.zeros(quat_seq.shape[:-1], device=quat_seq.device, dtype=torch.bool)
+        signs = torch_utils.quat_seq_hemisphere_signs(quat_seq, seq_starts)
+        quat_seq *= signs.unsqueeze(-1)
         return quat_seq
 
     def _compute_motion_weights(self, motion_class):
@@ -143,22 +329,29 @@ class MotionDataHandler:
         class_weights = 1 / counts
         indexed_classes = np.array([class_to_index[int(cls)] for cls in motion_class], dtype=int)
         self._motion_weights = class_weights[indexed_classes]
+        self.motion_sampler = AliasMotionSampler(self._motion_weights, self.device)
+
+    def _compute_start_frame_range(self):
+        # Inclusive [first, last] start frame of every clip, [2, length - 2] by default.
+        # Callers may overwrite start_frame_range to restrict where episodes start.
+        start = 2
+        end = self.motion_lengths - 2
+        too_short = torch.nonzero(end <= start).flatten().tolist()
+        assert len(too_short) == 0, f"Motions {too_short} are too short to sample time properly (need more than {2*start} frames)"
+        self.start_frame_range = torch.stack((torch.full_like(end, start), end), dim=-1)
+        return
 
     def sample_motions(self, n):
-        motion_ids = torch.multinomial(torch.tensor(self._motion_weights), num_samples=n, replacement=True)
+        motion_ids = self.motion_sampler.sample(n, generator=self.generator)
         return motion_ids
 
     def sample_time(self, motion_ids, truncate_time=None):
-        lengths = self.motion_lengths[motion_ids].cpu().numpy()
-
-        start = 2
-        end = lengths - 2
-
-        assert np.all(end > start) # Maybe some motions are too short to sample time properly.
-
-        motion_times = np.random.randint(start, end + 1)  # +1  Because the upper limit of np.random.randint is an open interval
+        motion_ids = motion_ids.to(self.device)
+        start = self.start_frame_range[motion_ids, 0]
+        end = self.start_frame_range[motion_ids, 1]
 
-        motion_times = torch.tensor(motion_times, device=self.device, dtype=torch.int)
+        offsets = torch.rand(motion_ids.shape, device=self.device, generator=self.generator) * (end - start + 1)
+        motion_times = torch.minimum(start + offsets.long(), end).to(torch.int)
 
         if truncate_time is not None:
             assert truncate_time >= 0
@@ -169,150 +362,81 @@ class MotionDataHandler:
         return motion_times
 
 
-    def get_initial_state(self, env_ids, motion_ids, start_frames):
+    def get_initial_state(self, env_ids, motion_ids, start_frames, return_hoi_data=True):
         """
         Get the initial state for given motion_ids and start_frames.
         
         Parameters:
         motion_ids (Tensor): A tensor containing the motion id for each environment.
         start_frames (Tensor): A tensor containing the starting frame number for each environment.
+        return_hoi_data (bool): If False, the reference window is not gathered and None is returned in its place,
+            use get_ref_obs to read it row by row instead.
         
         Returns:
         Tuple: A tuple containing the initial state
         """
         assert len(motion_ids) == len(env_ids)
+        motion_ids = motion_ids.to(self.device)
+        start_frames = start_frames.to(self.device)
+        num_envs = env_ids.shape[0]
+
         valid_lengths = self.motion_lengths[motion_ids] - start_frames if not self.play_dataset else self.motion_lengths[motion_ids]
-        self.envid2episode_lengths[env_ids] = torch.where(valid_lengths < self.max_episode_length,
-                                    valid_lengths, self.max_episode_length)
-
-        # reward_weights_list = []
-        hoi_data_list = []
-        root_pos_list = []
-        root_rot_list = []
-        root_vel_list = []
-        root_ang_vel_list = []
-        dof_pos_list = []
-        dof_vel_list = []
-        obj_pos_list = []
-        obj_pos_vel_list = []
-        obj_rot_list = []
-        obj_rot_vel_list = []
-
-        for i, env_id in enumerate(env_ids):
-            motion_id = motion_ids[i].item()
-            start_frame = start_frames[i].item()
-
-            self.envid2motid[env_id] = motion_id #V1
-            episode_length = self.envid2episode_lengths[env_id].item()
-
-            if self.hoi_data_dict[motion_id]['hoi_data_text'] == '000':
-                state = self._get_special_case_initial_state(motion_id, start_frame, episode_length)
-            else:
-                state = self._get_general_case_initial_state(motion_id, start_frame, episode_length)
-
-            # reward_weights_list.append(state['reward_weights'])
-            for k in self.reward_weights_default:
-                self.reward_weights[k][env_id] =  torch.tensor(state['reward_weights'][k], dtype=torch.float32, device=self.device)
-            hoi_data_list.append(state["hoi_data"])
-            root_pos_list.append(state['init_root_pos'])
-            root_rot_list.append(state['init_root_rot'])
-            root_vel_list.append(state['init_root_pos_vel'])
-            root_ang_vel_list.append(state['init_root_rot_vel'])
-            dof_pos_list.append(state['init_dof_pos'])
-            dof_vel_list.append(state['init_dof_pos_vel'])
-            obj_pos_list.append(state["init_obj_pos"])
-            obj_pos_vel_list.append(state["init_obj_pos_vel"])
-            obj_rot_list.append(state["init_obj_rot"])
-            obj_rot_vel_list.append(state["init_obj_rot_vel"])
-
-        hoi_data = torch.stack(hoi_data_list, dim=0)
-        root_pos = torch.stack(root_pos_list, dim=0)
-        root_rot = torch.stack(root_rot_list, dim=0)
-        root_vel = torch.stack(root_vel_list, dim=0)
-        root_ang_vel = torch.stack(root_ang_vel_list, dim=0)
-        dof_pos = torch.stack(dof_pos_list, dim=0)
-        dof_vel = torch.stack(dof_vel_list, dim=0)
-        obj_pos = torch.stack(obj_pos_list, dim =0)
-        obj_pos_vel = torch.stack(obj_pos_vel_list, dim =0)
-        obj_rot = torch.stack(obj_rot_list, dim =0)
-        obj_rot_vel = torch.stack(obj_rot_vel_list, dim =0)
+        episode_lengths = torch.where(valid_lengths < self.max_episode_length, valid_lengths, self.max_episode_length)
+        self.envid2episode_lengths[env_ids] = episode_lengths
+        self.envid2motid[env_ids] = motion_ids #V1
+        self.envid2start_frame[env_ids] = start_frames.long()
+
+        # '000' clips start with a random object state and no object/interaction/contact rewards
+        special_case = (self.motion_class[motion_ids] == 0)
+        special_case_expand = special_case.unsqueeze(-1)
+
+        self.reward_weight_table[env_ids] = self.class_reward_weights[self.motion_reward_class[motion_ids]]
+
+        # reference window [start_frame, start_frame + episode_length), zero-padded up to max_episode_length
+        frame_ids = self.get_frame_ids(motion_ids, start_frames)
+        hoi_data = None
+        if return_hoi_data:
+            window_ids = frame_ids.unsqueeze(-1) + self._episode_frame_ids
+            window_mask = self._episode_frame_ids < episode_lengths.unsqueeze(-1)
+            window_ids = torch.where(window_mask, window_ids, frame_ids.unsqueeze(-1))
+            hoi_data = self.motion_bank['hoi_data'][window_ids].float()
+            hoi_data = torch.where(window_mask.unsqueeze(-1), hoi_data, torch.zeros_like(hoi_data))
+
+        root_pos = self.motion_bank['root_pos'][frame_ids].float()
+        root_rot = self.motion_bank['root_rot'][frame_ids].float()
+        root_vel = self.motion_bank['root_pos_vel'][frame_ids].float()
+        root_ang_vel = self.motion_bank['root_rot_vel'][frame_ids].float()
+        dof_pos = self.motion_bank['dof_pos'][frame_ids].float()
+        dof_vel = self.motion_bank['dof_pos_vel'][frame_ids].float()
+
+        obj_pos = torch.where(special_case_expand, torch.rand((num_envs, 3), device=self.device) * 10 - 5,
+                              self.motion_bank['obj_pos'][frame_ids].float())
+        obj_pos_vel = torch.where(special_case_expand, torch.rand((num_envs, 3), device=self.device) * 5,
+                                  self.motion_bank['obj_pos_vel'][frame_ids].float())
+        obj_rot = torch.where(special_case_expand, torch.rand((num_envs, 4), device=self.device),
+                              self.motion_bank['obj_rot'][frame_ids].float())
+        obj_rot_vel = torch.where(special_case_expand, torch.rand((num_envs, 3), device=self.device) * 0.1,
+                                  self.motion_bank['obj_rot_vel'][frame_ids].float())
 
         return hoi_data, \
                 root_pos, root_rot, root_vel, root_ang_vel, dof_pos, dof_vel, \
                 obj_pos, obj_pos_vel, obj_rot, obj_rot_vel
-                
-
-    def _get_special_case_initial_state(self, motion_id, start_frame, episode_length):
-        hoi_data = F.pad(
-            self.hoi_data_dict[motion_id]['hoi_data'][start_frame:start_frame + episode_length],
-            (0, 0, 0, self.max_episode_length - episode_length)
-        )
-
-        return {
-            "reward_weights": self._get_special_case_reward_weights(),
-            "hoi_data": hoi_data,
-            "init_root_pos": self.hoi_data_dict[motion_id]['root_pos'][start_frame, :],
-            "init_root_rot": self.hoi_data_dict[motion_id]['root_rot'][start_frame, :],
-            "init_root_pos_vel": self.hoi_data_dict[motion_id]['root_pos_vel'][start_frame, :],
-            "init_root_rot_vel": self.hoi_data_dict[motion_id]['root_rot_vel'][start_frame, :],
-            "init_dof_pos": self.hoi_data_dict[motion_id]['dof_pos'][start_frame, :],
-            "init_dof_pos_vel": self.hoi_data_dict[motion_id]['dof_pos_vel'][start_frame, :],
-            "init_obj_pos": (torch.rand(3, device=self.device) * 10 - 5),
-            "init_obj_pos_vel": torch.rand(3, device=self.device) * 5,
-            "init_obj_rot": torch.rand(4, device=self.device),
-            "init_obj_rot_vel": torch.rand(4, device=self.device) * 0.1
-        }
-
-    def _get_general_case_initial_state(self, motion_id, start_frame, episode_length):
-        hoi_data = F.pad(
-            self.hoi_data_dict[motion_id]['hoi_data'][start_frame:start_frame + episode_length],
-            (0, 0, 0, self.max_episode_length - episode_length)
-        )
-
-        return {
-            "reward_weights": self._get_general_case_reward_weights(),
-            "hoi_data": hoi_data,
-            "init_root_pos": self.hoi_data_dict[motion_id]['root_pos'][start_frame, :],
-            "init_root_rot": self.hoi_data_dict[motion_id]['root_rot'][start_frame, :],
-            "init_root_pos_vel": self.hoi_data_dict[motion_id]['root_pos_vel'][start_frame, :],
-            "init_root_rot_vel": self.hoi_data_dict[motion_id]['root_rot_vel'][start_frame, :],
-            "init_dof_pos": self.hoi_data_dict[motion_id]['dof_pos'][start_frame, :],
-            "init_dof_pos_vel": self.hoi_data_dict[motion_id]['dof_pos_vel'][start_frame, :],
-            "init_obj_pos": self.hoi_data_dict[motion_id]['obj_pos'][start_frame, :],
-            "init_obj_pos_vel": self.hoi_data_dict[motion_id]['obj_pos_vel'][start_frame, :],
-            "init_obj_rot": self.hoi_data_dict[motion_id]['obj_rot'][start_frame, :],
-            "init_obj_rot_vel": self.hoi_data_dict[motion_id]['obj_rot_vel'][start_frame, :]
-        }
-
-    def _get_special_case_reward_weights(self):
-        reward_weights = self.reward_weights_default
-        return {
-            "p": reward_weights["p"],
-            "r": reward_weights["r"],
-            "op": reward_weights["op"] * 0.,
-            "ig": reward_weights["ig"] * 0.,
-            "cg1": reward_weights["cg1"] * 0.,
-            "cg2": reward_weights["cg2"] * 0.,
-            "pv": reward_weights["pv"],
-            "rv": reward_weights["rv"],
-            "or": reward_weights["or"],
-            "opv": reward_weights["opv"],
-            "orv": reward_weights["orv"],
-        }
-
-    def _get_general_case_reward_weights(self):
-        reward_weights = self.reward_weights_default
-        return {
-            "p": reward_weights["p"],
-            "r": reward_weights["r"],
-            "op": reward_weights["op"],
-            "ig": reward_weights["ig"],
-            "cg1": reward_weights["cg1"],
-            "cg2": reward_weights["cg2"],
-            "pv": reward_weights["pv"],
-            "rv": reward_weights["rv"],
-            "or": reward_weights["or"],
-            "opv": reward_weights["opv"],
-            "orv": reward_weights["orv"],
-        }
 
+    def get_ref_obs(self, env_ids, frames):
+        # Row `frames` of the reference window get_initial_state returns for these envs, gathered
+        # from the motion bank. Rows past the episode length are zero like the padded window.
+        motion_ids = self.envid2motid[env_ids]
+        frame_ids = self.get_frame_ids(motion_ids, self.envid2start_frame[env_ids] + frames)
+        last_frame_ids = self.motion_offsets[motion_ids] + self.motion_lengths[motion_ids] - 1
+        ref_obs = self.motion_bank['hoi_data'][torch.minimum(frame_ids, last_frame_ids)].float()
+        valid = frames < self.envid2episode_lengths[env_ids]
+        return torch.where(valid.unsqueeze(-1), ref_obs, torch.zeros_like(ref_obs))
+
+    def _build_class_reward_weights(self):
+        # Rows are reward weight classes: 0 for regular clips, 1 for '000' clips, which start with a
+        # random object state and so are not rewarded for object, interaction or contact imitation.
+        general = torch.tensor([float(self.reward_weights_default[k]) for k in REWARD_TERMS], device=self.device, dtype=torch.float)
+        special = general.clone()
+        for k in ["op", "ig", "cg1", "cg2"]:
+            special[REWARD_TERMS.index(k)] = 0.
+        return torch.stack((general, special), dim=0)
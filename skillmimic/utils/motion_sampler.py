@@ -0,0 +1,67 @@
+import numpy as np
+import torch
+
+
+class AliasMotionSampler:
+    # Draws motion ids proportional to per-motion weights with Walker's alias method:
+    # one uniform bucket and one biased coin per sample, entirely on the device.
+    #
+    # update_weights changes the weights without rebuilding the table. With q the distribution the table
+    # was built from and t the current one, a table draw i is kept with probability min(1, t_i / q_i),
+    # otherwise it is replaced by a draw from the residual (t - q)+, which has exactly the rejected mass.
+    # The residual is sampled by binary search over its cumulative sum, so updates stay O(num_motions)
+    # on the device and sampling stays exact. rebuild() folds the updates back into the table.
+
+    def __init__(self, weights, device):
+        self.device = device
+        self.weights = torch.as_tensor(np.asarray(weights), device=self.device, dtype=torch.float)
+        self.num_motions = self.weights.shape[0]
+        self.rebuild()
+        return
+
+    def rebuild(self):
+        weights = self.weights.double().cpu().numpy()
+        assert np.all(weights >= 0) and weights.sum() > 0, "Motion weights must be non-negative and not all zero"
+
+        # Vose's construction, O(num_motions) on the host
+        scaled = weights / weights.sum() * self.num_motions
+        prob = np.ones(self.num_motions)
+        alias = np.arange(self.num_motions)
+        small = [i for i in range(self.num_motions) if scaled[i] < 1.]
+        large = [i for i in range(self.num_motions) if scaled[i] >= 1.]
+        while small and large:
+            s = small.pop()
+            l = large.pop()
+            prob[s] = scaled[s]
+            alias[s] = l
+            scaled[l] = scaled[l] + scaled[s] - 1.
+            if scaled[l] < 1.:
+                small.append(l)
+            else:
+                large.append(l)
+
+        self._prob = torch.tensor(prob, device=self.device, dtype=torch.float)
+        self._alias = torch.tensor(alias, device=self.device, dtype=torch.long)
+        self._table_dist = self.weights / self.weights.sum()
+        self._accept = None
+        self._residual_cdf = None
+        return
+
+    def update_weights(self, motion_ids, weights):
+        self.weights[motion_ids] = torch.as_tensor(weights, device=self.device, dtype=torch.float)
+        dist = self.weights / self.weights.sum()
+        self._accept = torch.where(self._table_dist > 0, dist / self._table_dist, torch.ones_like(dist)).clamp(max=1.)
+        self._residual_cdf = torch.cumsum(torch.clamp(dist - self._table_dist, min=0.), dim=0)
+        return
+
+    def sample(self, n, generator=None):
+        buckets = torch.randint(0, self.num_motions, (n,), device=self.device, generator=generator)
+        coins = torch.rand(n, device=self.device, generator=generator)
+        motion_ids = torch.where(coins < self._prob[buckets], buckets, self._alias[buckets])
+        if self._accept is None:
+            return motion_ids
+
+        accepted = torch.rand(n, device=self.device, generator=generator) < self._accept[motion_ids]
+        residual = torch.rand(n, device=self.device, generator=generator) * self._residual_cdf[-1]
+        residual_ids = torch.searchsorted(self._residual_cdf, residual, right=True).clamp(max=self.num_motions - 1)
+        return torch.where(accepted, motion_ids, residual_ids)
@@ -0,0 +1,32 @@
+import torch
+
+
+class ObsHistory:
+    # The last `length` frames of a per-env observation in a ring of preallocated buffers.
+    # advance() moves the head to the oldest frame, which becomes the current one and is overwritten in place,
+    # so keeping the previous frames costs no copy. current, previous and history(k) are views of the ring,
+    # valid until the next advance().
+
+    def __init__(self, num_envs, size, length=2, device='cpu', dtype=torch.float):
+        assert length >= 2, f"ObsHistory needs at least 2 frames, got {length}"
+        self.length = length
+        self.head = 0
+        self._buf = torch.zeros((length, num_envs, size), device=device, dtype=dtype)
+        return
+
+    def advance(self):
+        self.head = (self.head + 1) % self.length
+        return
+
+    def history(self, k):
+        # k frames before the current one
+        assert 0 <= k < self.length, f"history({k}) of an ObsHistory of length {self.length}"
+        return self._buf[(self.head - k) % self.length]
+
+    @property
+    def current(self):
+        return self._buf[self.head]
+
+    @property
+    def previous(self):
+        return self.history(1)
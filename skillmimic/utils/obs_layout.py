@@ -0,0 +1,43 @@
+class ObsLayout:
+    # Column ranges of the observation components inside obs_buf, in the order the policy sees them.
+    # Each component builder writes into view(obs_buf, name) directly, so the observation is assembled
+    # without concatenating per-component temporaries and copying the result into obs_buf.
+
+    def __init__(self):
+        self.slices = {}
+        self.size = 0
+        return
+
+    def add(self, name, size):
+        assert name not in self.slices, f"Observation component {name} added twice"
+        self.slices[name] = slice(self.size, self.size + size)
+        self.size += size
+        return
+
+    def skip(self, size):
+        # columns no consumer reads
+        self.size += size
+        return
+
+    def view(self, buf, name):
+        return buf[:, self.slices[name]]
+
+    def offsets(self):
+        # (start, stop) of every component, for kernels that cannot take slice objects (TorchScript)
+        return {k: (v.start, v.stop) for k, v in self.slices.items()}
+
+    def __contains__(self, name):
+        return name in self.slices
+
+    def __repr__(self):
+        return "ObsLayout(" + ", ".join(f"{k}={v.start}:{v.stop}" for k, v in self.slices.items()) + ")"
+
+
+# columns of compute_obj_observations: local position, tan-norm rotation, velocity and angular velocity of the object
+OBJ_OBS_SIZE = 3 + 6 + 3 + 3
+
+
+def humanoid_obs_size(num_bodies, num_contact_bodies):
+    # columns of compute_humanoid_observations: root height, local position (but the root's), tan-norm rotation,
+    # velocity and angular velocity of every body, then the contact force of every contact body
+    return 1 + num_bodies * (3 + 6 + 3 + 3) - 3 + num_contact_bodies * 3
@@ -0,0 +1,165 @@
+import json
+import math
+import os
+import torch
+
+from projects.SkillMimicLab.skillmimic.utils.metrics_accumulator import MetricsAccumulator
+
+EVAL_STATE_VERSION = 1
+
+
+def build_eval_starts(start_frame_range, stride=1):
+    # every (motion_id, start_frame) pair of the inclusive MotionDataHandler.start_frame_range, stride frames apart
+    motion_ids, start_frames = [], []
+    for motion_id, (first, last) in enumerate(start_frame_range.tolist()):
+        frames = torch.arange(first, last + 1, stride, dtype=torch.long)
+        motion_ids.append(torch.full_like(frames, motion_id))
+        start_frames.append(frames)
+    return torch.cat(motion_ids), torch.cat(start_frames)
+
+
+def eval_state_path(report_path, shard, num_shards):
+    # output/eval/report.json -> output/eval/report.shard0of4.pt
+    return os.path.splitext(report_path)[0] + f'.shard{shard}of{num_shards}.pt'
+
+
+class OfflineEvaluator:
+    # Sweeps the (motion_id, start_frame) pairs of the motion bank through a SkillMimicBallPlay task with
+    # trackMetrics, one episode per env and batch. Batches are always num_envs wide, the last one is padded with
+    # envs that are not scored. policy maps obs to actions and must be deterministic, e.g. the mean action of the
+    # player; each batch reseeds torch with seed + batch index, so a batch replays the same whatever shard runs it.
+    #
+    # Batch b of the sweep belongs to shard b % num_shards. After every batch the finished episodes and the done
+    # batches are written to state_path, a run with an existing state_path resumes after its last done batch.
+    # merge_eval_states combines the state files of all shards into one report.
+
+    def __init__(self, env, policy, state_path, stride=1, shard=0, num_shards=1, seed=0):
+        self.env = env
+        self.task = env.task
+        self.policy = policy
+        self.state_path = state_path
+        self.stride = stride
+        self.shard = shard
+        self.num_shards = num_shards
+        self.seed = seed
+        assert 0 <= shard < num_shards, f"Shard {shard} of {num_shards}"
+        assert self.task._metrics is not None, "Offline evaluation needs the task built with env.trackMetrics"
+
+        motion_data = self.task._motion_data
+        self.motion_ids, self.start_frames = build_eval_starts(motion_data.start_frame_range, stride)
+        motion_lengths = motion_data.motion_lengths.cpu()[self.motion_ids]
+        self.episode_lengths = torch.clamp(motion_lengths - self.start_frames, max=motion_data.max_episode_length)
+
+        self.batch_size = self.task.num_envs
+        self.num_batches = math.ceil(self.motion_ids.shape[0] / self.batch_size)
+        self.batches = list(range(shard, self.num_batches, num_shards))
+        self.done_batches = []
+        return
+
+    def run(self, report_path=None):
+        metrics = self.task._metrics
+        metrics.reset()
+        self._load_state()
+
+        for batch in self.batches:
+            if (batch in self.done_batches):
+                continue
+            self._run_batch(batch)
+            self.done_batches.append(batch)
+            self._save_state()
+            print(f'Evaluated batch {batch} ({len(self.done_batches)}/{len(self.batches)} of shard {self.shard})')
+
+        report = self.report()
+        if (report_path is not None):
+            write_eval_report(report, report_path)
+        return report
+
+    def _run_batch(self, batch):
+        task = self.task
+        pairs = torch.arange(batch * self.batch_size, min((batch + 1) * self.batch_size, self.motion_ids.shape[0]))
+        num_pairs = pairs.shape[0]
+        # padding envs replay the first pair of the batch, keeping the batch shape fixed
+        padded = torch.cat([pairs, pairs[:1].expand(self.batch_size - num_pairs)])
+        motion_ids = self.motion_ids[padded]
+        start_frames = self.start_frames[padded]
+        # an episode of length n is done after n - 1 steps
+        num_steps = int(self.episode_lengths[pairs].max()) - 1
+
+        torch.manual_seed(self.seed + batch)
+        task.set_eval_starts(motion_ids, start_frames)
+        with torch.no_grad():
+            obs = self.env.reset()
+            task._metrics_active[:] = (torch.arange(self.batch_size) < num_pairs).to(task.device)
+            for _ in range(num_steps):
+                obs, _, done, _ = self.env.step(self.policy(obs))
+                # the frame an episode ends on is scored, the ones after it are not
+                task._metrics_active &= (done == 0).to(task.device)
+        task.set_eval_starts(None, None)
+
+        task._metrics.finalize(torch.arange(self.batch_size, device=task.device), motion_ids.to(task.device))
+        task._metrics_active[:] = True
+        return
+
+    def _sweep_key(self):
+        return {"motion_names": self.task._motion_data.motion_names, "stride": self.stride, "num_shards": self.num_shards,
+                "shard": self.shard, "batch_size": self.batch_size}
+
+    def _load_state(self):
+        if not os.path.isfile(self.state_path):
+            return
+        state = torch.load(self.state_path, map_location='cpu')
+        assert state.get('version', None) == EVAL_STATE_VERSION, f"{self.state_path} has an unsupported version"
+        assert state['sweep'] == self._sweep_key(), f"{self.state_path} belongs to a different sweep"
+        self.done_batches = list(state['done_batches'])
+        self.task._metrics.add_state_dict(state['metrics'])
+        print(f'Resuming shard {self.shard} from {self.state_path}, {len(self.done_batches)}/{len(self.batches)} batches done')
+        return
+
+    def _save_state(self):
+        state = {"version": EVAL_STATE_VERSION, "sweep": self._sweep_key(), "num_batches": len(self.batches),
+                 "done_batches": self.done_batches, "metrics": self.task._metrics.state_dict()}
+        state_dir = os.path.dirname(self.state_path)
+        if state_dir:
+            os.makedirs(state_dir, exist_ok=True)
+        # write to a temp file first so an interrupted run never leaves a truncated state behind
+        tmp_path = self.state_path + f'.tmp{os.getpid()}'
+        torch.save(state, tmp_path)
+        os.replace(tmp_path, self.state_path)
+        return
+
+    def report(self):
+        report = self.task._metrics.report()
+        report["sweep"] = {"stride": self.stride, "num_pairs": int(self.motion_ids.shape[0]), "shards": [self.shard],
+                           "num_shards": self.num_shards, "complete": len(self.done_batches) == len(self.batches)}
+        return report
+
+
+def merge_eval_states(state_paths):
+    # one report over the finished episodes of several shards of the same sweep
+    states = [torch.load(path, map_location='cpu') for path in state_paths]
+    first = states[0]['metrics']
+    metrics = MetricsAccumulator(0, first['motion_class'], 'cpu', motion_names=first['motion_names'])
+    shards = []
+    for path, state in zip(state_paths, states):
+        assert state.get('version', None) == EVAL_STATE_VERSION, f"{path} has an unsupported version"
+        sweep = dict(state['sweep'], shard=None)
+        assert sweep == dict(states[0]['sweep'], shard=None), f"{path} belongs to a different sweep"
+        assert state['sweep']['shard'] not in shards, f"Shard {state['sweep']['shard']} given twice"
+        shards.append(state['sweep']['shard'])
+        metrics.add_state_dict(state['metrics'])
+
+    sweep = states[0]['sweep']
+    report = metrics.report()
+    report["sweep"] = {"stride": sweep['stride'], "shards": sorted(shards), "num_shards": sweep['num_shards'],
+                       "complete": len(shards) == sweep['num_shards'] and all(len(s['done_batches']) == s['num_batches'] for s in states)}
+    return report
+
+
+def write_eval_report(report, report_path):
+    report_dir = os.path.dirname(report_path)
+    if report_dir:
+        os.makedirs(report_dir, exist_ok=True)
+    with open(report_path, 'w') as f:
+        json.dump(report, f, indent=2)
+    print(f'Wrote evaluation report {report_path}')
+    return
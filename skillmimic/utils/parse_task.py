@@ -54,7 +54,7 @@ def parse_task(args, cfg, cfg_train):
     import re
     # create native task and pass custom config
     match = re.search(r'cuda:(\d+)', args.device)
-    device_id = match.group(1) 
+    device_id = match.group(1) if match else 0
     #device_id = args.device_id
     rl_device = args.rl_device
 
@@ -91,6 +91,7 @@ def parse_task(args, cfg, cfg_train):
         #env = DirectRLEnvCfg(SkillmimicCfg, render_mode = None, **kwargs)
 
         env = gym.make(args.task, cfg=cfg)
+        task = env.unwrapped
     except NameError as e:
         print(e)
         warn_task_name()
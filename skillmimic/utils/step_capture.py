@@ -0,0 +1,96 @@
+import warnings
+import torch
+
+
+class StepCapture:
+    # Records one segment of the environment step and replays it: a CUDA graph on GPU, a torch.compile graph
+    # with static shapes on CPU. fn takes no arguments and reads and writes tensors of owner in place, so the
+    # buffers the recording refers to stay the buffers the env uses.
+    # A segment that cannot be replayed keeps running eagerly, fallback_reason says why:
+    # - Python control flow on tensor values, e.g. `if self.progress_buf[0] == 799:`, is a device sync on GPU
+    #   and a graph break on CPU
+    # - a tensor attribute of owner rebound instead of written in place, a CUDA graph would keep the old one
+
+    def __init__(self, fn, owner, device, name, warmup=3):
+        self.fn = fn
+        self.owner = owner
+        self.device = torch.device(device)
+        self.name = name
+        self.warmup = warmup
+        self.captured = False
+        self.fallback_reason = None
+        self._num_calls = 0
+        self._graph = None
+        self._compiled_fn = None
+        return
+
+    def __call__(self):
+        self._num_calls += 1
+        if (self.captured):
+            self._replay()
+        elif (self.fallback_reason is not None or self._num_calls < self.warmup):
+            self.fn()
+        elif (self.device.type == 'cuda'):
+            self._capture_cuda()
+        else:
+            self._capture_cpu()
+        return
+
+    def _replay(self):
+        if (self._graph is not None):
+            self._graph.replay()
+        else:
+            self._compiled_fn()
+        return
+
+    def _fallback(self, reason):
+        self.fallback_reason = reason
+        print(f"StepCapture {self.name}: running eagerly, {reason}")
+        return
+
+    def _tensor_attrs(self):
+        return {k: v for k, v in vars(self.owner).items() if isinstance(v, torch.Tensor)}
+
+    def _capture_cuda(self):
+        # the last warmup step is this call's step, it runs on a side stream as the capture will and reports every sync
+        tensors = self._tensor_attrs()
+        stream = torch.cuda.Stream(self.device)
+        stream.wait_stream(torch.cuda.current_stream(self.device))
+        sync_debug_mode = torch.cuda.get_sync_debug_mode()
+        with warnings.catch_warnings(record=True) as caught, torch.cuda.stream(stream):
+            warnings.simplefilter("always")
+            torch.cuda.set_sync_debug_mode("warn")
+            try:
+                self.fn()
+            finally:
+                torch.cuda.set_sync_debug_mode(sync_debug_mode)
+        torch.cuda.current_stream(self.device).wait_stream(stream)
+
+        syncs = [str(w.message) for w in caught if "synchroniz" in str(w.message)]
+        if (len(syncs) > 0):
+            self._fallback(f"{len(syncs)} device sync(s), e.g. {syncs[0]}")
+            return
+        rebound = [k for k, v in self._tensor_attrs().items() if k in tensors and tensors[k] is not v]
+        if (len(rebound) > 0):
+            self._fallback(f"rebinds {', '.join(rebound)}")
+            return
+
+        # recording does not run the kernels, the step is not applied twice
+        self._graph = torch.cuda.CUDAGraph()
+        with torch.cuda.graph(self._graph):
+            self.fn()
+        self.captured = True
+        return
+
+    def _capture_cpu(self):
+        # fullgraph turns every graph break into an error raised while tracing, before anything ran
+        compiled_fn = torch.compile(self.fn, fullgraph=True, dynamic=False)
+        try:
+            compiled_fn()
+        except Exception as e:
+            self._fallback(f"{type(e).__name__}: {str(e).splitlines()[0]}")
+            self.fn()
+            return
+        self._compiled_fn = compiled_fn
+        self.captured = True
+        return
@@ -0,0 +1,116 @@
+import collections
+import contextlib
+import time
+import numpy as np
+import torch
+
+from projects.SkillMimicLab.skillmimic.utils import logger
+
+
+class StepProfiler:
+    # Wall time of the phases of the env step, e.g.
+    #   with self._profiler.phase("reward"):
+    #       self._compute_reward(self.actions)
+    # On CUDA a phase is bracketed by two events on the current stream. The events are read back only once they
+    # have completed (Event.query()), in step_done(), so timing adds no synchronization to the step. On CPU the
+    # phase is timed with perf_counter_ns. Each phase keeps its last `window` durations, summary() turns them into
+    # percentiles on request.
+    #
+    # With trace_path set, every phase is also a torch.profiler.record_function range and the first trace_steps
+    # steps are recorded by torch.profiler and exported as a Chrome trace to trace_path.
+
+    def __init__(self, device, window=1000, percentiles=(50, 90, 99), trace_path=None, trace_steps=100):
+        self.cuda = torch.device(device).type == 'cuda'
+        self.window = window
+        self.percentiles = percentiles
+        self.durations = collections.defaultdict(lambda: collections.deque(maxlen=self.window))
+        self.num_steps = 0
+        self._pending = collections.deque() # (name, start event, end event) not read back yet
+        self._free_events = []
+
+        self.trace_path = trace_path
+        self.trace_steps = trace_steps
+        self._trace = None
+        if (self.trace_path is not None):
+            activities = [torch.profiler.ProfilerActivity.CPU]
+            if self.cuda:
+                activities.append(torch.profiler.ProfilerActivity.CUDA)
+            self._trace = torch.profiler.profile(activities=activities)
+            self._trace.__enter__()
+        return
+
+    @contextlib.contextmanager
+    def phase(self, name):
+        record = torch.profiler.record_function(name) if self._trace is not None else contextlib.nullcontext()
+        with record:
+            if self.cuda:
+                start, end = self._event(), self._event()
+                start.record()
+                yield
+                end.record()
+                self._pending.append((name, start, end))
+            else:
+                start = time.perf_counter_ns()
+                yield
+                self.durations[name].append((time.perf_counter_ns() - start) * 1e-6)
+        return
+
+    def _event(self):
+        if self._free_events:
+            return self._free_events.pop()
+        return torch.cuda.Event(enable_timing=True)
+
+    def step_done(self):
+        # reads back the phases the device has finished, in order, and closes the trace after trace_steps steps
+        while self._pending and self._pending[0][2].query():
+            name, start, end = self._pending.popleft()
+            self.durations[name].append(start.elapsed_time(end))
+            self._free_events += [start, end]
+
+        self.num_steps += 1
+        if (self._trace is not None and self.num_steps >= self.trace_steps):
+            self._trace.__exit__(None, None, None)
+            self._trace.export_chrome_trace(self.trace_path)
+            logger.info(f'Step profiler trace of {self.num_steps} steps written to {self.trace_path}')
+            self._trace = None
+        return
+
+    def summary(self):
+        # {phase: {"mean_ms", "p50_ms", ..., "count"}} over the last `window` durations of every phase
+        summary = {}
+        for name, durations in self.durations.items():
+            if len(durations) == 0:
+                continue
+            values = np.fromiter(durations, dtype=np.float64)
+            entry = {"mean_ms": float(values.mean())}
+            for p, v in zip(self.percentiles, np.percentile(values, self.percentiles)):
+                entry[f"p{p}_ms"] = float(v)
+            entry["count"] = len(values)
+            summary[name] = entry
+        return summary
+
+    def log_summary(self):
+        for name, entry in self.summary().items():
+            logger.info(f'{name:>20}: ' + ', '.join(f'{k} {v:.3f}' if k != "count" else f'{k} {v}' for k, v in entry.items()))
+        return
+
+
+class NullProfiler:
+    # stands in for StepProfiler when profiling is off, phase() is a shared no-op context
+
+    _phase = contextlib.nullcontext()
+
+    def phase(self, name):
+        return self._phase
+
+    def step_done(self):
+        return
+
+    def summary(self):
+        return {}
+
+    def log_summary(self):
+        return
+
+
+NULL_PROFILER = NullProfiler()
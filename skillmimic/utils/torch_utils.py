@@ -33,6 +33,10 @@ import numpy as np
 
 ###################################
 
+def to_torch(x, dtype=torch.float, device='cuda:0', requires_grad=False):
+    # isaacgym.torch_utils.to_torch, without the isaacgym import
+    return torch.tensor(x, dtype=dtype, device=device, requires_grad=requires_grad)
+
 @torch.jit.script
 def normalize_angle(x):
     return torch.atan2(torch.sin(x), torch.cos(x))
@@ -49,6 +53,55 @@ def quat_rotate(q, v):
             shape[0], 3, 1)).squeeze(-1) * 2.0
     return a + b + c
 
+@torch.jit.script
+def quat_rotate_broadcast(q, v):
+    # type: (Tensor, Tensor) -> Tensor
+    # quat_rotate of every vector in v [..., B, 3] by q [..., 1, 4], the leading dimensions broadcast.
+    # same arithmetic as quat_rotate, without repeating q for every vector
+    q_w = q[..., -1:]
+    q_vec = q[..., :3]
+    a = v * (2.0 * q_w ** 2 - 1.0)
+    b = torch.cross(q_vec.expand(v.shape), v, dim=-1) * q_w * 2.0
+    c = q_vec * torch.matmul(v, q_vec.transpose(-1, -2)) * 2.0
+    return a + b + c
+
+@torch.jit.script
+def quat_mul_broadcast(a, b):
+    # type: (Tensor, Tensor) -> Tensor
+    # quaternion product a * b, the leading dimensions broadcast, e.g. a [N, 1, 4] and b [N, B, 4]
+    x1, y1, z1, w1 = a[..., 0], a[..., 1], a[..., 2], a[..., 3]
+    x2, y2, z2, w2 = b[..., 0], b[..., 1], b[..., 2], b[..., 3]
+    ww = (z1 + x1) * (x2 + y2)
+    yy = (w1 - y1) * (w2 + z2)
+    zz = (w1 + y1) * (w2 - z2)
+    xx = ww + yy + zz
+    qq = 0.5 * (xx + (z1 - x1) * (x2 - y2))
+    w = qq - ww + (z1 - y1) * (y2 - z2)
+    x = qq - xx + (x1 + w1) * (x2 + w2)
+    y = qq - yy + (w1 - x1) * (y2 + z2)
+    z = qq - zz + (z1 + y1) * (w2 - x2)
+
+    quat = torch.stack([x, y, z, w], dim=-1)
+    return quat
+
+@torch.jit.script
+def to_local_heading_frame(heading_rot_inv, root_pos, body_pos, body_vel, body_ang_vel):
+    # type: (Tensor, Tensor, Tensor, Tensor, Tensor) -> Tuple[Tensor, Tensor, Tensor]
+    # body positions relative to the root, velocities and angular velocities [N, B, 3] in the heading frame.
+    # quat_rotate_broadcast of the three, the heading terms are computed once for all of them.
+    # heading_rot_inv [N, 4], see calc_heading_frame
+    q_w = heading_rot_inv[:, -1:].unsqueeze(-2)
+    q_vec = heading_rot_inv[:, :3].unsqueeze(-2)
+    q_vec_t = q_vec.transpose(-1, -2)
+    scale = 2.0 * q_w ** 2 - 1.0
+
+    local_vecs = []
+    for v in [body_pos - root_pos.unsqueeze(-2), body_vel, body_ang_vel]:
+        a = v * scale
+        b = torch.cross(q_vec.expand(v.shape), v, dim=-1) * q_w * 2.0
+        c = q_vec * torch.matmul(v, q_vec_t) * 2.0
+        local_vecs.append(a + b + c)
+    return local_vecs[0], local_vecs[1], local_vecs[2]
 
 @torch.jit.script
 def quat_from_euler_xyz(roll, pitch, yaw):
@@ -216,6 +269,26 @@ def slerp(q0, q1, t):
 
     return new_q
 
+@torch.jit.script
+def quat_seq_hemisphere_signs(q, reset):
+    # type: (Tensor, Tensor) -> Tensor
+    # Sign per frame that keeps consecutive quaternions of q [..., T, 4] in the same hemisphere,
+    # i.e. the result of flipping q[i] whenever dot(flipped q[i-1], q[i]) < 0, frame by frame.
+    # Flipping q[i-1] flips the sign of the dot, so the signs are a cumulative product of the
+    # pairwise dot signs. The chain restarts at frames where reset [..., T] is set (sequence starts
+    # in a packed bank) and where the dot is exactly zero (the loop keeps those frames unflipped).
+    dot = torch.sum(q[..., :-1, :] * q[..., 1:, :], dim=-1)
+    restart = torch.cat((torch.ones_like(reset[..., :1]), dot == 0), dim=-1) | reset
+    flips = torch.cat((torch.ones_like(q[..., :1, 0]), torch.where(dot < 0, -torch.ones_like(dot), torch.ones_like(dot))), dim=-1)
+    flips = torch.where(restart, torch.ones_like(flips), flips)
+    signs = torch.cumprod(flips, dim=-1)
+
+    # divide out the product up to the latest restart, the factors are +-1 so multiplying is exact
+    frame_ids = torch.arange(q.shape[-2], device=q.device).expand(restart.shape)
+    last_restart = torch.cummax(torch.where(restart, frame_ids, torch.zeros_like(frame_ids)), dim=-1)[0]
+    signs = signs * torch.gather(signs, -1, last_restart)
+    return signs
+
 @torch.jit.script
 def calc_heading(q):
     # type: (Tensor) -> Tensor
@@ -255,6 +328,24 @@ def calc_heading_quat_inv(q):
     heading_q = quat_from_angle_axis(-heading, axis)
     return heading_q
 
+@torch.jit.script
+def calc_heading_frame(q):
+    # type: (Tensor) -> Tuple[Tensor, Tensor, Tensor]
+    # heading rotation, its inverse and the facing direction on the xy plane from one heading evaluation,
+    # matches calc_heading_quat / calc_heading_quat_inv
+    # q must be normalized
+    heading = calc_heading(q)
+    axis = torch.zeros_like(q[..., 0:3])
+    axis[..., 2] = 1
+
+    heading_q = quat_from_angle_axis(heading, axis)
+    heading_q_inv = quat_from_angle_axis(-heading, axis)
+
+    facing_dir = torch.zeros_like(axis)
+    facing_dir[..., 0] = 1
+    facing_dir = quat_rotate(heading_q, facing_dir)
+    return heading_q, heading_q_inv, facing_dir
+
 @torch.jit.script
 def quat_conjugate(q):
     # type: (Tensor) -> Tensor